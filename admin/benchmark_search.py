@@ -0,0 +1,321 @@
+# admin/benchmark_search.py
+
+from datetime import datetime
+import numpy as np
+import argparse, asyncio, platform, resource, shutil, subprocess, tempfile, tracemalloc, json, time, sys, os
+
+# Add the parent directory to sys.path to enable imports from adjacent modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+
+
+BACKENDS = ["sqlite", "memory", "cascade", "binary", "int8", "ivf", "hnsw", "pq", "hierarchical"]
+CORPUS_CHUNK_ROWS = 10000
+CORPUS_SEED = 1234
+
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark every search backend behind db_get_vector_list on synthetic corpora: "
+                                                 "latency percentiles, QPS, memory and recall@k against exact ground truth")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=[10000],
+                        help="Corpus sizes in vectors, one run each (default: 10000; 5M float32 vectors need ~30 GB "
+                             "of RAM for the in-memory backends and the ivf/pq builds)")
+    parser.add_argument("-b", "--backends", type=str, nargs="+", default=BACKENDS, choices=BACKENDS,
+                        help="Backends to measure (default: all; the pure-Python hnsw build is slow past ~100k vectors)")
+    parser.add_argument("-q", "--queries", type=int, default=200,
+                        help="Timed queries per backend (default: 200)")
+    parser.add_argument("-k", "--k", type=int, default=10,
+                        help="Results per query, recall is measured at this k (default: 10)")
+    parser.add_argument("-p", "--pages_per_document", type=int, default=1,
+                        help="Pages grouped into each synthetic document (default: 1, like the extracted samples)")
+    parser.add_argument("-o", "--output", type=str, default="benchmark_results.json",
+                        help="JSON report (default: benchmark_results.json)")
+    parser.add_argument("--workdir", type=str, default=None,
+                        help="Where the synthetic databases and indexes are built (default: a temporary directory, deleted afterwards)")
+    # Internal: each corpus is prepared, and each backend measured, in a fresh process
+    parser.add_argument("--prepare", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--measure", type=str, default=None, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+
+def use_workdir(workdir: str, backend: str = None) -> None:
+    """Point every database and index path at the work directory. Must run before any database module
+    is imported, since they read these settings at import time."""
+    config.LOCAL_DB_PATH = os.path.join(workdir, "benchmark.db")
+    config.IVF_INDEX_PATH = os.path.join(workdir, "benchmark.ivf.npz")
+    config.HNSW_INDEX_PATH = os.path.join(workdir, "benchmark.hnsw.npz")
+    config.PQ_INDEX_PATH = os.path.join(workdir, "benchmark.pq.npz")
+    config.VECTOR_SNAPSHOT_PATH = os.path.join(workdir, "benchmark.snapshot.json")
+    config.USE_VECTOR_SNAPSHOT = False
+    if backend:
+        config.SEARCH_BACKEND = backend
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process right now (Linux), 0 where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except OSError:
+        return 0.0
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+
+def random_unit_rows(rng: np.random.Generator, centers: np.ndarray, rows: int, spread: float = 1.0, group: int = 1) -> np.ndarray:
+    """Rows drawn around random cluster centers, normalized: clustered like real embeddings, unlike uniform noise.
+    Each run of `group` rows shares its center, as the pages of a document share its topic."""
+    dim = centers.shape[1]
+    matrix = np.repeat(centers[rng.integers(len(centers), size=-(-rows // group))], group, axis=0)[:rows]
+    matrix += rng.standard_normal((rows, dim), dtype=np.float32) * np.float32(spread / np.sqrt(dim))
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix
+
+
+def cluster_centers(size: int, dim: int) -> np.ndarray:
+    rng = np.random.default_rng(CORPUS_SEED)
+    centers = rng.standard_normal((max(16, size // 1000), dim), dtype=np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    return centers
+
+
+def corpus_chunks(size: int, dim: int, chunk_rows: int, pages_per_document: int = 1):
+    """Yield (first row, matrix) over a reproducible corpus without ever holding all of it. Chunks hold
+    whole documents, whose pages are drawn around one center."""
+    centers = cluster_centers(size, dim)
+    for start in range(0, size, chunk_rows):
+        rng = np.random.default_rng((CORPUS_SEED, 0, start))
+        yield start, random_unit_rows(rng, centers, min(chunk_rows, size - start), group=pages_per_document)
+
+
+def page_id_of(row: int) -> str:
+    return f"page{row:09d}"
+
+
+def update_top_k(best_scores: np.ndarray, best_rows: np.ndarray, queries: np.ndarray, chunk: np.ndarray, start: int, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Merge one chunk's exact scores into the running top-k of every query"""
+    scores = np.concatenate([best_scores, queries @ chunk.T], axis=1)
+    rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, start + len(chunk)), (len(queries), len(chunk)))], axis=1)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k] if scores.shape[1] > k else np.argsort(-scores, axis=1)
+    return np.take_along_axis(scores, top, axis=1), np.take_along_axis(rows, top, axis=1)
+
+
+
+async def prepare(args, size: int) -> None:
+    """Build the synthetic corpus in the work directory: databases, ground truth and the offline indexes
+    the requested backends need"""
+    use_workdir(args.workdir)
+    from admin.create_db import create_database
+    from database.bulk_load import BulkLoader
+    from database.vector_index import db_load_vectors, db_get_vector_log_marks
+    from database.index_ivf import build_ivf_index
+    from database.index_pq import build_pq_index
+    from database.index_hnsw import HNSWIndex
+    from database.shards import all_db_paths
+    from database.connection_pool import connection_pool
+
+    build_seconds = {}
+    start = time.time()
+    # Every shard of the (patched) LOCAL_DB_PATH
+    for db_path in all_db_paths():
+        create_database(db_path)
+
+    dim = config.EMBEDDING_DIM
+    queries = random_unit_rows(np.random.default_rng((CORPUS_SEED, 1)), cluster_centers(size, dim), args.queries)
+    best_scores = np.full((args.queries, 0), -np.inf, dtype=np.float32)
+    best_rows = np.zeros((args.queries, 0), dtype=np.int64)
+
+    pages = args.pages_per_document
+    with BulkLoader() as loader:
+        # Whole documents per chunk, so none is split between two chunks
+        for chunk_start, chunk in corpus_chunks(size, dim, max(pages, CORPUS_CHUNK_ROWS // pages * pages), pages):
+            best_scores, best_rows = update_top_k(best_scores, best_rows, queries, chunk, chunk_start, args.k)
+            for first in range(0, len(chunk), pages):
+                row = chunk_start + first
+                vectors = chunk[first:first + pages]
+                loader.add_document(
+                    title=f"Synthetic document {row // pages}",
+                    page_texts=[""] * len(vectors),
+                    vectors=vectors,
+                    page_ids=[page_id_of(row + i) for i in range(len(vectors))],
+                    document_id=f"doc{row // pages:09d}"
+                )
+        report = loader.finish()
+    problems = [problem for db_problems in report.values() for problem in db_problems]
+    if problems:
+        raise ValueError(f"Benchmark corpus is inconsistent: {problems}")
+    build_seconds["load"] = time.time() - start
+
+    order = np.argsort(-best_scores, axis=1)
+    np.save(os.path.join(args.workdir, "queries.npy"), queries)
+    np.save(os.path.join(args.workdir, "truth.npy"), np.take_along_axis(best_rows, order, axis=1))
+
+    if "ivf" in args.backends or "pq" in args.backends:
+        log_marks = await db_get_vector_log_marks()
+        page_ids, matrix = await db_load_vectors()
+        if "ivf" in args.backends:
+            start = time.time()
+            build_ivf_index(page_ids, matrix, log_marks, path=config.IVF_INDEX_PATH)
+            build_seconds["ivf"] = time.time() - start
+        if "pq" in args.backends:
+            start = time.time()
+            build_pq_index(page_ids, matrix, log_marks, path=config.PQ_INDEX_PATH)
+            build_seconds["pq"] = time.time() - start
+        del page_ids, matrix
+
+    if "hnsw" in args.backends:
+        start = time.time()
+        index = HNSWIndex(config.HNSW_INDEX_PATH)
+        await index.ensure_loaded()
+        await index.save()
+        build_seconds["hnsw"] = time.time() - start
+
+    await connection_pool.close()
+    with open(os.path.join(args.workdir, "build.json"), "w") as f:
+        json.dump({name: round(seconds, 3) for name, seconds in build_seconds.items()}, f)
+
+
+
+async def measure(args, backend: str) -> None:
+    """Time one backend over the prepared queries, in a process of its own so its load time and memory
+    are not shared with the backends measured before it"""
+    use_workdir(args.workdir, backend)
+    from database.getters_search import db_get_vector_list
+    from database.connection_pool import connection_pool
+
+    queries = np.load(os.path.join(args.workdir, "queries.npy"))
+    truth = np.load(os.path.join(args.workdir, "truth.npy"))
+    # A query outside the timed set, so the result cache cannot answer any timed query
+    warm_up = random_unit_rows(np.random.default_rng((CORPUS_SEED, 2)), queries, 1)[0]
+
+    rss_before = current_rss_mb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    await db_get_vector_list(warm_up, args.k)
+    load_seconds = time.perf_counter() - start
+    traced_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_loaded = current_rss_mb()
+
+    latencies, recalls = [], []
+    start = time.perf_counter()
+    for query, expected_rows in zip(queries, truth):
+        query_start = time.perf_counter()
+        results = await db_get_vector_list(query, args.k)
+        latencies.append(time.perf_counter() - query_start)
+        expected = {page_id_of(row) for row in expected_rows[:args.k]}
+        recalls.append(len(expected.intersection(result['page_id'] for result in results)) / len(expected))
+    total_seconds = time.perf_counter() - start
+    await connection_pool.close()
+
+    latencies_ms = np.array(latencies) * 1000
+    result = {
+        "backend": backend,
+        "load_seconds": round(load_seconds, 4),
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies_ms, 50)), 3),
+            "p95": round(float(np.percentile(latencies_ms, 95)), 3),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 3),
+            "mean": round(float(latencies_ms.mean()), 3),
+            "max": round(float(latencies_ms.max()), 3)
+        },
+        "qps": round(len(queries) / total_seconds, 2),
+        f"recall_at_{args.k}": round(float(np.mean(recalls)), 4),
+        "memory_mb": {
+            "index_allocated": round(traced_bytes / 1024 ** 2, 2),  # Python/NumPy allocations made while loading
+            "rss_loaded": round(rss_loaded - rss_before, 2),  # also counts SQLite caches and mapped pages touched
+            "rss_peak": round(peak_rss_mb(), 2)
+        }
+    }
+    with open(os.path.join(args.workdir, f"result.{backend}.json"), "w") as f:
+        json.dump(result, f)
+
+
+
+def run_child(args, *options) -> None:
+    """Run this script again with the same settings, plus `options`"""
+    command = [
+        sys.executable, os.path.abspath(__file__), "--workdir", args.workdir,
+        "--queries", str(args.queries), "--k", str(args.k), "--pages_per_document", str(args.pages_per_document),
+        "--backends", *args.backends, *options
+    ]
+    subprocess.run(command, check=True)
+
+
+def benchmark_size(args, size: int) -> dict:
+    for name in os.listdir(args.workdir):
+        os.remove(os.path.join(args.workdir, name))
+
+    print(f"[{datetime.now()}] Preparing a corpus of {size} vectors in {args.workdir}")
+    run_child(args, "--prepare", str(size))
+    with open(os.path.join(args.workdir, "build.json")) as f:
+        build_seconds = json.load(f)
+
+    results = []
+    for backend in args.backends:
+        print(f"[{datetime.now()}] Measuring {backend} on {size} vectors")
+        try:
+            run_child(args, "--measure", backend)
+        except subprocess.CalledProcessError as e:
+            results.append({"backend": backend, "error": f"measurement exited with status {e.returncode}"})
+            continue
+        with open(os.path.join(args.workdir, f"result.{backend}.json")) as f:
+            results.append(json.load(f))
+        result = results[-1]
+        print(f"{backend:>12}: p50 {result['latency_ms']['p50']:.2f} ms, p99 {result['latency_ms']['p99']:.2f} ms, "
+              f"{result['qps']:.1f} QPS, recall@{args.k} {result[f'recall_at_{args.k}']:.3f}")
+
+    return {"size": size, "build_seconds": build_seconds, "backends": results}
+
+
+
+def main():
+    args = parse_arguments()
+    if args.prepare is not None:
+        asyncio.run(prepare(args, args.prepare))
+        return
+    if args.measure is not None:
+        asyncio.run(measure(args, args.measure))
+        return
+
+    keep_workdir = args.workdir is not None
+    args.workdir = args.workdir or tempfile.mkdtemp(prefix="benchmark_search_")
+    os.makedirs(args.workdir, exist_ok=True)
+    try:
+        runs = [benchmark_size(args, size) for size in args.sizes]
+    finally:
+        if not keep_workdir:
+            shutil.rmtree(args.workdir, ignore_errors=True)
+
+    report = {
+        "created": datetime.now().isoformat(),
+        "machine": {"platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count(), "python": platform.python_version(), "numpy": np.__version__},
+        "settings": {
+            "dim": config.EMBEDDING_DIM, "k": args.k, "queries": args.queries, "pages_per_document": args.pages_per_document,
+            "shard_count": config.SHARD_COUNT, "vector_storage": config.VECTOR_STORAGE,
+            "cascade_prefix_dim": config.CASCADE_PREFIX_DIM, "cascade_candidates": config.CASCADE_CANDIDATES,
+            "binary_candidates": config.BINARY_CANDIDATES, "ivf_nprobe": config.IVF_NPROBE,
+            "hnsw_m": config.HNSW_M, "hnsw_ef_search": config.HNSW_EF_SEARCH,
+            "pq_subvectors": config.PQ_SUBVECTORS, "pq_rerank_candidates": config.PQ_RERANK_CANDIDATES,
+            "hierarchical_documents": config.HIERARCHICAL_DOCUMENTS
+        },
+        "runs": runs
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved the benchmark report to {args.output}")
+
+
+
+if __name__ == "__main__":
+    main()
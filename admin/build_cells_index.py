@@ -0,0 +1,55 @@
+# admin/build_cells_index.py
+
+import sqlite3, argparse, sys, os
+
+# Add the parent directory to sys.path to enable imports from adjacent modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.schema import TABLE_CELLS_SQL
+from database.table_cells import parse_table_cells
+from database.shards import all_db_paths
+
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Create (if needed) and rebuild the numeric table cells index from latex_code")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Database to index (default: every shard)")
+    return parser.parse_args()
+
+
+
+def index_database(db_path: str) -> None:
+    conn = sqlite3.connect(db_path)
+    for statement in TABLE_CELLS_SQL:
+        conn.execute(statement)
+    conn.execute("DELETE FROM table_cells")
+
+    pages, cells = 0, 0
+    for page_id, latex_code in conn.execute("SELECT page_id, latex_code FROM page_images WHERE latex_code IS NOT NULL").fetchall():
+        rows = [(page_id, cell['table_index'], cell['row'], cell['col'], cell['raw_value'], cell['value'])
+                for cell in parse_table_cells(latex_code)]
+        conn.executemany(
+            "INSERT INTO table_cells (page_id, table_index, row, col, raw_value, value) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        pages += 1
+        cells += len(rows)
+    conn.commit()
+
+    print(f"Indexed {cells} numeric cells from {pages} pages in {db_path}")
+    conn.close()
+
+
+
+def main():
+    args = parse_arguments()
+
+    for db_path in ([args.db] if args.db else all_db_paths()):
+        index_database(db_path)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# admin/build_document_vectors.py
+
+import aiosqlite, sqlite_vec, argparse, asyncio, sys, os
+
+# Add the parent directory to sys.path to enable imports from adjacent modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.schema import DOCUMENTS_VECTORS_SQL, PAGE_FINGERPRINTS_SQL
+from database.setters_vectors import db_store_document_vector
+from database.shards import all_db_paths
+
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Create (if needed) and recompute the mean-pooled vector of every document")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Database to update (default: every shard)")
+    return parser.parse_args()
+
+
+
+async def update_database(db_path: str) -> None:
+    async with aiosqlite.connect(db_path) as conn:
+        await conn._execute(conn._conn.enable_load_extension, True)
+        await conn._execute(sqlite_vec.load, conn._conn)
+
+        # Older databases predate these tables
+        for statement in DOCUMENTS_VECTORS_SQL + PAGE_FINGERPRINTS_SQL:
+            await conn.execute(statement)
+
+        async with conn.execute("SELECT document_id FROM documents") as cursor:
+            document_ids = [row[0] for row in await cursor.fetchall()]
+
+        stored = 0
+        for document_id in document_ids:
+            stored += await db_store_document_vector(conn, document_id)
+        await conn.commit()
+
+    print(f"Stored {stored} document vectors in {db_path} ({len(document_ids) - stored} documents have no page vectors yet)")
+
+
+
+async def main():
+    args = parse_arguments()
+
+    for db_path in ([args.db] if args.db else all_db_paths()):
+        await update_database(db_path)
+
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
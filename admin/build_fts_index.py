@@ -0,0 +1,44 @@
+# admin/build_fts_index.py
+
+import sqlite3, argparse, sys, os
+
+# Add the parent directory to sys.path to enable imports from adjacent modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.schema import PAGE_IMAGES_FTS_SQL, REBUILD_FTS_SQL
+from database.shards import all_db_paths
+
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Create (if needed) and rebuild the full-text index over page_images")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Database to index (default: every shard)")
+    return parser.parse_args()
+
+
+
+def index_database(db_path: str) -> None:
+    conn = sqlite3.connect(db_path)
+    for statement in PAGE_IMAGES_FTS_SQL:
+        conn.execute(statement)
+    conn.execute(REBUILD_FTS_SQL)
+    conn.commit()
+
+    indexed, = conn.execute("SELECT COUNT(*) FROM page_images").fetchone()
+    print(f"Full-text index rebuilt over {indexed} pages in {db_path}")
+    conn.close()
+
+
+
+def main():
+    args = parse_arguments()
+
+    for db_path in ([args.db] if args.db else all_db_paths()):
+        index_database(db_path)
+
+
+
+if __name__ == "__main__":
+    main()
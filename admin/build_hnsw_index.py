@@ -0,0 +1,42 @@
+# admin/build_hnsw_index.py
+
+import argparse, asyncio, sys, os
+
+# Add the parent directory to sys.path to enable imports from adjacent modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import HNSW_INDEX_PATH, HNSW_M, HNSW_EF_CONSTRUCTION
+from database.index_hnsw import HNSWIndex
+
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Build or update the HNSW index from page_images_vectors")
+    parser.add_argument("-m", "--m", type=int, default=HNSW_M,
+                        help=f"Links per node on the upper layers (default: {HNSW_M})")
+    parser.add_argument("-e", "--ef_construction", type=int, default=HNSW_EF_CONSTRUCTION,
+                        help=f"Beam width while inserting (default: {HNSW_EF_CONSTRUCTION})")
+    parser.add_argument("-o", "--output", type=str, default=HNSW_INDEX_PATH,
+                        help=f"Index file (default: {HNSW_INDEX_PATH})")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Ignore the existing index file and insert every page again")
+    return parser.parse_args()
+
+
+
+async def main():
+    args = parse_arguments()
+
+    if args.rebuild and os.path.exists(args.output):
+        os.remove(args.output)
+
+    # Loading inserts every page that is not in the file yet, then saves
+    index = HNSWIndex(args.output, args.m, args.ef_construction)
+    await index.ensure_loaded()
+    await index.save()
+
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,44 @@
+# admin/build_ivf_index.py
+
+import argparse, asyncio, sys, os
+
+# Add the parent directory to sys.path to enable imports from adjacent modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import IVF_INDEX_PATH
+from database.vector_index import db_load_vectors, db_get_vector_log_marks
+from database.index_ivf import build_ivf_index
+
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Build the IVF index from page_images_vectors")
+    parser.add_argument("-l", "--lists", type=int, default=None,
+                        help="Number of inverted lists (default: 4 * sqrt(number of pages))")
+    parser.add_argument("-i", "--iterations", type=int, default=100,
+                        help="Mini-batch k-means iterations (default: 100)")
+    parser.add_argument("-b", "--batch_size", type=int, default=4096,
+                        help="Mini-batch size for k-means (default: 4096)")
+    parser.add_argument("-o", "--output", type=str, default=IVF_INDEX_PATH,
+                        help=f"Index file (default: {IVF_INDEX_PATH})")
+    return parser.parse_args()
+
+
+
+async def main():
+    args = parse_arguments()
+
+    # Marks first: pages written during the build are logged after them, searches catch up with them
+    log_marks = await db_get_vector_log_marks()
+    page_ids, matrix = await db_load_vectors()
+    if not page_ids:
+        print("No page vectors in the database, nothing to index")
+        return
+
+    build_ivf_index(page_ids, matrix, log_marks, args.lists, args.iterations, args.batch_size, args.output)
+
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
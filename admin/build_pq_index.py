@@ -0,0 +1,42 @@
+# admin/build_pq_index.py
+
+import argparse, asyncio, sys, os
+
+# Add the parent directory to sys.path to enable imports from adjacent modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import PQ_INDEX_PATH, PQ_SUBVECTORS
+from database.vector_index import db_load_vectors, db_get_vector_log_marks
+from database.index_pq import build_pq_index
+
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Train product-quantization codebooks and encode page_images_vectors")
+    parser.add_argument("-m", "--subvectors", type=int, default=PQ_SUBVECTORS,
+                        help=f"Sub-quantizers, i.e. bytes per page; lowered to a divisor of the vector dimension if needed (default: {PQ_SUBVECTORS})")
+    parser.add_argument("-i", "--iterations", type=int, default=25,
+                        help="k-means iterations per sub-quantizer (default: 25)")
+    parser.add_argument("-o", "--output", type=str, default=PQ_INDEX_PATH,
+                        help=f"Index file (default: {PQ_INDEX_PATH})")
+    return parser.parse_args()
+
+
+
+async def main():
+    args = parse_arguments()
+
+    # Marks first: pages written during the build are logged after them, searches catch up with them
+    log_marks = await db_get_vector_log_marks()
+    page_ids, matrix = await db_load_vectors()
+    if not page_ids:
+        print("No page vectors in the database, nothing to index")
+        return
+
+    build_pq_index(page_ids, matrix, log_marks, args.subvectors, args.iterations, args.output)
+
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+# admin/bulk_load.py
+
+from uuid import uuid4
+from PIL import Image
+import numpy as np
+import argparse, shutil, time, sys, re, os
+
+# Add the parent directory to sys.path to enable imports from adjacent modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import EXTRACTION_FOLDER, PROCESSED_FOLDER, BULK_LOAD_BATCH_PAGES
+from database.bulk_load import BulkLoader, recover_interrupted_load
+from database.shards import all_db_paths
+
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Bulk-load extracted samples (sample_N.jpg + sample_N.txt) as one-page documents")
+    parser.add_argument("-f", "--folder", type=str, default=EXTRACTION_FOLDER,
+                        help=f"Folder written by extract_from_dataset.py (default: {EXTRACTION_FOLDER})")
+    parser.add_argument("--vectors", type=str, default=None,
+                        help="Optional .npy of page vectors, one row per sample in sample number order "
+                             "(pages loaded without one are only found by text search until embedded)")
+    parser.add_argument("-b", "--batch_pages", type=int, default=BULK_LOAD_BATCH_PAGES,
+                        help=f"Pages inserted per transaction (default: {BULK_LOAD_BATCH_PAGES})")
+    parser.add_argument("--skip_images", action="store_true",
+                        help=f"Do not copy the page images and thumbnails to {PROCESSED_FOLDER}")
+    return parser.parse_args()
+
+
+
+def list_samples(folder: str) -> list[tuple[str, str]]:
+    """(image path, LaTeX path) of every sample, in sample number order"""
+    samples = []
+    for filename in os.listdir(folder):
+        match = re.fullmatch(r"sample_(\d+)\.jpg", filename)
+        if match:
+            image_path = os.path.join(folder, filename)
+            samples.append((int(match.group(1)), image_path, image_path[:-len(".jpg")] + ".txt"))
+    return [(image_path, latex_path) for _, image_path, latex_path in sorted(samples)]
+
+
+
+def save_page_images(image_path: str, page_id: str, size=(400, 400)) -> None:
+    """Full image and thumbnail under the names the interface reads, as fill_db stores them"""
+    shutil.copyfile(image_path, os.path.join(PROCESSED_FOLDER, f"{page_id}_full.jpg"))
+    with Image.open(image_path) as image:
+        image.thumbnail(size)
+        image.convert("RGB").save(os.path.join(PROCESSED_FOLDER, f"{page_id}_thumb.jpg"), format="JPEG", optimize=True)
+
+
+
+def main():
+    args = parse_arguments()
+    start_time = time.time()
+
+    samples = list_samples(args.folder)
+    vectors = np.load(args.vectors, mmap_mode="r") if args.vectors else None
+    if vectors is not None and len(vectors) != len(samples):
+        raise ValueError(f"{args.vectors} holds {len(vectors)} vectors for {len(samples)} samples")
+    print(f"Loading {len(samples)} samples from {args.folder}")
+
+    # A previous load killed before it could clean up leaves its databases without the deferred triggers and indexes
+    for db_path in all_db_paths():
+        if os.path.exists(db_path):
+            recover_interrupted_load(db_path)
+
+    os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+    # Leaving the block early (an error, Ctrl+C) restores the triggers and indexes over what was loaded
+    with BulkLoader(args.batch_pages) as loader:
+        for i, (image_path, latex_path) in enumerate(samples):
+            latex_code = None
+            if os.path.exists(latex_path):
+                with open(latex_path, "r", encoding="utf-8") as f:
+                    latex_code = f.read()
+
+            # Generated here so the saved images and the database rows share it
+            page_id = str(uuid4())
+            loader.add_document(
+                title=os.path.basename(image_path),
+                page_texts=[""],  # Images carry no extracted text, as in fill_db
+                vectors=[vectors[i]] if vectors is not None else None,
+                page_ids=[page_id],
+                latex_codes=[latex_code]
+            )
+            if not args.skip_images:
+                save_page_images(image_path, page_id)
+
+        report = loader.finish()
+    problems = {db_path: db_problems for db_path, db_problems in report.items() if db_problems}
+    for db_path, db_problems in problems.items():
+        print(f"Consistency problems in {db_path}:")
+        for problem in db_problems:
+            print(f"- {problem}")
+    if not problems:
+        print("All databases consistent")
+    print(f"Loaded {len(samples)} samples in {time.time() - start_time:.1f}s")
+    if vectors is not None:
+        print("Run admin/build_document_vectors.py to compute the document vectors")
+
+    if problems:
+        sys.exit(1)
+
+
+
+if __name__ == "__main__":
+    main()
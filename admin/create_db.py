@@ -5,60 +5,97 @@ import sqlite3, sqlite_vec, sys, os
 # Add the parent directory to sys.path to enable imports from adjacent modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import LOCAL_DB_PATH
-
-
-
-conn = sqlite3.connect(LOCAL_DB_PATH)
-conn.enable_load_extension(True)
-sqlite_vec.load(conn)
-conn.enable_load_extension(False)
-
-vec_version, = conn.execute("select vec_version()").fetchone()
-print(f"vec_version={vec_version}")
-
-cursor = conn.cursor()
-
-
-
-# Create regular documents table
-cursor.execute("""
-CREATE TABLE documents (
-    document_id TEXT PRIMARY KEY,
-    title TEXT NOT NULL,
-    upload_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-    total_pages INTEGER NOT NULL
-)
-""")
-
-# Create regular page_images table
-cursor.execute("""
-CREATE TABLE page_images (
-    page_id TEXT PRIMARY KEY,
-    document_id TEXT NOT NULL,
-    page_number INTEGER NOT NULL,
-    page_text TEXT NOT NULL,
-    latex_code TEXT,
-    FOREIGN KEY (document_id) REFERENCES documents(document_id)
-)
-""")
-
-# Create virtual table for page_images' vector data
-cursor.execute("""
-CREATE VIRTUAL TABLE page_images_vectors USING vec0(
-    page_id TEXT PRIMARY KEY,
-    vector_data FLOAT[1536]
-)
-""")
-
-# Create trigger to delete from page_images_vectors when a page_image is deleted
-cursor.execute("""
-CREATE TRIGGER delete_page_images_vector
-AFTER DELETE ON page_images
-BEGIN
-    DELETE FROM page_images_vectors WHERE page_id = OLD.page_id;
-END;
-""")
-
-conn.commit()
-conn.close()
\ No newline at end of file
+from database.shards import all_db_paths
+from database.schema import page_images_vectors_sql, DOCUMENTS_VECTORS_SQL, INDEX_GENERATION_SQL, PAGE_VECTOR_LOG_SQL, DELETE_PAGE_VECTOR_TRIGGER_SQL, PAGE_IMAGES_FTS_SQL, TABLE_CELLS_SQL, PAGE_FINGERPRINTS_SQL, DOCUMENT_PROGRESS_SQL
+
+
+
+def create_database(db_path: str) -> None:
+    """Create every table, index and trigger in one database file"""
+    conn = sqlite3.connect(db_path)
+    conn.enable_load_extension(True)
+    sqlite_vec.load(conn)
+    conn.enable_load_extension(False)
+
+    vec_version, = conn.execute("select vec_version()").fetchone()
+    print(f"vec_version={vec_version}")
+
+    cursor = conn.cursor()
+
+    # Create regular documents table
+    cursor.execute("""
+    CREATE TABLE documents (
+        document_id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        upload_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        total_pages INTEGER NOT NULL,
+        processed_pages INTEGER NOT NULL DEFAULT 0,
+        failed_pages INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+
+    # Create regular page_images table
+    cursor.execute("""
+    CREATE TABLE page_images (
+        page_id TEXT PRIMARY KEY,
+        document_id TEXT NOT NULL,
+        page_number INTEGER NOT NULL,
+        page_text TEXT NOT NULL,
+        latex_code TEXT,
+        embedding_failed INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (document_id) REFERENCES documents(document_id)
+    )
+    """)
+
+    # Create full-text index over page_images' text and LaTeX, with its sync triggers
+    for statement in PAGE_IMAGES_FTS_SQL:
+        cursor.execute(statement)
+
+    # Create the numeric table cells index parsed from latex_code, with its delete trigger
+    for statement in TABLE_CELLS_SQL:
+        cursor.execute(statement)
+
+    # Create the page image hashes used for near-duplicate detection, with their delete trigger
+    for statement in PAGE_FINGERPRINTS_SQL:
+        cursor.execute(statement)
+
+    # Create virtual table for page_images' vector data, partitioned by document
+    cursor.execute(page_images_vectors_sql())
+
+    # Create virtual table for the per-document mean vectors, with its delete trigger
+    for statement in DOCUMENTS_VECTORS_SQL:
+        cursor.execute(statement)
+
+    # Create table for the per-dimension int8 calibration (only used with VECTOR_STORAGE = "int8")
+    cursor.execute("""
+    CREATE TABLE vector_quantization (
+        dimension INTEGER PRIMARY KEY,
+        scale REAL NOT NULL,
+        offset REAL NOT NULL
+    )
+    """)
+
+    # Create the index generation counter, bumped by every vector write
+    for statement in INDEX_GENERATION_SQL:
+        cursor.execute(statement)
+
+    # Create the log of vector writes and deletes the in-memory indexes catch up from
+    for statement in PAGE_VECTOR_LOG_SQL:
+        cursor.execute(statement)
+
+    # Create trigger to delete from page_images_vectors (and log it) when a page_image is deleted
+    cursor.execute(DELETE_PAGE_VECTOR_TRIGGER_SQL)
+
+    # Create the triggers keeping documents.processed_pages / failed_pages current
+    for statement in DOCUMENT_PROGRESS_SQL:
+        cursor.execute(statement)
+
+    conn.commit()
+    conn.close()
+
+
+
+if __name__ == "__main__":
+    # One file per shard (just LOCAL_DB_PATH with SHARD_COUNT = 1)
+    for db_path in all_db_paths():
+        create_database(db_path)
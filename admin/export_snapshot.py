@@ -0,0 +1,42 @@
+# admin/export_snapshot.py
+
+import argparse, asyncio, time, sys, os
+
+# Add the parent directory to sys.path to enable imports from adjacent modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import VECTOR_SNAPSHOT_PATH
+from database.vector_index import db_load_vectors, db_get_vector_log_marks
+from database.index_generation import db_get_generation
+from database.vector_snapshot import write_snapshot
+from database.connection_pool import connection_pool
+
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Export page_images_vectors to the memory-mapped snapshot loaded by the search processes")
+    parser.add_argument("-o", "--output", type=str, default=VECTOR_SNAPSHOT_PATH,
+                        help=f"Snapshot manifest (default: {VECTOR_SNAPSHOT_PATH})")
+    return parser.parse_args()
+
+
+
+async def main():
+    args = parse_arguments()
+    start_time = time.time()
+
+    # Read before the vectors: a write during the export leaves the snapshot behind the database, never ahead,
+    # and the readers replay it from the log on top of the snapshot
+    generation = await db_get_generation()
+    log_marks = await db_get_vector_log_marks()
+    page_ids, matrix = await db_load_vectors()
+    await connection_pool.close()
+
+    write_snapshot(page_ids, matrix, generation, log_marks, args.output)
+    print(f"Exported {len(page_ids)} vectors in {time.time() - start_time:.1f}s")
+
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,6 @@
 # admin/fill_db.py
 
-import sqlite_vec, traceback, aiosqlite, asyncio, struct, fitz, time, sys, io, os
+import traceback, asyncio, struct, fitz, time, sys, io, os
 from typing import List, Tuple, Dict, Any, Set
 from uuid import uuid4, UUID
 from PIL import Image
@@ -8,10 +8,14 @@ from PIL import Image
 # Add the parent directory to sys.path to enable imports from adjacent modules
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import PROCESSED_FOLDER, LOCAL_DB_PATH, EXTRACTION_FOLDER
+from config import PROCESSED_FOLDER, EXTRACTION_FOLDER, DEDUP_ENABLED
 from database.getters_status import get_document_processing_status
 from vectorization.class_embedding_queue import embedding_queue
 from database.setters_documents import db_store_pdf_file
+from database.setters_vectors import db_store_document_vector
+from database.page_dedup import image_hash, page_thumbnail, duplicate_detector, db_store_fingerprint
+from database.shards import document_db_path
+from database.connection_pool import connection_pool
 
 
 
@@ -174,22 +178,46 @@ def check_and_resize_for_vect(image_bytes: bytes, max_pixels: int = 1000000) ->
 
 
 
-async def verify_vector_in_database(page_id: UUID) -> bool:
-    async with aiosqlite.connect(LOCAL_DB_PATH) as conn:
-        await conn._execute(conn._conn.enable_load_extension, True)
-        await conn._execute(sqlite_vec.load, conn._conn)
+async def link_if_duplicate(document_id: UUID, page_idx: int, total_pages: int, page_id: str, image_data: bytes) -> bool:
+    """Link the page to a canonical page with the same image and skip its embedding.
+    Returns False (embed as usual) for new pages, which become canonical themselves."""
+    if not DEDUP_ENABLED:
+        return False
+    try:
+        hash_value = image_hash(image_data)
+        thumbnail = page_thumbnail(image_data)
+    except Exception as e:
+        print(f"Error hashing page {page_idx} for document {document_id}: {str(e)}")
+        return False
+
+    canonical_page_id = await duplicate_detector.find(hash_value, thumbnail)
+    if canonical_page_id is None:
+        await duplicate_detector.add(str(document_id), str(page_id), hash_value)
+        return False
+
+    await db_store_fingerprint(str(document_id), str(page_id), hash_value, canonical_page_id)
+    print(f"Page {page_idx} (ID: {page_id}) of document {document_id} duplicates page {canonical_page_id}, not embedding it")
+    await embedding_queue.skip_page(str(document_id), page_idx, total_pages)
+    return True
 
-        conn.row_factory = aiosqlite.Row
+
+
+async def verify_vector_in_database(document_id: UUID, page_id: UUID) -> bool:
+    async with connection_pool.reader(document_db_path(str(document_id))) as conn:
+        # A duplicate linked to its canonical page counts as vectorized
         query = """
             SELECT EXISTS(
                 SELECT 1
                 FROM page_images_vectors
                 WHERE page_id = ?
+            ) OR EXISTS(
+                SELECT 1
+                FROM page_fingerprints
+                WHERE page_id = ? AND canonical_page_id IS NOT NULL
             ) as has_vector
         """
-        async with conn.execute(query, (str(page_id),)) as cursor:
+        async with conn.execute(query, (str(page_id), str(page_id))) as cursor:
             result = await cursor.fetchone()
-            await conn._execute(conn._conn.enable_load_extension, False)
             return result['has_vector'] == 1
 
 
@@ -204,7 +232,7 @@ async def retry_missing_page_vectors(document_id: UUID, page_ids: List[UUID], im
         
         # Check which pages are missing vectors
         for idx, page_id in enumerate(page_ids):
-            if not await verify_vector_in_database(page_id):
+            if not await verify_vector_in_database(document_id, page_id):
                 if idx < len(images) and images[idx]:  # Make sure we have image data
                     missing_vectors.append((idx, page_id))
         
@@ -247,23 +275,19 @@ async def retry_missing_page_vectors(document_id: UUID, page_ids: List[UUID], im
 
 
 async def verify_document_vector(document_id: UUID) -> bool:
-    async with aiosqlite.connect(LOCAL_DB_PATH) as conn:
-        await conn._execute(conn._conn.enable_load_extension, True)
-        await conn._execute(sqlite_vec.load, conn._conn)
-
-        conn.row_factory = aiosqlite.Row
+    async with connection_pool.reader(document_db_path(str(document_id))) as conn:
         query = """
             SELECT 
-                (SELECT COUNT(*) FROM page_images WHERE document_id = ?) as total_pages,
-                (SELECT COUNT(*) FROM page_images_vectors piv 
-                 JOIN page_images pi ON pi.page_id = piv.page_id 
-                 WHERE pi.document_id = ?) as pages_with_vectors
+                d.total_pages,
+                d.processed_pages as pages_with_vectors,
+                EXISTS(SELECT 1 FROM documents_vectors WHERE document_id = d.document_id) as has_document_vector
+            FROM documents d
+            WHERE d.document_id = ?
         """
-        async with conn.execute(query, (str(document_id), str(document_id))) as cursor:
+        async with conn.execute(query, (str(document_id),)) as cursor:
             result = await cursor.fetchone()
-            await conn._execute(conn._conn.enable_load_extension, False)
             
-            if not result or result['total_pages'] == 0:
+            if not result or result['total_pages'] == 0 or not result['has_document_vector']:
                 return False
                 
             # Document is considered complete if at least 90% of pages have vectors
@@ -271,37 +295,21 @@ async def verify_document_vector(document_id: UUID) -> bool:
 
 
 async def compute_and_store_document_vector(document_id: UUID) -> bool:
-    async with aiosqlite.connect(LOCAL_DB_PATH) as conn:
-        await conn._execute(conn._conn.enable_load_extension, True)
-        await conn._execute(sqlite_vec.load, conn._conn)
-
-        conn.row_factory = aiosqlite.Row
-        
-        # Check if page vectors exist
+    async with connection_pool.writer(document_db_path(str(document_id))) as conn:
+        # Check if page vectors exist (duplicates linked to a canonical page count as vectorized)
         vector_query = """
-            SELECT COUNT(*) as vector_count
-            FROM page_images_vectors piv
-            JOIN page_images pi ON piv.page_id = pi.page_id
-            WHERE pi.document_id = ?
+            SELECT total_pages, processed_pages as vector_count
+            FROM documents
+            WHERE document_id = ?
         """
         async with conn.execute(vector_query, (str(document_id),)) as cursor:
             result = await cursor.fetchone()
         
         if not result or result['vector_count'] == 0:
             print(f"No page vectors found for document {document_id}")
-            await conn._execute(conn._conn.enable_load_extension, False)
             return False
         
-        # Count total pages
-        pages_query = """
-            SELECT COUNT(*) as page_count
-            FROM page_images
-            WHERE document_id = ?
-        """
-        async with conn.execute(pages_query, (str(document_id),)) as cursor:
-            pages_result = await cursor.fetchone()
-            
-        total_pages = pages_result['page_count'] if pages_result else 0
+        total_pages = result['total_pages']
         vectorized_pages = result['vector_count']
         
         # Document is considered successfully processed if at least 90% of pages have vectors
@@ -309,12 +317,15 @@ async def compute_and_store_document_vector(document_id: UUID) -> bool:
         
         if success:
             print(f"Document {document_id} successfully processed: {vectorized_pages}/{total_pages} pages vectorized")
+            # Mean-pool the page vectors into the document vector used by the hierarchical search
+            # The pooled writer commits when the block exits
+            if await db_store_document_vector(conn, str(document_id)):
+                print(f"Stored document vector for {document_id}")
             # Mark document as completed in memory
             completed_documents.add(str(document_id))
         else:
             print(f"Document {document_id} not fully processed: {vectorized_pages}/{total_pages} pages vectorized")
-            
-        await conn._execute(conn._conn.enable_load_extension, False)
+
         return success
 
 
@@ -498,6 +509,11 @@ async def process_single_pdf(pdf_path: str, timeout: int = 3600):
                 thumb_data = create_thumbnail(image_data)
                 await save_to_local(thumb_data, f"{page_id}_thumb.jpg")
 
+                # Near-duplicates of an already stored page are linked to it instead of embedded
+                if await link_if_duplicate(document_id, page_idx, total_pages, page_id, image_data):
+                    processed_pages.append(page_idx)
+                    continue
+
                 # Queue image for embedding with the specific page_id
                 resized_image = check_and_resize_for_vect(image_data)
                 await embedding_queue.add_image_task(
@@ -601,16 +617,17 @@ async def process_single_image(image_path: str, timeout: int = 3600):
             thumb_data = create_thumbnail(images[0])
             await save_to_local(thumb_data, f"{page_ids[0]}_thumb.jpg")
 
-            # Queue image for embedding with the specific page_id
-            resized_image = check_and_resize_for_vect(images[0])
-            await embedding_queue.add_image_task(
-                str(document_id),
-                filename,
-                resized_image,
-                0,  # page_idx
-                total_pages,
-                str(page_ids[0])  # Pass page_id to ensure consistency
-            )
+            # Queue image for embedding with the specific page_id, unless it duplicates a stored page
+            if not await link_if_duplicate(document_id, 0, total_pages, page_ids[0], images[0]):
+                resized_image = check_and_resize_for_vect(images[0])
+                await embedding_queue.add_image_task(
+                    str(document_id),
+                    filename,
+                    resized_image,
+                    0,  # page_idx
+                    total_pages,
+                    str(page_ids[0])  # Pass page_id to ensure consistency
+                )
             
         except Exception as e:
             print(f"Error processing image {filename}: {str(e)}")
@@ -737,7 +754,8 @@ async def main():
     
     # Run the processor
     success, failed = await process_pdf_folder(DOCS_FOLDER, concurrent_limit=2, timeout=3600)
-    
+
+    await connection_pool.close()
     return success, failed
 
 
@@ -0,0 +1,50 @@
+# admin/migrate_progress_counters.py
+
+import sqlite3, sqlite_vec, argparse, time, sys, os
+
+# Add the parent directory to sys.path to enable imports from adjacent modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.schema import ensure_document_progress
+from database.shards import all_db_paths
+
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Add the documents.processed_pages / failed_pages counters, the page_vector_log "
+                                                 "they and the in-memory indexes follow, the page_fingerprints table of page deduplication, recreate their triggers and recount them (safe to run again, e.g. if the counters were ever doubted)")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Database to migrate (default: every shard)")
+    return parser.parse_args()
+
+
+
+def migrate_database(db_path: str) -> None:
+    conn = sqlite3.connect(db_path)
+    conn.enable_load_extension(True)
+    sqlite_vec.load(conn)
+    conn.enable_load_extension(False)
+
+    start_time = time.time()
+    with conn:
+        ensure_document_progress(conn)
+    documents, processed, failed = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(processed_pages), 0), COALESCE(SUM(failed_pages), 0) FROM documents"
+    ).fetchone()
+    print(f"Counted {processed} processed and {failed} failed pages over {documents} documents in {db_path} "
+          f"in {time.time() - start_time:.1f}s")
+    conn.close()
+
+
+
+def main():
+    args = parse_arguments()
+
+    for db_path in ([args.db] if args.db else all_db_paths()):
+        migrate_database(db_path)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# admin/migrate_vectors_table.py
+
+import sqlite3, sqlite_vec, argparse, sys, os
+
+# Add the parent directory to sys.path to enable imports from adjacent modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import VECTOR_STORAGE
+from database.schema import rebuild_vectors_table, vacuum_database
+from database.shards import all_db_paths
+
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Recreate page_images_vectors with the current schema (document_id partition key, upload_date metadata)")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Database to migrate (default: every shard)")
+    return parser.parse_args()
+
+
+
+def migrate_database(db_path: str) -> None:
+    conn = sqlite3.connect(db_path)
+    conn.enable_load_extension(True)
+    sqlite_vec.load(conn)
+    conn.enable_load_extension(False)
+
+    rows = conn.execute("SELECT page_id, vector_data FROM page_images_vectors").fetchall()
+    print(f"Read {len(rows)} vectors from {db_path}")
+
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    rebuild_vectors_table(cursor, rows, VECTOR_STORAGE)
+    conn.commit()
+
+    migrated, = conn.execute("SELECT COUNT(*) FROM page_images_vectors").fetchone()
+    print(f"Migrated {migrated} vectors ({len(rows) - migrated} without a page were dropped)")
+    vacuum_database(conn)
+    conn.close()
+
+
+
+def main():
+    args = parse_arguments()
+
+    for db_path in ([args.db] if args.db else all_db_paths()):
+        migrate_database(db_path)
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# admin/quantize_db.py
+
+import sqlite3, sqlite_vec, argparse, sys, os
+import numpy as np
+
+# Add the parent directory to sys.path to enable imports from adjacent modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import EMBEDDING_DIM
+from database.quantization import calibrate_int8, quantize_int8, dequantize_int8, default_int8_calibration
+from database.schema import rebuild_vectors_table, vacuum_database
+from database.shards import all_db_paths
+
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Convert page_images_vectors to calibrated int8 storage (set VECTOR_STORAGE = \"int8\" afterwards)")
+    parser.add_argument("--db", type=str, default=None,
+                        help="Database to convert (default: every shard, all sharing one calibration)")
+    parser.add_argument("--clip", type=float, default=0.1,
+                        help="Percentile clipped at each end of every dimension when calibrating (default: 0.1)")
+    parser.add_argument("--sample", type=int, default=100000,
+                        help="Maximum number of vectors used for calibration (default: 100000)")
+    return parser.parse_args()
+
+
+
+def read_float_vectors(conn) -> tuple[list[str], np.ndarray]:
+    """Read every vector as float32, whether it is currently stored as float32 or int8"""
+    rows = conn.execute("SELECT page_id, vector_data FROM page_images_vectors").fetchall()
+    page_ids = [row[0] for row in rows]
+    blob = b"".join(row[1] for row in rows)
+
+    if rows and len(rows[0][1]) == EMBEDDING_DIM:
+        # Already int8: dequantize with the current calibration before recalibrating
+        stored = conn.execute("SELECT scale, offset FROM vector_quantization ORDER BY dimension").fetchall()
+        if stored:
+            scale, offset = np.array([r[0] for r in stored], dtype=np.float32), np.array([r[1] for r in stored], dtype=np.float32)
+        else:
+            scale, offset = default_int8_calibration()
+        codes = np.frombuffer(blob, dtype=np.int8).reshape(len(rows), EMBEDDING_DIM)
+        return page_ids, dequantize_int8(codes, scale, offset)
+
+    return page_ids, np.frombuffer(blob, dtype=np.float32).reshape(len(rows), EMBEDDING_DIM)
+
+
+
+def store_int8_vectors(conn, page_ids: list[str], codes: np.ndarray, scale: np.ndarray, offset: np.ndarray) -> None:
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+    rebuild_vectors_table(cursor, ((page_id, code.tobytes()) for page_id, code in zip(page_ids, codes)), "int8")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS vector_quantization (
+        dimension INTEGER PRIMARY KEY,
+        scale REAL NOT NULL,
+        offset REAL NOT NULL
+    )
+    """)
+    cursor.execute("DELETE FROM vector_quantization")
+    cursor.executemany(
+        "INSERT INTO vector_quantization (dimension, scale, offset) VALUES (?, ?, ?)",
+        ((i, float(s), float(o)) for i, (s, o) in enumerate(zip(scale, offset)))
+    )
+    conn.commit()
+    vacuum_database(conn)
+
+
+
+def main():
+    args = parse_arguments()
+
+    connections, shard_vectors = [], []
+    for db_path in ([args.db] if args.db else all_db_paths()):
+        conn = sqlite3.connect(db_path)
+        conn.enable_load_extension(True)
+        sqlite_vec.load(conn)
+        conn.enable_load_extension(False)
+
+        page_ids, matrix = read_float_vectors(conn)
+        print(f"Read {len(page_ids)} vectors from {db_path}")
+        connections.append(conn)
+        shard_vectors.append((page_ids, matrix))
+
+    total = sum(len(page_ids) for page_ids, _ in shard_vectors)
+    if not total:
+        print("Nothing to calibrate")
+        return
+
+    # One calibration for every shard, so codes from different shards stay comparable
+    matrix = np.concatenate([matrix for page_ids, matrix in shard_vectors if page_ids])
+    rng = np.random.default_rng(0)
+    sample = matrix[rng.choice(len(matrix), size=min(args.sample, len(matrix)), replace=False)]
+    scale, offset = calibrate_int8(sample, args.clip)
+
+    error = np.abs(dequantize_int8(quantize_int8(sample, scale, offset), scale, offset) - sample).mean()
+    print(f"Calibrated on {len(sample)} vectors, mean absolute reconstruction error: {error:.6f}")
+
+    for conn, (page_ids, matrix) in zip(connections, shard_vectors):
+        store_int8_vectors(conn, page_ids, quantize_int8(matrix, scale, offset), scale, offset)
+        conn.close()
+
+    print(f"Stored {total} int8 vectors. Set VECTOR_STORAGE = \"int8\" in config.py to use them.")
+
+
+
+if __name__ == "__main__":
+    main()
@@ -14,8 +14,89 @@ EXTRACTION_FOLDER = "extracted_data"
 
 """Database stuff"""
 LOCAL_DB_PATH = "database/mydatabase.db"
+# Documents are spread over SHARD_COUNT database files by a hash of their document_id
+# (1 keeps everything in LOCAL_DB_PATH). Changing it requires recreating the databases.
+SHARD_COUNT = 1
+# Pooled connections per database file (one writer plus up to POOL_READERS readers), opened once with
+# sqlite-vec loaded, WAL journaling and these pragmas
+POOL_READERS = 4
+SQLITE_MMAP_SIZE = 1024 ** 3  # bytes of the file mapped into memory
+SQLITE_CACHE_SIZE_KB = 64 * 1024  # page cache per connection
+SQLITE_BUSY_TIMEOUT_MS = 5000
+# Ingestion writes are grouped into one transaction per shard, committed once WRITE_BATCH_SIZE writes
+# are waiting or WRITE_BATCH_DELAY_MS after the first one, whichever comes first
+WRITE_BATCH_SIZE = 64
+WRITE_BATCH_DELAY_MS = 50
+# admin/bulk_load.py inserts BULK_LOAD_BATCH_PAGES pages per transaction with synchronous=OFF and this page cache
+BULK_LOAD_BATCH_PAGES = 5000
+BULK_LOAD_CACHE_SIZE_KB = 1024 * 1024
+# "float32", or "int8" to store per-dimension quantized vectors (4x smaller, calibrated with admin/quantize_db.py)
+VECTOR_STORAGE = "float32"
+# Vectors per sqlite-vec chunk. Every document partition allocates whole chunks, so this stays at the minimum:
+# most documents are one image (must be a multiple of 8; admin/migrate_vectors_table.py applies a change to existing files)
+VEC_CHUNK_SIZE = 8
+
+
+"""Search stuff"""
+# "memory": exact search over a normalized float32 matrix kept in RAM
+# "cascade": scan a short Matryoshka prefix of every vector, then re-score the best candidates in full
+# "binary": Hamming prefilter over 1-bit sign codes, then float rerank of BINARY_CANDIDATES pages
+# "int8": per-dimension int8 codes kept in RAM (a quarter of "memory"), then an exact rerank of INT8_RERANK_CANDIDATES pages;
+#         about as fast as "memory", so it is for memory savings rather than speed
+# "ivf": inverted-file ANN index built offline with admin/build_ivf_index.py, scans IVF_NPROBE lists
+# "hnsw": HNSW graph index, updated in place by the embedding queue
+# "pq": product-quantized codes built with admin/build_pq_index.py, optional float rerank
+# "sqlite": sqlite-vec KNN (MATCH ... AND k = ?), also used for every query filtered by document or date
+# "hierarchical": KNN over the per-document mean vectors, then page KNN within the HIERARCHICAL_DOCUMENTS best documents
+SEARCH_BACKEND = "memory"
+# The memory and cascade backends fold the vectors written since their last load into the main segment
+# in the background once DELTA_COMPACTION_ROWS of them have accumulated
+DELTA_COMPACTION_ROWS = 10000
+CASCADE_PREFIX_DIM = 128
+CASCADE_CANDIDATES = 300
+BINARY_CANDIDATES = 200
+INT8_RERANK_CANDIDATES = 100  # 0 returns the int8 scores without reranking
+IVF_INDEX_PATH = os.path.splitext(LOCAL_DB_PATH)[0] + ".ivf.npz"
+IVF_NPROBE = 16
+HNSW_INDEX_PATH = os.path.splitext(LOCAL_DB_PATH)[0] + ".hnsw.npz"
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+HNSW_SAVE_EVERY = 200
+PQ_INDEX_PATH = os.path.splitext(LOCAL_DB_PATH)[0] + ".pq.npz"
+PQ_SUBVECTORS = 96  # bytes per page, lowered to the largest divisor of EMBEDDING_DIM below it (64 for 256 or 512)
+PQ_RERANK_CANDIDATES = 100  # 0 returns the PQ scores without reranking
+HIERARCHICAL_DOCUMENTS = 10
+# The in-memory indexes memory-map this snapshot (written by admin/export_snapshot.py) instead of reading
+# every vector through SQLite, then fetch the vectors written or deleted since it was taken from page_vector_log
+USE_VECTOR_SNAPSHOT = True
+VECTOR_SNAPSHOT_PATH = os.path.splitext(LOCAL_DB_PATH)[0] + ".snapshot.json"
+# "vector", or "hybrid" to fuse BM25 (FTS5 over page_text / latex_code) and vector rankings with RRF
+RETRIEVAL_MODE = "vector"
+HYBRID_CANDIDATES = 50
+RRF_K = 60
+# Top-k results cached per query vector, dropped whenever a vector write bumps the index generation
+SEARCH_CACHE_SIZE = 1000
+
+
+"""Deduplication stuff"""
+# Identical pages are linked to a canonical page instead of getting their own vector: before embedding, pages
+# whose 64-bit difference hash is close are candidates and are linked if their downscaled images differ by no
+# more than DEDUP_PIXEL_TOLERANCE gray levels anywhere (recompression noise, not a changed digit); after
+# embedding, a page of the corpus with a similar vector is linked if its text and LaTeX are the same.
+DEDUP_ENABLED = True
+DEDUP_HASH_DISTANCE = 4  # max differing bits out of 64 for a hash candidate
+DEDUP_PIXEL_TOLERANCE = 24  # max gray level difference (0-255) of any pixel of the 256 px wide thumbnails
+DEDUP_VECTOR_SIMILARITY = 0.98
 
 
 """Vectorization stuff"""
 VECT_MODEL_NAME = "MrLight/dse-qwen2-2b-mrl-v1"
-VECT_MODEL_LOCAL_PATH = "weights_vect_model"
\ No newline at end of file
+VECT_MODEL_LOCAL_PATH = "weights_vect_model"
+# The model is Matryoshka-trained, so any prefix of its 1536-dim output is a usable embedding
+# (e.g. 256, 512, 768 or 1536). Changing this requires recreating the database.
+EMBEDDING_DIM = 1536
+# Query embeddings are cached by normalized text and model, in an LRU backed by a SQLite file
+QUERY_CACHE_PATH = "database/query_cache.db"
+QUERY_CACHE_SIZE = 10000
+QUERY_CACHE_WRITE_DELAY_MS = 1000  # new embeddings are written to disk together, this long after the first
\ No newline at end of file
@@ -0,0 +1,282 @@
+# database/bulk_load.py
+
+from typing import Optional, List
+from datetime import datetime
+from uuid import uuid4
+import sqlite3, sqlite_vec, time
+import numpy as np
+
+from config import VECTOR_STORAGE, EMBEDDING_DIM, BULK_LOAD_BATCH_PAGES, BULK_LOAD_CACHE_SIZE_KB
+from database.schema import insert_page_vector_sql, ensure_document_progress, DOCUMENT_PROGRESS_COUNTS_SQL, PAGE_IMAGES_FTS_SQL, REBUILD_FTS_SQL, TABLE_CELLS_SQL, PAGE_FINGERPRINTS_SQL, BUMP_GENERATION_SQL
+from database.quantization import quantize_int8, default_int8_calibration, float32_blob
+from database.vector_index import document_vector
+from database.table_cells import parse_table_cells
+from database.shards import document_db_path
+
+
+
+# Triggers and indexes dropped for the duration of a load and recreated from their DDL lists at the end
+DEFERRED_OBJECTS = [
+    ("TRIGGER", "page_images_fts_insert"),
+    ("TRIGGER", "count_page_vector_insert"),
+    ("INDEX", "idx_table_cells_value"),
+    ("INDEX", "idx_table_cells_page"),
+    ("INDEX", "idx_page_fingerprints_canonical"),
+]
+
+
+
+def restore_deferred_objects(conn: sqlite3.Connection) -> None:
+    """Recreate the triggers and indexes a load drops, rebuild the full-text index and recount the progress
+    counters, so the rows loaded so far are indexed like any other"""
+    with conn:
+        for statement in PAGE_IMAGES_FTS_SQL + TABLE_CELLS_SQL + PAGE_FINGERPRINTS_SQL:
+            conn.execute(statement)
+        conn.execute(REBUILD_FTS_SQL)
+        # The load does not write page_vector_log: the loaded vectors are logged and counted once here
+        ensure_document_progress(conn)
+        # One generation bump for the whole load, so the in-memory indexes reload once
+        conn.execute(BUMP_GENERATION_SQL)
+
+
+def missing_deferred_objects(conn: sqlite3.Connection) -> List[str]:
+    """Names of the deferred triggers and indexes that are not in the database"""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('trigger', 'index')")}
+    return [name for _, name in DEFERRED_OBJECTS if name not in existing]
+
+
+def recover_interrupted_load(db_path: str) -> List[str]:
+    """Restore the deferred objects of a database whose bulk load was killed before it could restore them
+    itself. Returns the names that were missing (an empty list if the database is fine)."""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.enable_load_extension(True)
+        sqlite_vec.load(conn)
+        conn.enable_load_extension(False)
+
+        missing = missing_deferred_objects(conn)
+        if missing:
+            print(f"[{datetime.now()}] {db_path} is missing {', '.join(missing)} from an interrupted bulk load, restoring them")
+            restore_deferred_objects(conn)
+        return missing
+    finally:
+        conn.close()
+
+
+
+def check_consistency(conn: sqlite3.Connection) -> List[str]:
+    """Problems found in one database file (an empty list if it is consistent)"""
+    problems = []
+    checks = {
+        "documents whose page count differs from total_pages": """
+            SELECT COUNT(*) FROM documents d
+            LEFT JOIN (SELECT document_id, COUNT(*) AS pages FROM page_images GROUP BY document_id) p
+                ON p.document_id = d.document_id
+            WHERE d.total_pages != COALESCE(p.pages, 0)
+        """,
+        "pages without a document": """
+            SELECT COUNT(*) FROM page_images pi
+            WHERE NOT EXISTS (SELECT 1 FROM documents d WHERE d.document_id = pi.document_id)
+        """,
+        "vectors without a page": """
+            SELECT COUNT(*) FROM page_images_vectors piv
+            WHERE NOT EXISTS (SELECT 1 FROM page_images pi WHERE pi.page_id = piv.page_id)
+        """,
+        "vectors missing from page_vector_log": """
+            SELECT COUNT(*) FROM page_images_vectors piv
+            WHERE NOT EXISTS (SELECT 1 FROM page_vector_log l WHERE l.page_id = piv.page_id AND l.deleted = 0)
+        """,
+        "documents whose progress counters differ from their pages": f"""
+            SELECT COUNT(*) FROM documents d
+            LEFT JOIN ({DOCUMENT_PROGRESS_COUNTS_SQL}) p ON p.document_id = d.document_id
+            WHERE d.processed_pages != COALESCE(p.processed, 0) OR d.failed_pages != COALESCE(p.failed, 0)
+        """,
+        "table cells without a page": """
+            SELECT COUNT(*) FROM table_cells tc
+            WHERE NOT EXISTS (SELECT 1 FROM page_images pi WHERE pi.page_id = tc.page_id)
+        """,
+    }
+    for description, query in checks.items():
+        count, = conn.execute(query).fetchone()
+        if count:
+            problems.append(f"{count} {description}")
+
+    try:
+        # rank = 1 also compares the index against the content of page_images
+        conn.execute("INSERT INTO page_images_fts (page_images_fts, rank) VALUES ('integrity-check', 1)")
+    except sqlite3.DatabaseError as e:
+        problems.append(f"full-text index out of sync: {str(e)}")
+
+    result, = conn.execute("PRAGMA quick_check").fetchone()
+    if result != "ok":
+        problems.append(f"quick_check: {result}")
+    return problems
+
+
+
+class BulkLoader:
+    """Loads many documents at once for the initial ingestion, bypassing the per-page path:
+    rows are buffered per shard and written with executemany, BULK_LOAD_BATCH_PAGES pages per transaction,
+    with synchronous=OFF and a large cache. The full-text insert trigger and the secondary indexes are
+    dropped while loading, then recreated (and the full-text index rebuilt) by finish(), which also
+    checks every touched database. Used as a context manager, a load that fails halfway restores them
+    too, over the batches committed so far. Page images are not hashed, so no duplicates are linked."""
+
+    def __init__(self, batch_pages: int = BULK_LOAD_BATCH_PAGES):
+        self.batch_pages = batch_pages
+        self.connections: dict[str, sqlite3.Connection] = {}
+        self.buffers: dict[str, dict[str, list]] = {}
+        self.calibration: Optional[tuple[np.ndarray, np.ndarray]] = None
+        self.documents = 0
+        self.pages = 0
+        self.vectors = 0
+        self.start_time = time.time()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Only databases that finish() did not get to are still open
+        self.abort()
+        return False
+
+
+    def _open(self, db_path: str) -> sqlite3.Connection:
+        if db_path in self.connections:
+            return self.connections[db_path]
+
+        conn = sqlite3.connect(db_path)
+        conn.enable_load_extension(True)
+        sqlite_vec.load(conn)
+        conn.enable_load_extension(False)
+
+        # Nothing is lost if the machine crashes mid-load: the load is simply run again
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(f"PRAGMA cache_size = -{BULK_LOAD_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        for kind, name in DEFERRED_OBJECTS:
+            conn.execute(f"DROP {kind} IF EXISTS {name}")
+
+        if VECTOR_STORAGE == "int8" and self.calibration is None:
+            rows = conn.execute("SELECT scale, offset FROM vector_quantization ORDER BY dimension").fetchall()
+            self.calibration = (
+                (np.array([row[0] for row in rows], dtype=np.float32), np.array([row[1] for row in rows], dtype=np.float32))
+                if rows else default_int8_calibration()
+            )
+
+        self.connections[db_path] = conn
+        self.buffers[db_path] = {"documents": [], "pages": [], "cells": [], "vectors": [], "document_vectors": []}
+        print(f"[{datetime.now()}] Opened {db_path} for bulk loading")
+        return conn
+
+
+    def _encode(self, vector) -> memoryview:
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape != (EMBEDDING_DIM,):
+            raise ValueError(f"Vector length {vector.size} does not match expected dimension {EMBEDDING_DIM}")
+        if VECTOR_STORAGE == "int8":
+            return memoryview(quantize_int8(vector, *self.calibration))
+        return float32_blob(vector)
+
+
+    def add_document(
+        self,
+        title: str,
+        page_texts: List[str],
+        vectors=None,
+        page_ids: Optional[List[str]] = None,
+        latex_codes: Optional[List[Optional[str]]] = None,
+        document_id: Optional[str] = None
+    ) -> str:
+        """Buffer one document with its pages (vectors, page_ids and latex_codes are per page, any may be None).
+        Returns the document_id used."""
+        document_id = document_id or str(uuid4())
+        db_path = document_db_path(document_id)
+        self._open(db_path)
+        buffer = self.buffers[db_path]
+
+        buffer["documents"].append((document_id, title, len(page_texts)))
+        page_vectors = []
+        for i, page_text in enumerate(page_texts):
+            page_id = page_ids[i] if page_ids and i < len(page_ids) and page_ids[i] else str(uuid4())
+            latex_code = latex_codes[i] if latex_codes and i < len(latex_codes) else None
+            buffer["pages"].append((page_id, document_id, i, page_text, latex_code))
+
+            for cell in parse_table_cells(latex_code):
+                buffer["cells"].append((page_id, cell['table_index'], cell['row'], cell['col'], cell['raw_value'], cell['value']))
+
+            if vectors is not None and i < len(vectors) and vectors[i] is not None:
+                buffer["vectors"].append((self._encode(vectors[i]), page_id))
+                page_vectors.append(vectors[i])
+
+        # The float vectors are at hand, the document vector of the hierarchical search costs no read back
+        if page_vectors:
+            buffer["document_vectors"].append((document_id, float32_blob(document_vector(page_vectors))))
+
+        self.documents += 1
+        if len(buffer["pages"]) >= self.batch_pages:
+            self._flush(db_path)
+        return document_id
+
+
+    def _flush(self, db_path: str) -> None:
+        """Write the buffered rows of one shard in a single transaction"""
+        conn, buffer = self.connections[db_path], self.buffers[db_path]
+        if not buffer["documents"]:
+            return
+
+        with conn:
+            conn.executemany("INSERT INTO documents (document_id, title, total_pages) VALUES (?, ?, ?)", buffer["documents"])
+            conn.executemany(
+                "INSERT INTO page_images (page_id, document_id, page_number, page_text, latex_code) VALUES (?, ?, ?, ?, ?)",
+                buffer["pages"]
+            )
+            conn.executemany(
+                "INSERT INTO table_cells (page_id, table_index, row, col, raw_value, value) VALUES (?, ?, ?, ?, ?, ?)",
+                buffer["cells"]
+            )
+            conn.executemany(insert_page_vector_sql(), buffer["vectors"])
+            conn.executemany("INSERT INTO documents_vectors (document_id, vector_data) VALUES (?, ?)", buffer["document_vectors"])
+
+        self.pages += len(buffer["pages"])
+        self.vectors += len(buffer["vectors"])
+        print(f"[{datetime.now()}] Loaded {self.pages} pages ({self.vectors} vectors) in {time.time() - self.start_time:.1f}s")
+        self.buffers[db_path] = {"documents": [], "pages": [], "cells": [], "vectors": [], "document_vectors": []}
+
+
+    def finish(self) -> dict[str, List[str]]:
+        """Flush, recreate the deferred triggers and indexes, rebuild the full-text index, restore the
+        normal pragmas and check every database. Returns the problems found per database file."""
+        report = {}
+        for db_path, conn in list(self.connections.items()):
+            self._flush(db_path)
+
+            start = time.time()
+            restore_deferred_objects(conn)
+            # Done with this database: from here on a failure must not restore it again
+            del self.connections[db_path]
+            try:
+                conn.execute("PRAGMA synchronous = NORMAL")
+                conn.execute("PRAGMA optimize")
+                print(f"[{datetime.now()}] Rebuilt triggers, indexes and the full-text index of {db_path} in {time.time() - start:.1f}s")
+                report[db_path] = check_consistency(conn)
+            finally:
+                conn.close()
+
+        print(f"[{datetime.now()}] Bulk load finished: {self.documents} documents, {self.pages} pages, "
+              f"{self.vectors} vectors in {time.time() - self.start_time:.1f}s")
+        return report
+
+
+    def abort(self) -> None:
+        """Drop the rows still buffered and restore the deferred objects of every open database, e.g. after
+        a failure halfway through the load. The batches already committed stay."""
+        for db_path, conn in list(self.connections.items()):
+            del self.connections[db_path]
+            try:
+                restore_deferred_objects(conn)
+                print(f"[{datetime.now()}] Bulk load of {db_path} aborted, restored its triggers and indexes over the rows loaded so far")
+            finally:
+                conn.close()
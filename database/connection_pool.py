@@ -0,0 +1,111 @@
+# database/connection_pool.py
+
+from contextlib import asynccontextmanager
+from datetime import datetime
+import aiosqlite, sqlite_vec, asyncio
+
+from config import POOL_READERS, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB, SQLITE_BUSY_TIMEOUT_MS
+
+
+
+async def _open_connection(db_path: str, read_only: bool) -> aiosqlite.Connection:
+    """Open a connection with sqlite-vec loaded and the pragmas applied, once for its whole lifetime"""
+    if read_only:
+        conn = aiosqlite.connect(f"file:{db_path}?mode=ro", uri=True)
+    else:
+        conn = aiosqlite.connect(db_path)
+    # The worker thread must not keep the process alive at exit (newer aiosqlite wraps the thread)
+    getattr(conn, "_thread", conn).daemon = True
+    await conn
+
+    await conn._execute(conn._conn.enable_load_extension, True)
+    await conn._execute(sqlite_vec.load, conn._conn)
+    await conn._execute(conn._conn.enable_load_extension, False)
+    conn.row_factory = aiosqlite.Row
+
+    if not read_only:
+        # WAL lets the readers keep reading while the writer commits; it persists in the file
+        await conn.execute("PRAGMA journal_mode = WAL")
+        await conn.execute("PRAGMA synchronous = NORMAL")
+    await conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    await conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+    await conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    await conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+
+class ConnectionPool:
+    """Long-lived connections per database file: one writer, serialized by a lock, and up to
+    `readers` read-only connections, each handed to one coroutine at a time"""
+
+    def __init__(self, readers: int = POOL_READERS):
+        self.readers = readers
+        self.writers: dict[str, aiosqlite.Connection] = {}
+        self.writer_locks: dict[str, asyncio.Lock] = {}
+        self.idle_readers: dict[str, asyncio.Queue] = {}
+        self.opened_readers: dict[str, int] = {}
+        self.all_connections: list[aiosqlite.Connection] = []
+        self.open_lock = asyncio.Lock()
+
+
+    async def _get_writer(self, db_path: str) -> aiosqlite.Connection:
+        if db_path not in self.writers:
+            async with self.open_lock:
+                if db_path not in self.writers:
+                    conn = await _open_connection(db_path, read_only=False)
+                    self.all_connections.append(conn)
+                    self.writer_locks[db_path] = asyncio.Lock()
+                    self.writers[db_path] = conn
+                    print(f"[{datetime.now()}] Opened pooled writer connection to {db_path}")
+        return self.writers[db_path]
+
+
+    @asynccontextmanager
+    async def writer(self, db_path: str):
+        """The single writer of a database file; the block is one transaction, committed on success"""
+        conn = await self._get_writer(db_path)
+        async with self.writer_locks[db_path]:
+            try:
+                yield conn
+                if conn.in_transaction:
+                    await conn.commit()
+            except BaseException:
+                if conn.in_transaction:
+                    await conn.rollback()
+                raise
+
+
+    @asynccontextmanager
+    async def reader(self, db_path: str):
+        """A read-only connection, opened on demand up to `readers` per file and reused afterwards"""
+        # The writer sets WAL mode before any reader opens the file
+        await self._get_writer(db_path)
+        idle = self.idle_readers.setdefault(db_path, asyncio.Queue())
+
+        if idle.empty() and self.opened_readers.get(db_path, 0) < self.readers:
+            self.opened_readers[db_path] = self.opened_readers.get(db_path, 0) + 1
+            try:
+                conn = await _open_connection(db_path, read_only=True)
+            except BaseException:
+                self.opened_readers[db_path] -= 1
+                raise
+            self.all_connections.append(conn)
+        else:
+            conn = await idle.get()
+
+        try:
+            yield conn
+        finally:
+            idle.put_nowait(conn)
+
+
+    async def close(self):
+        """Close every pooled connection, e.g. before the event loop shuts down"""
+        for conn in self.all_connections:
+            await conn.close()
+        self.__init__(self.readers)
+
+
+
+connection_pool = ConnectionPool()
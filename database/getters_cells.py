@@ -0,0 +1,56 @@
+# database/getters_cells.py
+
+from typing import Optional
+
+from database.shards import gather_shards
+from database.connection_pool import connection_pool
+from database.table_cells import normalize_numeric
+
+
+
+async def db_find_cells(value, page_ids: Optional[list[str]] = None) -> list[dict]:
+    """Table cells holding a numeric value (e.g. "76.3", "1,024" or 12.5), optionally only within some pages.
+    Served by the value index, no LaTeX is read."""
+    numeric_value = normalize_numeric(value)
+    if numeric_value is None:
+        return []
+
+    conditions = ["value = ?"]
+    params = [numeric_value]
+    if page_ids:
+        conditions.append(f"page_id IN ({', '.join('?' for _ in page_ids)})")
+        params.extend(page_ids)
+
+    query = f"""
+        SELECT page_id, table_index, row, col, raw_value, value
+        FROM table_cells
+        WHERE {" AND ".join(conditions)}
+        ORDER BY page_id, table_index, row, col
+    """
+    shard_results = await gather_shards(_db_run_cells_query, query, params)
+    return sorted((cell for shard_cells in shard_results for cell in shard_cells),
+                  key=lambda cell: (cell['page_id'], cell['table_index'], cell['row'], cell['col']))
+
+
+
+async def _db_run_cells_query(db_path: str, query: str, params: list) -> list[dict]:
+    async with connection_pool.reader(db_path) as conn:
+        async with conn.execute(query, params) as cursor:
+            return [dict(row) for row in await cursor.fetchall()]
+
+
+
+async def find_edit_target(image_ids: list, image_number: int, original_value) -> Optional[dict]:
+    """Cell holding original_value: on the image the model named if it has one, otherwise on the
+    only retrieved image that has one. None when the edit cannot be placed, so nothing gets rendered."""
+    cells = await db_find_cells(original_value, page_ids=image_ids)
+    if not cells:
+        return None
+
+    named_id = image_ids[image_number % len(image_ids)]
+    named_cells = [cell for cell in cells if cell['page_id'] == named_id]
+    if named_cells:
+        return named_cells[0]
+    if len({cell['page_id'] for cell in cells}) == 1:
+        return cells[0]
+    return None
@@ -1,15 +1,13 @@
 # database/getters_latex.py
 
-import aiosqlite
+from database.shards import gather_shards
+from database.connection_pool import connection_pool
 
-from config import LOCAL_DB_PATH
 
 
 
-
-async def db_get_image_latex(image_id: str):
-    async with aiosqlite.connect(LOCAL_DB_PATH) as conn:
-        conn.row_factory = aiosqlite.Row
+async def _db_get_shard_image_latex(db_path: str, image_id: str):
+    async with connection_pool.reader(db_path) as conn:
         query = """
             SELECT
                 pi.latex_code
@@ -18,4 +16,9 @@ async def db_get_image_latex(image_id: str):
         """
         async with conn.execute(query, (image_id,)) as cursor:
             row = await cursor.fetchone()
-            return row[0] if row else None
\ No newline at end of file
+            return row[0] if row else None
+
+
+async def db_get_image_latex(image_id: str):
+    # A page_id does not tell its shard, at most one shard holds it
+    return next((latex for latex in await gather_shards(_db_get_shard_image_latex, image_id) if latex is not None), None)
@@ -1,40 +1,256 @@
 # database/getters_search.py
 
-import sqlite_vec, aiosqlite
+from typing import Optional
+import asyncio
 import numpy as np
 
-from config import LOCAL_DB_PATH
+from config import SEARCH_BACKEND, VECTOR_STORAGE, HIERARCHICAL_DOCUMENTS, INT8_RERANK_CANDIDATES
+from database.vector_index import memory_index, as_query_vector, normalize_rows, top_k_indices
+from database.index_binary import binary_index
+from database.index_int8 import int8_index
+from database.index_ivf import ivf_index
+from database.index_hnsw import hnsw_index
+from database.index_pq import pq_index
+from database.index_generation import sync_generation
+from database.search_cache import search_cache
+from database.quantization import float32_blob, quantize_int8, decode_vector_blobs, db_get_quantization
+from database.shards import gather_shards, group_by_shard
+from database.connection_pool import connection_pool
 
 
 
-async def db_get_vector_list(query_vector: list[float], amount: int) -> list[dict]:
-    async with aiosqlite.connect(LOCAL_DB_PATH) as conn:
-        await conn._execute(conn._conn.enable_load_extension, True)
-        await conn._execute(sqlite_vec.load, conn._conn)
+async def _db_knn_shard(
+    db_path: str,
+    query_vector: np.ndarray,
+    amount: int,
+    document_ids: Optional[list[str]] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None
+) -> list[dict]:
+    async with connection_pool.reader(db_path) as conn:
+        if VECTOR_STORAGE == "int8":
+            # sqlite-vec compares the raw codes, blind to the per-dimension scale and offset: its KNN only
+            # shortlists candidates, rescored below on the decoded vectors
+            scale, offset = await db_get_quantization(conn)
+            match, k = "vec_int8(?)", max(amount, INT8_RERANK_CANDIDATES)
+            query_vector_blob = quantize_int8(as_query_vector(query_vector), scale, offset).tobytes()
+        else:
+            # sqlite-vec reads the float32 query straight from the array's memory
+            match, query_vector_blob, k = "?", float32_blob(query_vector), amount
+
+        # Filters are pushed down into vec0: upload_date is a metadata column
+        filter_conditions = [f"piv.vector_data MATCH {match}", "k = ?"]
+        filter_params = [query_vector_blob, k]
+        if date_from:
+            filter_conditions.append("piv.upload_date >= ?")
+            filter_params.append(date_from)
+        if date_to:
+            filter_conditions.append("piv.upload_date <= ?")
+            filter_params.append(date_to)
 
-        conn.row_factory = aiosqlite.Row
-        # Enable sqlite-vec extension
-        await conn.execute("SELECT vec_version();")
-        
-        # Convert query_vector to blob for sqlite-vec
-        query_vector_blob = np.array(query_vector, dtype=np.float32).tobytes()
-        
-        query = """
-            SELECT 
-                piv.page_id,
-                1 - vec_distance_cosine(piv.vector_data, ?) as similarity
-            FROM page_images_vectors piv
-            ORDER BY vec_distance_cosine(piv.vector_data, ?)
-            LIMIT ?
-        """
-        params = (query_vector_blob, query_vector_blob, amount)
-        
         try:
-            async with conn.execute(query, params) as cursor:
-                results = await cursor.fetchall()
-                return [{'page_id': row['page_id'], 'similarity': row['similarity']} for row in results]
+            rows = []
+            # document_id is the partition key, so each document only scans its own vectors
+            for document_id in (document_ids or [None]):
+                conditions, params = list(filter_conditions), list(filter_params)
+                if document_id is not None:
+                    conditions.append("piv.document_id = ?")
+                    params.append(document_id)
+
+                query = f"""
+                    SELECT
+                        piv.page_id,
+                        1 - piv.distance as similarity
+                        {", piv.vector_data" if VECTOR_STORAGE == "int8" else ""}
+                    FROM page_images_vectors piv
+                    WHERE {" AND ".join(conditions)}
+                    ORDER BY piv.distance
+                """
+                async with conn.execute(query, params) as cursor:
+                    rows.extend(await cursor.fetchall())
+            if VECTOR_STORAGE != "int8" or not rows:
+                return [{'page_id': row['page_id'], 'similarity': row['similarity']} for row in rows]
+
+            matrix = normalize_rows(await decode_vector_blobs(conn, [row['vector_data'] for row in rows]))
         except Exception as e:
-            print(f"Database query failed: {e}")
+            print(f"Database query failed on {db_path}: {e}")
             raise
-        finally:
-            await conn._execute(conn._conn.enable_load_extension, False)
\ No newline at end of file
+
+    scores = matrix @ as_query_vector(query_vector, matrix.shape[1])
+    return [{'page_id': rows[i]['page_id'], 'similarity': float(scores[i])} for i in top_k_indices(scores, amount)]
+
+
+
+async def db_knn_vector_list(
+    query_vector: np.ndarray,
+    amount: int,
+    document_ids: Optional[list[str]] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None
+) -> list[dict]:
+    if document_ids:
+        # Only the shards owning the requested documents are scanned
+        shard_documents = group_by_shard(document_ids)
+        shard_results = await asyncio.gather(*(
+            _db_knn_shard(db_path, query_vector, amount, shard_document_ids, date_from, date_to)
+            for db_path, shard_document_ids in shard_documents.items()
+        ))
+    else:
+        shard_results = await gather_shards(_db_knn_shard, query_vector, amount, None, date_from, date_to)
+
+    # Merge the per-shard top-k into the global top-k
+    results = [result for shard_result in shard_results for result in shard_result]
+    results.sort(key=lambda result: result['similarity'], reverse=True)
+    return results[:amount]
+
+
+
+async def _db_knn_document_shard(db_path: str, query_vector_blob: memoryview, amount: int) -> list[dict]:
+    async with connection_pool.reader(db_path) as conn:
+        query = """
+            SELECT
+                dv.document_id,
+                1 - dv.distance as similarity
+            FROM documents_vectors dv
+            WHERE dv.vector_data MATCH ? AND k = ?
+            ORDER BY dv.distance
+        """
+        async with conn.execute(query, (query_vector_blob, amount)) as cursor:
+            return [{'document_id': row['document_id'], 'similarity': row['similarity']} for row in await cursor.fetchall()]
+
+
+async def db_knn_document_list(query_vector: np.ndarray, amount: int) -> list[dict]:
+    """Closest documents by their mean page vector"""
+    query_vector_blob = float32_blob(query_vector)
+    shard_results = await gather_shards(_db_knn_document_shard, query_vector_blob, amount)
+    results = [result for shard_result in shard_results for result in shard_result]
+    results.sort(key=lambda result: result['similarity'], reverse=True)
+    return results[:amount]
+
+
+
+async def _db_get_shard_documents_without_vector(db_path: str) -> list[str]:
+    async with connection_pool.reader(db_path) as conn:
+        # processed_pages > 0: documents whose pages have no vector yet have nothing to search either
+        query = """
+            SELECT d.document_id
+            FROM documents d
+            WHERE d.processed_pages > 0
+              AND NOT EXISTS (SELECT 1 FROM documents_vectors dv WHERE dv.document_id = d.document_id)
+        """
+        async with conn.execute(query) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+
+async def db_hierarchical_vector_list(query_vector: np.ndarray, amount: int, documents: int = HIERARCHICAL_DOCUMENTS) -> list[dict]:
+    """Two-level search: pick the closest documents, then rank pages within those documents only,
+    so the work per query grows with the number of documents rather than pages. Documents without a
+    document vector yet (being ingested, or a page was deleted since) are searched page by page."""
+    top_documents, shard_missing = await asyncio.gather(
+        db_knn_document_list(query_vector, documents),
+        gather_shards(_db_get_shard_documents_without_vector)
+    )
+    missing = [document_id for shard_document_ids in shard_missing for document_id in shard_document_ids]
+    if len(missing) > documents:
+        # More documents to go through than the document level narrows down to: one KNN over every page
+        return await db_knn_vector_list(query_vector, amount)
+    document_ids = [document['document_id'] for document in top_documents] + missing
+    if not document_ids:
+        return []
+    return await db_knn_vector_list(query_vector, amount, document_ids)
+
+
+
+async def db_get_vector_list(
+    query_vector: np.ndarray,
+    amount: int,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    document_ids: Optional[list[str]] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None
+) -> list[dict]:
+    # Results stay valid until the next vector write bumps the index generation
+    generation = await sync_generation()
+    cache_key = _search_cache_key(query_vector, amount, nprobe, ef_search, document_ids, date_from, date_to)
+    cached_results = search_cache.get(cache_key, generation)
+    if cached_results is not None:
+        return cached_results
+
+    results = await _db_search_vector_list(query_vector, amount, nprobe, ef_search, document_ids, date_from, date_to)
+    search_cache.put(cache_key, generation, results)
+    return results
+
+
+
+def _search_cache_key(
+    query_vector: np.ndarray,
+    amount: int,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    document_ids: Optional[list[str]] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None
+) -> tuple:
+    return search_cache.make_key(
+        query_vector, amount,
+        backend=SEARCH_BACKEND, nprobe=nprobe, ef_search=ef_search,
+        document_ids=document_ids, date_from=date_from, date_to=date_to
+    )
+
+
+
+async def _db_search_vector_list(
+    query_vector: np.ndarray,
+    amount: int,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    document_ids: Optional[list[str]] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None
+) -> list[dict]:
+    # Scoped queries go to the partitioned KNN, which never touches the rest of the corpus
+    if document_ids or date_from or date_to:
+        return await db_knn_vector_list(query_vector, amount, document_ids, date_from, date_to)
+
+    if SEARCH_BACKEND == "memory":
+        return await memory_index.search(query_vector, amount)
+    if SEARCH_BACKEND == "cascade":
+        return await memory_index.cascade_search(query_vector, amount)
+    if SEARCH_BACKEND == "binary":
+        return await binary_index.search(query_vector, amount)
+    if SEARCH_BACKEND == "int8":
+        return await int8_index.search(query_vector, amount)
+    if SEARCH_BACKEND == "ivf":
+        return await ivf_index.search(query_vector, amount, nprobe)
+    if SEARCH_BACKEND == "hnsw":
+        return await hnsw_index.search(query_vector, amount, ef_search)
+    if SEARCH_BACKEND == "pq":
+        return await pq_index.search(query_vector, amount)
+    if SEARCH_BACKEND == "sqlite":
+        return await db_knn_vector_list(query_vector, amount)
+    if SEARCH_BACKEND == "hierarchical":
+        return await db_hierarchical_vector_list(query_vector, amount)
+    raise ValueError(f"Unknown search backend: {SEARCH_BACKEND}")
+
+
+
+async def db_get_vector_list_batch(query_vectors: list[np.ndarray], amount: int) -> list[list[dict]]:
+    # Same generation check and result cache as db_get_vector_list, only the misses are searched
+    generation = await sync_generation()
+    cache_keys = [_search_cache_key(query_vector, amount) for query_vector in query_vectors]
+    results = [search_cache.get(cache_key, generation) for cache_key in cache_keys]
+    missing = [i for i, cached_results in enumerate(results) if cached_results is None]
+    if not missing:
+        return results
+
+    if SEARCH_BACKEND == "memory":
+        found = await memory_index.search_batch([query_vectors[i] for i in missing], amount)
+    else:
+        # The other backends answer one query at a time
+        found = [await _db_search_vector_list(query_vectors[i], amount) for i in missing]
+
+    for i, query_results in zip(missing, found):
+        search_cache.put(cache_keys[i], generation, query_results)
+        results[i] = query_results
+    return results
@@ -1,9 +1,10 @@
 # database/getters_status.py
 
 from typing import Optional, Dict, Any
-import aiosqlite, sqlite_vec, time
+import time
 
-from config import LOCAL_DB_PATH
+from database.shards import document_db_path
+from database.connection_pool import connection_pool
 
 
 
@@ -56,25 +57,17 @@ async def get_document_processing_status(embedding_queue, document_id: str) -> O
     
     if not is_in_progress:
         # Check database for completed document
-        async with aiosqlite.connect(LOCAL_DB_PATH) as conn:
-            await conn._execute(conn._conn.enable_load_extension, True)
-            await conn._execute(sqlite_vec.load, conn._conn)
-
+        async with connection_pool.reader(document_db_path(document_id)) as conn:
+            # The counters are kept current by triggers on the vector, fingerprint and page tables
             query = """
-                SELECT 
-                    d.total_pages,
-                    (SELECT COUNT(*) FROM page_images_vectors piv 
-                     WHERE piv.page_id IN (
-                         SELECT pi.page_id FROM page_images pi 
-                         WHERE pi.document_id = d.document_id
-                     )) as processed_pages
-                FROM documents d
-                WHERE d.document_id = ?
+                SELECT total_pages, processed_pages, failed_pages
+                FROM documents
+                WHERE document_id = ?
             """
             async with conn.execute(query, (document_id,)) as cursor:
                 record = await cursor.fetchone()
                 if record:
-                    total_pages, processed_pages = record
+                    total_pages, processed_pages, failed_pages = record
                     
                     # A document is considered complete if it has processed pages 
                     # and has been fully processed through the pipeline
@@ -84,9 +77,9 @@ async def get_document_processing_status(embedding_queue, document_id: str) -> O
                         "status": "completed" if is_complete else "not_found",
                         "total_pages": total_pages,
                         "processed_pages": processed_pages,
+                        "failed_pages": failed_pages,
                         "progress_percentage": round((processed_pages / total_pages) * 100, 2)
                     }
-            await conn._execute(conn._conn.enable_load_extension, False)
         return None
 
     # Document is currently being processed
@@ -100,6 +93,7 @@ async def get_document_processing_status(embedding_queue, document_id: str) -> O
         "status": "processing",
         "total_pages": total_pages,
         "processed_pages": processed_pages,
+        "failed_pages": len(set(embedding_queue.failed_pages.get(document_id, []))),  # a page is listed once per failed attempt
         "progress_percentage": round((processed_pages / total_pages) * 100, 2),
         "estimated_completion_time": estimated_time
     }
\ No newline at end of file
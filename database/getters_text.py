@@ -0,0 +1,71 @@
+# database/getters_text.py
+
+from typing import Optional
+import re
+
+from database.shards import gather_shards, group_by_shard
+from database.connection_pool import connection_pool
+
+
+
+def build_fts_query(text: str) -> Optional[str]:
+    """Turn free text into a safe FTS5 query: every word quoted, any of them may match (BM25 ranks the rest)"""
+    tokens = re.findall(r"\w+", text)
+    if not tokens:
+        return None
+    return " OR ".join(f'"{token}"' for token in dict.fromkeys(tokens))
+
+
+
+async def db_get_text_matches(
+    text: str,
+    amount: int,
+    document_ids: Optional[list[str]] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None
+) -> list[dict]:
+    """BM25 search over page_text and latex_code, best first (lower bm25 is better)"""
+    fts_query = build_fts_query(text)
+    if fts_query is None:
+        return []
+
+    conditions = ["page_images_fts MATCH ?"]
+    params = [fts_query]
+    if document_ids:
+        conditions.append(f"pi.document_id IN ({', '.join('?' for _ in document_ids)})")
+        params.extend(document_ids)
+    date_conditions = []
+    if date_from:
+        date_conditions.append("upload_date >= ?")
+        params.append(date_from)
+    if date_to:
+        date_conditions.append("upload_date <= ?")
+        params.append(date_to)
+    if date_conditions:
+        conditions.append(f"pi.document_id IN (SELECT document_id FROM documents WHERE {' AND '.join(date_conditions)})")
+    params.append(amount)
+
+    query = f"""
+        SELECT
+            pi.page_id,
+            bm25(page_images_fts) as score
+        FROM page_images_fts
+        JOIN page_images pi ON pi.rowid = page_images_fts.rowid
+        WHERE {" AND ".join(conditions)}
+        ORDER BY score
+        LIMIT ?
+    """
+    db_paths = list(group_by_shard(document_ids)) if document_ids else None
+    shard_results = await gather_shards(_db_run_text_query, query, params, db_paths=db_paths)
+
+    # BM25 statistics are per shard, close enough to merge on when documents are spread by hash
+    results = sorted((result for shard_result in shard_results for result in shard_result), key=lambda result: result['score'])
+    return results[:amount]
+
+
+
+async def _db_run_text_query(db_path: str, query: str, params: list) -> list[dict]:
+    async with connection_pool.reader(db_path) as conn:
+        async with conn.execute(query, params) as cursor:
+            rows = await cursor.fetchall()
+            return [{'page_id': row['page_id'], 'score': row['score']} for row in rows]
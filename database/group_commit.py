@@ -0,0 +1,103 @@
+# database/group_commit.py
+
+from typing import Any, Awaitable, Callable
+from datetime import datetime
+import aiosqlite, asyncio, time
+
+from config import WRITE_BATCH_SIZE, WRITE_BATCH_DELAY_MS
+from database.connection_pool import connection_pool
+from database.vector_index import invalidate_indexes
+
+
+
+WriteOperation = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+
+
+class GroupCommitWriter:
+    """A single writer task that coalesces queued writes into one transaction per shard, so a batch of
+    pages costs one commit instead of one each. Every write gets a future resolved once its batch is committed."""
+
+    def __init__(self, batch_size: int = WRITE_BATCH_SIZE, batch_delay_ms: int = WRITE_BATCH_DELAY_MS):
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay_ms / 1000
+        self.queue: asyncio.Queue = None
+        self.task: asyncio.Task = None
+
+
+    def submit(self, db_path: str, operation: WriteOperation) -> asyncio.Future:
+        """Queue `operation(conn)` for the next batch on `db_path`, the future carries its result"""
+        if self.task is None or self.task.done():
+            self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self._run())
+            print(f"[{datetime.now()}] Started group-commit writer")
+
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((db_path, operation, future))
+        return future
+
+
+    async def _next_batch(self) -> list[tuple[str, WriteOperation, asyncio.Future]]:
+        """Wait for a first write, then collect more until the batch is full or the delay has passed"""
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.batch_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+
+    async def _commit_shard(self, db_path: str, writes: list[tuple[WriteOperation, asyncio.Future]]) -> None:
+        results = []
+        try:
+            async with connection_pool.writer(db_path) as conn:
+                await conn.execute("BEGIN")
+                for operation, future in writes:
+                    # A savepoint per write, so one failing write does not discard the rest of the batch
+                    await conn.execute("SAVEPOINT batched_write")
+                    try:
+                        results.append((future, await operation(conn), None))
+                        await conn.execute("RELEASE batched_write")
+                    except Exception as e:
+                        await conn.execute("ROLLBACK TO batched_write")
+                        await conn.execute("RELEASE batched_write")
+                        results.append((future, None, e))
+        except Exception as e:
+            print(f"[{datetime.now()}] Group commit of {len(writes)} writes to {db_path} failed: {str(e)}")
+            for _, future in writes:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # Committed: only now do the writers learn their rows are durable
+        for future, result, error in results:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+
+            shards: dict[str, list[tuple[WriteOperation, asyncio.Future]]] = {}
+            for db_path, operation, future in batch:
+                shards.setdefault(db_path, []).append((operation, future))
+
+            start = time.time()
+            for db_path, writes in shards.items():
+                await self._commit_shard(db_path, writes)
+            invalidate_indexes()
+            print(f"[{datetime.now()}] Committed {len(batch)} writes over {len(shards)} shard(s) in {time.time() - start:.3f}s")
+
+
+
+group_writer = GroupCommitWriter()
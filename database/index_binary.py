@@ -0,0 +1,74 @@
+# database/index_binary.py
+
+from datetime import datetime
+import asyncio
+import numpy as np
+
+from config import BINARY_CANDIDATES
+from database.vector_index import as_query_vector, top_k_indices, db_load_search_vectors, db_load_vectors_by_ids, register_index
+
+
+
+def pack_sign_bits(matrix: np.ndarray) -> np.ndarray:
+    """Quantize each value to its sign and pack 8 dimensions per byte (1536 floats -> 192 bytes)"""
+    return np.packbits(np.atleast_2d(matrix) > 0, axis=1)
+
+
+
+class BinaryIndex:
+    """Hamming-distance prefilter over packed sign bits, reranked with the stored float vectors.
+    Unlike MemoryIndex it has no delta segment: any vector write re-encodes every vector on the next search."""
+
+    def __init__(self):
+        self.page_ids: list[str] = []
+        self.codes = np.empty((0, 0), dtype=np.uint8)
+        self.dim = 0
+        self.lock = asyncio.Lock()
+        self.stale = True
+
+
+    def invalidate(self):
+        """Force a rebuild from the database on the next search"""
+        self.stale = True
+
+
+    async def ensure_loaded(self):
+        """Build the packed bit codes from the database if they are missing or out of date"""
+        if not self.stale:
+            return
+
+        async with self.lock:
+            if not self.stale:
+                return
+            start = datetime.now()
+            page_ids, matrix = await db_load_search_vectors()
+            # Only the bit codes are kept; floats are fetched back from SQLite for the rerank
+            self.page_ids = page_ids
+            self.dim = matrix.shape[1]
+            self.codes = pack_sign_bits(matrix)
+            self.stale = False
+            print(f"[{datetime.now()}] Built binary codes for {len(page_ids)} pages ({self.codes.nbytes / 1e6:.1f} MB) in {(datetime.now() - start).total_seconds():.2f}s")
+
+
+    async def search(self, query_vector, amount: int, candidates: int = BINARY_CANDIDATES) -> list[dict]:
+        await self.ensure_loaded()
+        if not self.page_ids:
+            return []
+
+        query = as_query_vector(query_vector, self.dim)
+
+        # Prefilter: fewest differing sign bits first
+        distances = np.bitwise_count(self.codes ^ pack_sign_bits(query)).sum(axis=1, dtype=np.int32)
+        shortlist = top_k_indices(-distances, max(candidates, amount))
+
+        # Rerank: exact cosine against the float vectors in page_images_vectors
+        page_ids, vectors = await db_load_vectors_by_ids([self.page_ids[i] for i in shortlist])
+        if not page_ids:
+            return []
+        scores = vectors @ query
+        best = top_k_indices(scores, amount)
+        return [{'page_id': page_ids[i], 'similarity': float(scores[i])} for i in best]
+
+
+
+binary_index = register_index(BinaryIndex())
@@ -0,0 +1,43 @@
+# database/index_generation.py
+
+import aiosqlite
+
+from database.schema import BUMP_GENERATION_SQL
+from database.vector_index import invalidate_indexes
+from database.shards import gather_shards
+from database.connection_pool import connection_pool
+
+
+
+_last_seen_generation = None
+
+
+
+async def db_bump_generation(conn: aiosqlite.Connection) -> None:
+    """Bump the generation inside the caller's write transaction"""
+    await conn.execute(BUMP_GENERATION_SQL)
+
+
+
+async def _db_get_shard_generation(db_path: str) -> int:
+    async with connection_pool.reader(db_path) as conn:
+        async with conn.execute("SELECT generation FROM index_generation WHERE id = 1") as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else 0
+
+
+async def db_get_generation() -> int:
+    """Sum of the shard generations: every counter only grows, so any write anywhere changes the sum"""
+    return sum(await gather_shards(_db_get_shard_generation))
+
+
+
+async def sync_generation() -> int:
+    """Read the current generation and mark the in-memory indexes stale if another writer moved it"""
+    global _last_seen_generation
+    generation = await db_get_generation()
+    if generation != _last_seen_generation:
+        if _last_seen_generation is not None:
+            invalidate_indexes()
+        _last_seen_generation = generation
+    return generation
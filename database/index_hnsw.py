@@ -0,0 +1,327 @@
+# database/index_hnsw.py
+
+from typing import Optional
+from datetime import datetime
+import asyncio, heapq, os
+import numpy as np
+
+from config import HNSW_INDEX_PATH, HNSW_M, HNSW_EF_CONSTRUCTION, HNSW_EF_SEARCH, HNSW_SAVE_EVERY
+from database.vector_index import as_query_vector, normalize_rows, db_get_vector_page_ids, db_load_vectors_by_ids, db_read_shard_delta, db_get_vector_log_marks, register_index
+from database.shards import all_db_paths
+
+
+
+class HNSWIndex:
+    """Hierarchical navigable small world graph over page vectors, updated in place as pages are stored"""
+
+    def __init__(self, path: str = HNSW_INDEX_PATH, m: int = HNSW_M, ef_construction: int = HNSW_EF_CONSTRUCTION, ef_search: int = HNSW_EF_SEARCH):
+        self.path = path
+        self.m = m
+        self.m0 = 2 * m  # the bottom layer holds every node and gets twice the links
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.level_mult = 1 / np.log(m)
+        self.rng = np.random.default_rng()
+
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        self.count = 0
+        self.page_ids: list[str] = []
+        self.node_of: dict[str, int] = {}
+        self.links: list[list[list[int]]] = []  # links[node][level] -> neighbour nodes
+        self.deleted: set[int] = set()  # tombstoned nodes: still traversed, never returned
+        self.entry_point: Optional[int] = None
+        self.max_level = -1
+
+        self.lock = asyncio.Lock()
+        self.opened = False  # the index file was read
+        self.loaded = False  # the graph matches page_images_vectors
+        self.high_water: Optional[dict[str, int]] = None  # last page_vector_log seq applied, per shard
+        self.unsaved = 0
+
+
+    def invalidate(self):
+        """Check the graph against the database again on the next search"""
+        self.loaded = False
+
+
+    def _distances(self, query: np.ndarray, nodes: list[int]) -> np.ndarray:
+        return 1.0 - self.vectors[nodes] @ query
+
+
+    def _search_layer(self, query: np.ndarray, entry_points: list[int], ef: int, level: int) -> list[tuple[float, int]]:
+        """Best-first beam search on one layer, returns up to `ef` (distance, node) pairs, closest first"""
+        visited = set(entry_points)
+        entry_distances = self._distances(query, entry_points).tolist()
+        candidates = list(zip(entry_distances, entry_points))
+        heapq.heapify(candidates)
+        results = [(-dist, node) for dist, node in candidates]  # max-heap on distance
+        heapq.heapify(results)
+
+        while candidates:
+            dist, node = heapq.heappop(candidates)
+            if dist > -results[0][0] and len(results) >= ef:
+                break
+
+            neighbours = [n for n in self.links[node][level] if n not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+
+            for n_dist, n in zip(self._distances(query, neighbours).tolist(), neighbours):
+                if len(results) < ef or n_dist < -results[0][0]:
+                    heapq.heappush(candidates, (n_dist, n))
+                    heapq.heappush(results, (-n_dist, n))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+
+        return sorted((-neg_dist, node) for neg_dist, node in results)
+
+
+    def _select_neighbours(self, candidates: list[tuple[float, int]], m: int) -> list[int]:
+        """Neighbour-selection heuristic: skip candidates closer to an already kept neighbour than to the base"""
+        selected, pruned = [], []
+        for dist, node in candidates:
+            if len(selected) >= m:
+                break
+            if not selected or np.all(self._distances(self.vectors[node], selected) > dist):
+                selected.append(node)
+            else:
+                pruned.append(node)
+        # Keep pruned connections to fill up the list
+        return selected + pruned[:m - len(selected)]
+
+
+    def _grow(self, dim: int):
+        if self.count == 0 and self.vectors.shape[1] != dim:
+            self.vectors = np.empty((1024, dim), dtype=np.float32)
+        elif self.vectors.shape[1] != dim:
+            # Reallocating would silently drop every node and link of the graph
+            raise ValueError(f"Vector dimension {dim} does not match the HNSW index dimension {self.vectors.shape[1]}, "
+                             f"rebuild the index with admin/build_hnsw_index.py --rebuild")
+        elif self.count == len(self.vectors):
+            grown = np.empty((2 * len(self.vectors), dim), dtype=np.float32)
+            grown[:self.count] = self.vectors[:self.count]
+            self.vectors = grown
+
+
+    def _insert(self, page_id: str, vector: np.ndarray):
+        self._grow(len(vector))
+        if page_id in self.node_of:
+            # Re-embedded or restored page: update the vector, its links are still a good approximation
+            node = self.node_of[page_id]
+            self.vectors[node] = vector
+            self.deleted.discard(node)
+            return
+
+        node = self.count
+        self.vectors[node] = vector
+        self.count += 1
+
+        level = int(-np.log(1.0 - self.rng.random()) * self.level_mult)
+        self.page_ids.append(page_id)
+        self.node_of[page_id] = node
+        self.links.append([[] for _ in range(level + 1)])
+
+        if self.entry_point is None:
+            self.entry_point, self.max_level = node, level
+            return
+
+        # Greedy descent through the layers above the new node's level
+        entry = [self.entry_point]
+        for lvl in range(self.max_level, level, -1):
+            entry = [self._search_layer(vector, entry, 1, lvl)[0][1]]
+
+        for lvl in range(min(level, self.max_level), -1, -1):
+            candidates = self._search_layer(vector, entry, self.ef_construction, lvl)
+            max_links = self.m0 if lvl == 0 else self.m
+            self.links[node][lvl] = self._select_neighbours(candidates, self.m)
+
+            for neighbour in self.links[node][lvl]:
+                neighbour_links = self.links[neighbour][lvl]
+                neighbour_links.append(node)
+                if len(neighbour_links) > max_links:
+                    dists = self._distances(self.vectors[neighbour], neighbour_links)
+                    ranked = [(dists[i], neighbour_links[i]) for i in np.argsort(dists)]
+                    self.links[neighbour][lvl] = self._select_neighbours(ranked, max_links)
+
+            entry = [n for _, n in candidates]
+
+        if level > self.max_level:
+            self.entry_point, self.max_level = node, level
+
+
+    def _load(self):
+        with np.load(self.path) as data:
+            self.vectors = data["vectors"].copy()
+            self.page_ids = data["page_ids"].tolist()
+            levels = data["levels"].tolist()
+            link_counts = data["link_counts"].tolist()
+            links = data["links"].tolist()
+            self.m, self.ef_construction = (int(v) for v in data["params"])
+            self.entry_point = int(data["entry_point"]) if len(self.page_ids) else None
+            self.deleted = set(data["deleted"].tolist()) if "deleted" in data.files else set()
+            log_marks = data["log_marks"].tolist() if "log_marks" in data.files else None
+
+        self.m0 = 2 * self.m
+        self.level_mult = 1 / np.log(self.m)
+        self.count = len(self.page_ids)
+        self.node_of = {page_id: node for node, page_id in enumerate(self.page_ids)}
+        self.max_level = max(levels, default=-1)
+        # Files from before the log, or saved with another shard layout, are checked against every page_id once
+        db_paths = all_db_paths()
+        self.high_water = dict(zip(db_paths, log_marks)) if log_marks is not None and len(log_marks) == len(db_paths) else None
+
+        self.links, position, slot = [], 0, 0
+        for level in levels:
+            node_links = []
+            for _ in range(level + 1):
+                node_links.append(links[position:position + link_counts[slot]])
+                position += link_counts[slot]
+                slot += 1
+            self.links.append(node_links)
+
+        print(f"[{datetime.now()}] Loaded HNSW index with {self.count} pages from {self.path}")
+
+
+    async def save(self):
+        """Write the graph to disk (flattened adjacency lists) without blocking the event loop"""
+        link_counts, links = [], []
+        for node_links in self.links:
+            for level_links in node_links:
+                link_counts.append(len(level_links))
+                links.extend(level_links)
+
+        # Snapshot now, the graph keeps changing while the file is written
+        snapshot = {
+            "vectors": self.vectors[:self.count].copy(),
+            "page_ids": np.array(self.page_ids),
+            "levels": np.array([len(node_links) - 1 for node_links in self.links], dtype=np.int32),
+            "link_counts": np.array(link_counts, dtype=np.int32),
+            "links": np.array(links, dtype=np.int64),
+            "params": np.array([self.m, self.ef_construction]),
+            "entry_point": np.array(self.entry_point if self.entry_point is not None else -1),
+            "deleted": np.array(sorted(self.deleted), dtype=np.int64),
+            "log_marks": np.array([self.high_water.get(db_path, 0) for db_path in all_db_paths()] if self.high_water is not None else [], dtype=np.int64)
+        }
+        self.unsaved = 0
+
+        def write_file():
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "wb") as f:
+                np.savez(f, **snapshot)
+            os.replace(temp_path, self.path)
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, write_file)
+        print(f"[{datetime.now()}] Saved HNSW index with {len(snapshot['page_ids'])} pages to {self.path}")
+
+
+    def _tombstone(self, page_ids: list[str]) -> int:
+        deleted = {self.node_of[page_id] for page_id in page_ids if page_id in self.node_of} - self.deleted
+        self.deleted |= deleted
+        return len(deleted)
+
+
+    async def _sync_all(self, batch_size: int = 1000):
+        """Compare the graph with every stored page_id: for a new index, or a file saved without log marks"""
+        # Marks first: pages written during the comparison are logged after them and come back in the next catch-up
+        marks = await db_get_vector_log_marks()
+        stored = await db_get_vector_page_ids()
+        stored_set = set(stored)
+        deleted = self._tombstone([page_id for page_id in self.node_of if page_id not in stored_set])
+        if deleted:
+            print(f"[{datetime.now()}] Tombstoning {deleted} deleted pages in the HNSW index")
+
+        missing = [page_id for page_id in stored if page_id not in self.node_of or self.node_of[page_id] in self.deleted]
+        if missing:
+            print(f"[{datetime.now()}] Inserting {len(missing)} pages missing from the HNSW index")
+        for batch_start in range(0, len(missing), batch_size):
+            page_ids, vectors = await db_load_vectors_by_ids(missing[batch_start:batch_start + batch_size])
+            for page_id, vector in zip(page_ids, vectors):
+                self._insert(page_id, vector)
+
+        self.high_water = dict(zip(all_db_paths(), marks))
+        await self.save()
+
+
+    async def _sync(self):
+        """Tombstone the nodes of deleted pages and insert the pages written since the last sync, as logged in
+        page_vector_log past the seq reached on each shard. Nodes are never unlinked: the graph stays navigable
+        through them until the next --rebuild."""
+        if self.high_water is None:
+            await self._sync_all()
+            return
+
+        db_paths = all_db_paths()
+        shard_deltas = await asyncio.gather(*(db_read_shard_delta(db_path, self.high_water.get(db_path, 0)) for db_path in db_paths))
+        if any(self.high_water.get(db_path, 0) > high_water for db_path, (_, _, _, high_water) in zip(db_paths, shard_deltas)):
+            print(f"[{datetime.now()}] HNSW index is ahead of the database log, it was built from another one: checking every page")
+            await self._sync_all()
+            return
+
+        changes = 0
+        for db_path, (written, matrix, deleted, high_water) in zip(db_paths, shard_deltas):
+            changes += self._tombstone(deleted)
+            if written:
+                for page_id, vector in zip(written, normalize_rows(matrix)):
+                    self._insert(page_id, vector)
+                changes += len(written)
+            self.high_water[db_path] = high_water
+
+        self.unsaved += changes
+        if self.unsaved >= HNSW_SAVE_EVERY:
+            await self.save()
+
+
+    async def ensure_loaded(self):
+        """Load the graph from disk and bring it up to date with page_images_vectors"""
+        if self.loaded:
+            return
+
+        async with self.lock:
+            if self.loaded:
+                return
+            if not self.opened and os.path.exists(self.path):
+                self._load()
+            self.opened = True
+            await self._sync()
+            self.loaded = True
+
+
+    async def catch_up(self):
+        """Insert the pages stored so far, called by the embedding queue after its writes so that the graph
+        construction happens there rather than in the next search"""
+        self.invalidate()
+        await self.ensure_loaded()
+
+
+    async def flush(self):
+        """Save pending insertions, if any"""
+        if self.unsaved:
+            await self.save()
+
+
+    async def search(self, query_vector, amount: int, ef_search: Optional[int] = None) -> list[dict]:
+        await self.ensure_loaded()
+        if self.entry_point is None:
+            return []
+
+        query = as_query_vector(query_vector, self.vectors.shape[1])
+        ef = max(ef_search or self.ef_search, amount)
+
+        entry = [self.entry_point]
+        for lvl in range(self.max_level, 0, -1):
+            entry = [self._search_layer(query, entry, 1, lvl)[0][1]]
+
+        # Tombstoned nodes take up room in the beam, widen it until enough live pages come back
+        while True:
+            results = [(dist, node) for dist, node in self._search_layer(query, entry, ef, 0) if node not in self.deleted]
+            if len(results) >= amount or ef >= self.count:
+                break
+            ef *= 2
+
+        return [{'page_id': self.page_ids[node], 'similarity': 1.0 - dist} for dist, node in results[:amount]]
+
+
+
+hnsw_index = register_index(HNSWIndex())
@@ -0,0 +1,137 @@
+# database/index_int8.py
+
+from typing import Optional
+from datetime import datetime
+import asyncio
+import numpy as np
+
+from config import VECTOR_STORAGE, INT8_RERANK_CANDIDATES
+from database.quantization import db_get_quantization, calibrate_int8, quantize_int8, dequantize_int8
+from database.vector_index import as_query_vector, top_k_indices, db_load_search_vectors, db_load_vectors_by_ids, register_index
+from database.shards import gather_shards
+from database.connection_pool import connection_pool
+
+
+
+# Rows converted to float32 at a time by the scan: the buffer stays in cache, so the scan streams a quarter of
+# the bytes of a float32 matrix through a BLAS matrix-vector product (NumPy has no int8 GEMM, and widening whole
+# chunks to int32 made this backend several times slower than "memory")
+SCAN_CHUNK_ROWS = 256
+# Rows dequantized at a time when computing the norms on load
+NORM_CHUNK_ROWS = 65536
+
+
+
+async def _db_load_shard_int8_codes(db_path: str) -> tuple[list[str], list[bytes], np.ndarray, np.ndarray]:
+    async with connection_pool.reader(db_path) as conn:
+        scale, offset = await db_get_quantization(conn)
+        async with conn.execute("SELECT page_id, vector_data FROM page_images_vectors") as cursor:
+            rows = await cursor.fetchall()
+
+    return [row[0] for row in rows], [row[1] for row in rows], scale, offset
+
+
+async def db_load_int8_codes() -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray]:
+    """Read the int8 codes of every shard and their calibration as stored, without dequantizing them"""
+    shard_results = await gather_shards(_db_load_shard_int8_codes)
+    page_ids = [page_id for shard_page_ids, _, _, _ in shard_results for page_id in shard_page_ids]
+    blobs = [blob for _, shard_blobs, _, _ in shard_results for blob in shard_blobs]
+    _, _, scale, offset = shard_results[0]
+
+    if not page_ids:
+        return [], np.empty((0, 0), dtype=np.int8), scale, offset
+
+    codes = np.frombuffer(b"".join(blobs), dtype=np.int8)
+    return page_ids, codes.reshape(len(page_ids), -1).copy(), scale, offset
+
+
+
+class Int8Index:
+    """Cosine search over per-dimension int8 codes kept in RAM, a quarter of the memory of the float32 matrix.
+    It scans about as fast as the memory backend, not faster: the point is the memory, and an exact rerank
+    of a shortlist recovers the ranking lost to quantization. Unlike MemoryIndex it has no delta segment:
+    any vector write re-quantizes every vector on the next search."""
+
+    def __init__(self):
+        self.page_ids: list[str] = []
+        self.codes = np.empty((0, 0), dtype=np.int8)
+        self.scale = np.empty(0, dtype=np.float32)
+        self.offset = np.empty(0, dtype=np.float32)
+        self.norms = np.empty(0, dtype=np.float32)
+        self.lock = asyncio.Lock()
+        self.stale = True
+
+
+    def invalidate(self):
+        """Force a reload from the database on the next search"""
+        self.stale = True
+
+
+    async def ensure_loaded(self):
+        """Load the int8 codes, quantizing float32 storage in memory if needed"""
+        if not self.stale:
+            return
+
+        async with self.lock:
+            if not self.stale:
+                return
+            start = datetime.now()
+            if VECTOR_STORAGE == "int8":
+                self.page_ids, self.codes, self.scale, self.offset = await db_load_int8_codes()
+            else:
+                self.page_ids, matrix = await db_load_search_vectors()
+                self.scale, self.offset = calibrate_int8(matrix) if self.page_ids else (self.scale, self.offset)
+                self.codes = quantize_int8(matrix, self.scale, self.offset)
+
+            # Norms of the dequantized rows, to turn dot products into cosine similarities
+            self.norms = np.empty(len(self.page_ids), dtype=np.float32)
+            for chunk_start in range(0, len(self.page_ids), NORM_CHUNK_ROWS):
+                chunk = slice(chunk_start, chunk_start + NORM_CHUNK_ROWS)
+                self.norms[chunk] = np.linalg.norm(dequantize_int8(self.codes[chunk], self.scale, self.offset), axis=1)
+            self.norms[self.norms == 0] = 1.0
+
+            self.stale = False
+            print(f"[{datetime.now()}] Loaded int8 codes for {len(self.page_ids)} pages ({self.codes.nbytes / 1e6:.1f} MB) in {(datetime.now() - start).total_seconds():.2f}s")
+
+
+    def _scan(self, query: np.ndarray) -> np.ndarray:
+        """Cosine similarity of the dequantized rows to a normalized query"""
+        # x = codes * scale + offset, so x . q = codes . (scale * q) + offset . q
+        weights = (self.scale * query).astype(np.float32)
+        scores = np.empty(len(self.page_ids), dtype=np.float32)
+        buffer = np.empty((SCAN_CHUNK_ROWS, self.codes.shape[1]), dtype=np.float32)
+        for chunk_start in range(0, len(self.page_ids), SCAN_CHUNK_ROWS):
+            codes = self.codes[chunk_start:chunk_start + SCAN_CHUNK_ROWS]
+            rows = buffer[:len(codes)]
+            np.copyto(rows, codes, casting="unsafe")
+            np.dot(rows, weights, out=scores[chunk_start:chunk_start + len(codes)])
+        scores += np.float32(self.offset @ query)
+        scores /= self.norms
+        return scores
+
+
+    async def search(self, query_vector, amount: int, rerank_candidates: Optional[int] = INT8_RERANK_CANDIDATES) -> list[dict]:
+        await self.ensure_loaded()
+        if not self.page_ids:
+            return []
+
+        query = as_query_vector(query_vector, self.codes.shape[1])
+        scores = self._scan(query)
+
+        # With int8 storage the stored vectors are these same codes, so there is nothing more exact to rerank with
+        if not rerank_candidates or VECTOR_STORAGE == "int8":
+            best = top_k_indices(scores, amount)
+            return [{'page_id': self.page_ids[i], 'similarity': float(scores[i])} for i in best]
+
+        # Rerank: exact cosine against the float vectors in page_images_vectors
+        shortlist = top_k_indices(scores, max(rerank_candidates, amount))
+        page_ids, vectors = await db_load_vectors_by_ids([self.page_ids[i] for i in shortlist])
+        if not page_ids:
+            return []
+        exact_scores = vectors @ query
+        best = top_k_indices(exact_scores, amount)
+        return [{'page_id': page_ids[i], 'similarity': float(exact_scores[i])} for i in best]
+
+
+
+int8_index = register_index(Int8Index())
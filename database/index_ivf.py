@@ -0,0 +1,156 @@
+# database/index_ivf.py
+
+from typing import Optional
+from datetime import datetime
+import asyncio, os
+import numpy as np
+
+from config import IVF_INDEX_PATH, IVF_NPROBE
+from database.vector_index import as_query_vector, normalize_rows, top_k_indices, BuildDelta, register_index
+
+
+
+def default_ivf_lists(total_vectors: int) -> int:
+    """Rule of thumb: about 4 * sqrt(N) inverted lists"""
+    return max(1, min(total_vectors, int(4 * np.sqrt(total_vectors))))
+
+
+def train_ivf_centroids(matrix: np.ndarray, n_lists: int, iterations: int = 100, batch_size: int = 4096, seed: int = 0) -> np.ndarray:
+    """Spherical mini-batch k-means: centroids stay unit-norm so assignment is a dot product"""
+    rng = np.random.default_rng(seed)
+    centroids = matrix[rng.choice(len(matrix), size=n_lists, replace=False)].copy()
+    counts = np.zeros(n_lists, dtype=np.float64)
+
+    for _ in range(iterations):
+        batch = matrix[rng.choice(len(matrix), size=min(batch_size, len(matrix)), replace=False)]
+        assignments = np.argmax(batch @ centroids.T, axis=1)
+
+        batch_counts = np.bincount(assignments, minlength=n_lists)
+        batch_sums = np.zeros_like(centroids)
+        np.add.at(batch_sums, assignments, batch)
+
+        # Per-centroid learning rate 1 / (points seen so far), as in Sculley's mini-batch k-means
+        updated = batch_counts > 0
+        counts[updated] += batch_counts[updated]
+        rate = (batch_counts[updated] / counts[updated]).astype(np.float32)[:, None]
+        batch_means = batch_sums[updated] / batch_counts[updated][:, None]
+        centroids[updated] = (1 - rate) * centroids[updated] + rate * batch_means
+        normalize_rows(centroids)
+
+    return centroids
+
+
+def assign_to_lists(matrix: np.ndarray, centroids: np.ndarray, chunk_rows: int = 65536) -> np.ndarray:
+    assignments = np.empty(len(matrix), dtype=np.int64)
+    for chunk_start in range(0, len(matrix), chunk_rows):
+        chunk = slice(chunk_start, chunk_start + chunk_rows)
+        assignments[chunk] = np.argmax(matrix[chunk] @ centroids.T, axis=1)
+    return assignments
+
+
+
+def build_ivf_index(page_ids: list[str], matrix: np.ndarray, log_marks: list[int], n_lists: Optional[int] = None, iterations: int = 100, batch_size: int = 4096, path: str = IVF_INDEX_PATH) -> None:
+    """Train the centroids, group the vectors by list and save everything next to the database, with the
+    page_vector_log marks (db_get_vector_log_marks() read before the vectors) the searches catch up from"""
+    n_lists = n_lists or default_ivf_lists(len(page_ids))
+    centroids = train_ivf_centroids(matrix, n_lists, iterations, batch_size)
+    assignments = assign_to_lists(matrix, centroids)
+
+    # Store vectors grouped by list so that each posting list is one contiguous slice
+    order = np.argsort(assignments, kind="stable")
+    list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+    list_offsets[1:] = np.cumsum(np.bincount(assignments, minlength=n_lists))
+
+    # Write to a temporary file first so search processes never load a half-written index
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        np.savez(
+            f,
+            centroids=centroids,
+            list_offsets=list_offsets,
+            vectors=np.ascontiguousarray(matrix[order]),
+            page_ids=np.array(page_ids)[order],
+            log_marks=np.array(log_marks, dtype=np.int64)
+        )
+    os.replace(temp_path, path)
+    print(f"[{datetime.now()}] Saved IVF index with {n_lists} lists over {len(page_ids)} pages to {path}")
+
+
+
+class IVFIndex:
+    """Inverted-file index: only the vectors of the `nprobe` closest lists are scored"""
+
+    def __init__(self, path: str = IVF_INDEX_PATH):
+        self.path = path
+        self.page_ids = np.empty(0, dtype=str)
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+        self.list_offsets = np.zeros(1, dtype=np.int64)
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        self.log_marks: Optional[list[int]] = None
+        self.delta = BuildDelta()
+        self.loaded_mtime = None
+        self.lock = asyncio.Lock()
+        self.stale = True
+
+
+    def invalidate(self):
+        """Fetch the pages written or deleted since the build on the next search"""
+        self.stale = True
+
+
+    async def ensure_loaded(self):
+        """(Re)load the index file if it was rebuilt since the last load, then catch up with page_vector_log"""
+        if not os.path.exists(self.path):
+            raise ValueError(f"No IVF index at {self.path}, build it with admin/build_ivf_index.py")
+
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.loaded_mtime and not self.stale:
+            return
+
+        async with self.lock:
+            if mtime == self.loaded_mtime and not self.stale:
+                return
+            # Cleared first, so a write landing during the refresh is fetched by the next one
+            self.stale = False
+            try:
+                if mtime != self.loaded_mtime:
+                    self._load(mtime)
+                    if not await self.delta.reset(self.log_marks):
+                        self.loaded_mtime = None
+                        raise ValueError(f"IVF index at {self.path} has no log marks for this database, rebuild it with admin/build_ivf_index.py")
+                else:
+                    await self.delta.refresh()
+            except BaseException:
+                self.stale = True
+                raise
+
+
+    def _load(self, mtime: float):
+        with np.load(self.path) as data:
+            self.centroids = data["centroids"]
+            self.list_offsets = data["list_offsets"]
+            self.vectors = data["vectors"]
+            self.page_ids = data["page_ids"]
+            self.log_marks = data["log_marks"].tolist() if "log_marks" in data.files else None
+        self.loaded_mtime = mtime
+        print(f"[{datetime.now()}] Loaded IVF index with {len(self.centroids)} lists over {len(self.page_ids)} pages")
+
+
+    async def search(self, query_vector, amount: int, nprobe: Optional[int] = None) -> list[dict]:
+        await self.ensure_loaded()
+        if not len(self.page_ids):
+            return self.delta.merge([], as_query_vector(query_vector), amount) if self.delta.page_ids else []
+
+        query = as_query_vector(query_vector, self.vectors.shape[1])
+        probed_lists = top_k_indices(self.centroids @ query, nprobe or IVF_NPROBE)
+
+        rows = np.concatenate([np.arange(self.list_offsets[i], self.list_offsets[i + 1]) for i in probed_lists])
+        scores = np.concatenate([self.vectors[self.list_offsets[i]:self.list_offsets[i + 1]] @ query for i in probed_lists])
+
+        # Deep enough that `amount` results remain once the pages changed since the build are dropped
+        best = top_k_indices(scores, amount + len(self.delta.changed))
+        return self.delta.merge([(str(self.page_ids[rows[i]]), float(scores[i])) for i in best], query, amount)
+
+
+
+ivf_index = register_index(IVFIndex())
@@ -0,0 +1,185 @@
+# database/index_pq.py
+
+from typing import Optional
+from datetime import datetime
+import asyncio, os
+import numpy as np
+
+from config import PQ_INDEX_PATH, PQ_SUBVECTORS, PQ_RERANK_CANDIDATES
+from database.vector_index import as_query_vector, top_k_indices, db_load_vectors_by_ids, BuildDelta, register_index
+
+
+
+# Rows gathered from the lookup tables at a time, bounds the temporary memory of the scan
+SCAN_CHUNK_ROWS = 65536
+
+
+
+def train_kmeans(points: np.ndarray, n_centroids: int, iterations: int = 25, seed: int = 0) -> np.ndarray:
+    """Plain Lloyd k-means (squared L2), used for each sub-quantizer"""
+    rng = np.random.default_rng(seed)
+    centroids = points[rng.choice(len(points), size=n_centroids, replace=len(points) < n_centroids)].copy()
+
+    for _ in range(iterations):
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2, and ||x||^2 does not change the argmin
+        assignments = np.argmin((centroids ** 2).sum(axis=1) - 2 * points @ centroids.T, axis=1)
+        counts = np.bincount(assignments, minlength=n_centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, points)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled][:, None]
+        # Re-seed empty centroids on random points
+        empty = np.flatnonzero(~filled)
+        centroids[empty] = points[rng.choice(len(points), size=len(empty))]
+
+    return centroids
+
+
+def pq_subvector_count(dim: int, max_subvectors: int = PQ_SUBVECTORS) -> int:
+    """Largest number of sub-vectors up to `max_subvectors` that divides the vector dimension,
+    e.g. 96 for 1536 or 768 dimensions but 64 for 512 or 256"""
+    return max(n for n in range(1, min(max_subvectors, dim) + 1) if dim % n == 0)
+
+
+def train_pq_codebooks(matrix: np.ndarray, n_subvectors: int = PQ_SUBVECTORS, iterations: int = 25, sample_size: int = 50000) -> np.ndarray:
+    """One 256-entry codebook per sub-vector, shape (n_subvectors, 256, dim / n_subvectors)"""
+    dim = matrix.shape[1]
+    if dim % n_subvectors:
+        raise ValueError(f"Vector dimension {dim} is not divisible by {n_subvectors} sub-vectors")
+
+    rng = np.random.default_rng(0)
+    sample = matrix[rng.choice(len(matrix), size=min(sample_size, len(matrix)), replace=False)]
+    sub_dim = dim // n_subvectors
+    return np.stack([
+        train_kmeans(np.ascontiguousarray(sample[:, i * sub_dim:(i + 1) * sub_dim]), 256, iterations, seed=i)
+        for i in range(n_subvectors)
+    ]).astype(np.float32)
+
+
+def encode_pq(matrix: np.ndarray, codebooks: np.ndarray, chunk_rows: int = SCAN_CHUNK_ROWS) -> np.ndarray:
+    """Replace each sub-vector by the index of its nearest codeword, one byte each"""
+    n_subvectors, _, sub_dim = codebooks.shape
+    codes = np.empty((len(matrix), n_subvectors), dtype=np.uint8)
+    squared_norms = (codebooks ** 2).sum(axis=2)
+    for chunk_start in range(0, len(matrix), chunk_rows):
+        chunk = matrix[chunk_start:chunk_start + chunk_rows]
+        for i in range(n_subvectors):
+            sub_vectors = chunk[:, i * sub_dim:(i + 1) * sub_dim]
+            codes[chunk_start:chunk_start + len(chunk), i] = np.argmin(squared_norms[i] - 2 * sub_vectors @ codebooks[i].T, axis=1)
+    return codes
+
+
+
+def build_pq_index(page_ids: list[str], matrix: np.ndarray, log_marks: list[int], n_subvectors: int = PQ_SUBVECTORS, iterations: int = 25, path: str = PQ_INDEX_PATH) -> None:
+    """Train the codebooks, encode every page and save both next to the database, with the page_vector_log
+    marks (db_get_vector_log_marks() read before the vectors) the searches catch up from"""
+    dim = matrix.shape[1]
+    if dim % n_subvectors:
+        requested, n_subvectors = n_subvectors, pq_subvector_count(dim, n_subvectors)
+        print(f"[{datetime.now()}] {dim} dimensions are not divisible by {requested} sub-vectors, using {n_subvectors}")
+    codebooks = train_pq_codebooks(matrix, n_subvectors, iterations)
+    codes = encode_pq(matrix, codebooks)
+
+    # Write to a temporary file first so search processes never load a half-written index
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        np.savez(f, codebooks=codebooks, codes=codes, page_ids=np.array(page_ids), log_marks=np.array(log_marks, dtype=np.int64))
+    os.replace(temp_path, path)
+    print(f"[{datetime.now()}] Saved PQ index ({n_subvectors} bytes per page, {codes.nbytes / 1e6:.1f} MB of codes) over {len(page_ids)} pages to {path}")
+
+
+
+class PQIndex:
+    """Product-quantized codes scanned with asymmetric distance lookup tables"""
+
+    def __init__(self, path: str = PQ_INDEX_PATH):
+        self.path = path
+        self.page_ids = np.empty(0, dtype=str)
+        self.codebooks = np.empty((0, 256, 0), dtype=np.float32)
+        self.codes = np.empty((0, 0), dtype=np.uint8)
+        self.log_marks: Optional[list[int]] = None
+        self.delta = BuildDelta()
+        self.loaded_mtime = None
+        self.lock = asyncio.Lock()
+        self.stale = True
+
+
+    def invalidate(self):
+        """Fetch the pages written or deleted since the build on the next search"""
+        self.stale = True
+
+
+    async def ensure_loaded(self):
+        """(Re)load the index file if it was rebuilt since the last load, then catch up with page_vector_log"""
+        if not os.path.exists(self.path):
+            raise ValueError(f"No PQ index at {self.path}, build it with admin/build_pq_index.py")
+
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.loaded_mtime and not self.stale:
+            return
+
+        async with self.lock:
+            if mtime == self.loaded_mtime and not self.stale:
+                return
+            # Cleared first, so a write landing during the refresh is fetched by the next one
+            self.stale = False
+            try:
+                if mtime != self.loaded_mtime:
+                    self._load(mtime)
+                    if not await self.delta.reset(self.log_marks):
+                        self.loaded_mtime = None
+                        raise ValueError(f"PQ index at {self.path} has no log marks for this database, rebuild it with admin/build_pq_index.py")
+                else:
+                    await self.delta.refresh()
+            except BaseException:
+                self.stale = True
+                raise
+
+
+    def _load(self, mtime: float):
+        with np.load(self.path) as data:
+            self.codebooks = data["codebooks"]
+            self.codes = data["codes"]
+            self.page_ids = data["page_ids"]
+            self.log_marks = data["log_marks"].tolist() if "log_marks" in data.files else None
+        self.loaded_mtime = mtime
+        print(f"[{datetime.now()}] Loaded PQ index with {len(self.page_ids)} pages")
+
+
+    async def search(self, query_vector, amount: int, rerank_candidates: Optional[int] = PQ_RERANK_CANDIDATES) -> list[dict]:
+        await self.ensure_loaded()
+        if not len(self.page_ids):
+            return self.delta.merge([], as_query_vector(query_vector), amount) if self.delta.page_ids else []
+
+        n_subvectors, _, sub_dim = self.codebooks.shape
+        query = as_query_vector(query_vector, n_subvectors * sub_dim)
+
+        # Lookup table: dot product of every query sub-vector with every codeword, (n_subvectors, 256)
+        tables = np.einsum("mkd,md->mk", self.codebooks, query.reshape(n_subvectors, sub_dim))
+
+        scores = np.empty(len(self.page_ids), dtype=np.float32)
+        subvector_index = np.arange(n_subvectors)
+        for chunk_start in range(0, len(self.page_ids), SCAN_CHUNK_ROWS):
+            chunk = self.codes[chunk_start:chunk_start + SCAN_CHUNK_ROWS]
+            scores[chunk_start:chunk_start + len(chunk)] = tables[subvector_index, chunk].sum(axis=1)
+
+        # Deep enough that the shortlist keeps its size once the pages changed since the build are dropped,
+        # their current vectors are scored by the delta
+        changed = self.delta.changed
+        shortlist_size = max(rerank_candidates or 0, amount)
+        shortlist = [(str(self.page_ids[i]), float(scores[i])) for i in top_k_indices(scores, shortlist_size + len(changed))]
+        shortlist = [(page_id, score) for page_id, score in shortlist if page_id not in changed][:shortlist_size]
+        if not rerank_candidates:
+            return self.delta.merge(shortlist, query, amount)
+
+        # Optional exact rerank of the shortlist with the float vectors from page_images_vectors
+        page_ids, vectors = await db_load_vectors_by_ids([page_id for page_id, _ in shortlist])
+        if not page_ids:
+            return self.delta.merge([], query, amount)
+        exact_scores = vectors @ query
+        best = top_k_indices(exact_scores, amount)
+        return self.delta.merge([(page_ids[i], float(exact_scores[i])) for i in best], query, amount)
+
+
+
+pq_index = register_index(PQIndex())
@@ -0,0 +1,211 @@
+# database/page_dedup.py
+
+from datetime import datetime
+from typing import Optional
+import asyncio, io, os
+import numpy as np
+from PIL import Image
+
+from config import PROCESSED_FOLDER, DEDUP_HASH_DISTANCE, DEDUP_PIXEL_TOLERANCE, DEDUP_VECTOR_SIMILARITY
+from database.getters_search import db_get_vector_list
+from database.shards import gather_shards, document_db_path
+from database.connection_pool import connection_pool
+
+
+
+# Wide enough that changing one digit of a table moves some thumbnail pixel by far more than DEDUP_PIXEL_TOLERANCE
+THUMBNAIL_WIDTH = 256
+
+
+
+def image_hash(image_bytes: bytes) -> int:
+    """64-bit difference hash: sign of the horizontal gradient on a 9x8 grayscale thumbnail,
+    stable under re-rendering, rescaling and recompression. Far too coarse to tell tables with the same
+    layout apart, so a close hash only makes a page a duplicate candidate."""
+    image = Image.open(io.BytesIO(image_bytes)).convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).reshape(-1)
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def page_thumbnail(image_bytes: bytes) -> np.ndarray:
+    """Grayscale, box-downscaled page image used to confirm a hash candidate: recompressing or re-encoding
+    the same render moves its pixels by a few gray levels, a different digit by several dozen"""
+    image = Image.open(io.BytesIO(image_bytes)).convert("L")
+    size = (THUMBNAIL_WIDTH, max(1, round(image.height * THUMBNAIL_WIDTH / image.width)))
+    return np.asarray(image.resize(size, Image.Resampling.BOX), dtype=np.int16)
+
+
+def same_page_image(thumbnail: np.ndarray, other: np.ndarray) -> bool:
+    """Whether two thumbnails show the same page: same shape and no pixel further apart than DEDUP_PIXEL_TOLERANCE.
+    A render at another resolution shifts the edges and is not matched, a different value never is."""
+    return thumbnail.shape == other.shape and int(np.abs(thumbnail - other).max()) <= DEDUP_PIXEL_TOLERANCE
+
+
+def _load_page_thumbnail(page_id: str) -> Optional[np.ndarray]:
+    """Thumbnail of a stored page, from the full image saved in PROCESSED_FOLDER; None if it is not there"""
+    try:
+        with open(os.path.join(PROCESSED_FOLDER, f"{page_id}_full.jpg"), "rb") as f:
+            return page_thumbnail(f.read())
+    except (OSError, ValueError) as e:
+        print(f"[{datetime.now()}] Cannot compare with page {page_id}: {str(e)}")
+        return None
+
+
+def _to_signed(value: int) -> int:
+    """SQLite integers are signed 64-bit"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+
+async def db_store_fingerprint(document_id: str, page_id: str, hash_value: int, canonical_page_id: Optional[str] = None) -> None:
+    async with connection_pool.writer(document_db_path(document_id)) as conn:
+        await conn.execute(
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete would skip the progress counter triggers
+            """
+            INSERT INTO page_fingerprints (page_id, image_hash, canonical_page_id) VALUES (?, ?, ?)
+            ON CONFLICT (page_id) DO UPDATE SET
+                image_hash = excluded.image_hash, canonical_page_id = excluded.canonical_page_id, similarity = NULL
+            """,
+            (page_id, _to_signed(hash_value), canonical_page_id)
+        )
+
+
+async def _db_get_shard_canonical(db_path: str, page_id: str) -> Optional[str]:
+    async with connection_pool.reader(db_path) as conn:
+        async with conn.execute("SELECT canonical_page_id FROM page_fingerprints WHERE page_id = ?", (page_id,)) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+
+async def _db_relink_shard(db_path: str, page_id: str, canonical_page_id: str, similarity: Optional[float]) -> None:
+    """Move the pages linked to `page_id` over to its new canonical page"""
+    async with connection_pool.writer(db_path) as conn:
+        await conn.execute(
+            "UPDATE page_fingerprints SET canonical_page_id = ?, similarity = ? WHERE canonical_page_id = ?",
+            (canonical_page_id, similarity, page_id)
+        )
+
+
+async def db_link_duplicate(document_id: str, page_id: str, canonical_page_id: str, similarity: Optional[float] = None) -> str:
+    """Point a page (and the pages already linked to it) at a canonical page, returns the canonical page_id used"""
+    # Follow the link if the match is itself a duplicate, so chains never form (it may live in any shard)
+    canonical_page_id = next((linked for linked in await gather_shards(_db_get_shard_canonical, canonical_page_id) if linked), canonical_page_id)
+
+    async with connection_pool.writer(document_db_path(document_id)) as conn:
+        await conn.execute("INSERT OR IGNORE INTO page_fingerprints (page_id) VALUES (?)", (page_id,))
+        await conn.execute(
+            "UPDATE page_fingerprints SET canonical_page_id = ?, similarity = ? WHERE page_id = ?",
+            (canonical_page_id, similarity, page_id)
+        )
+    await gather_shards(_db_relink_shard, page_id, canonical_page_id, similarity)
+
+    duplicate_detector.remove(page_id)
+    print(f"[{datetime.now()}] Linked page {page_id} to canonical page {canonical_page_id}")
+    return canonical_page_id
+
+
+async def _db_get_shard_page_content(db_path: str, page_ids: list[str]) -> list[tuple[str, str, Optional[str]]]:
+    async with connection_pool.reader(db_path) as conn:
+        query = f"SELECT page_id, page_text, latex_code FROM page_images WHERE page_id IN ({', '.join('?' for _ in page_ids)})"
+        async with conn.execute(query, page_ids) as cursor:
+            return await cursor.fetchall()
+
+
+async def _db_same_page_content(page_id: str, other_page_id: str) -> bool:
+    """Whether two pages, of any documents, hold the same extracted text and LaTeX"""
+    rows = [row for shard_rows in await gather_shards(_db_get_shard_page_content, [page_id, other_page_id]) for row in shard_rows]
+    return len(rows) == 2 and (rows[0][1], rows[0][2] or "") == (rows[1][1], rows[1][2] or "")
+
+
+async def db_find_vector_duplicate(vector, page_id: str) -> Optional[dict]:
+    """Closest page of the corpus if it is at least DEDUP_VECTOR_SIMILARITY similar and holds the same text
+    and LaTeX, else None. Embeddings of tables that share a layout are that similar whatever their values,
+    so the vector alone never decides. Looked up with the configured search backend, so an ANN backend keeps
+    the lookup per ingested page sublinear."""
+    for match in await db_get_vector_list(vector, 2):
+        if match['page_id'] == page_id:
+            continue
+        if match['similarity'] < DEDUP_VECTOR_SIMILARITY:
+            return None
+        return match if await _db_same_page_content(page_id, match['page_id']) else None
+    return None
+
+
+
+async def _db_load_shard_hashes(db_path: str) -> list[tuple[str, int]]:
+    async with connection_pool.reader(db_path) as conn:
+        async with conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'page_fingerprints'") as cursor:
+            if not await cursor.fetchone():
+                raise ValueError(f"{db_path} has no page_fingerprints table, add it with admin/migrate_progress_counters.py")
+        query = """
+            SELECT page_id, image_hash
+            FROM page_fingerprints
+            WHERE canonical_page_id IS NULL AND image_hash IS NOT NULL
+        """
+        async with conn.execute(query) as cursor:
+            return await cursor.fetchall()
+
+
+
+class DuplicateDetector:
+    """Hamming-distance lookup over the image hashes of all canonical pages, held in RAM during ingestion.
+    The hash shortlists candidates, a candidate is only a duplicate if its saved image looks the same
+    pixel for pixel (same_page_image)."""
+
+    def __init__(self):
+        self.page_ids: list[str] = []
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.lock = asyncio.Lock()
+        self.loaded = False
+
+
+    async def ensure_loaded(self):
+        if self.loaded:
+            return
+
+        async with self.lock:
+            if self.loaded:
+                return
+            rows = [row for shard_rows in await gather_shards(_db_load_shard_hashes) for row in shard_rows]
+            self.page_ids = [row[0] for row in rows]
+            self.hashes = np.array([row[1] for row in rows], dtype=np.int64).view(np.uint64)
+            self.loaded = True
+            print(f"[{datetime.now()}] Loaded {len(self.page_ids)} page image hashes")
+
+
+    async def find(self, hash_value: int, thumbnail: np.ndarray) -> Optional[str]:
+        """page_id of the closest canonical page within DEDUP_HASH_DISTANCE bits that looks the same, else None"""
+        await self.ensure_loaded()
+        if not self.page_ids:
+            return None
+
+        distances = np.bitwise_count(self.hashes ^ np.uint64(hash_value))
+        candidates = np.flatnonzero(distances <= DEDUP_HASH_DISTANCE)
+        loop = asyncio.get_running_loop()
+        for candidate in candidates[np.argsort(distances[candidates], kind="stable")]:
+            page_id = self.page_ids[candidate]
+            candidate_thumbnail = await loop.run_in_executor(None, _load_page_thumbnail, page_id)
+            if candidate_thumbnail is not None and same_page_image(thumbnail, candidate_thumbnail):
+                return page_id
+        return None
+
+
+    async def add(self, document_id: str, page_id: str, hash_value: int) -> None:
+        """Register a new canonical page"""
+        await self.ensure_loaded()
+        await db_store_fingerprint(document_id, page_id, hash_value)
+        self.page_ids.append(page_id)
+        self.hashes = np.append(self.hashes, np.uint64(hash_value))
+
+
+    def remove(self, page_id: str) -> None:
+        """Stop matching against a page that turned out to be a duplicate itself"""
+        if page_id in self.page_ids:
+            keep = np.array([existing != page_id for existing in self.page_ids])
+            self.page_ids = [existing for existing in self.page_ids if existing != page_id]
+            self.hashes = self.hashes[keep]
+
+
+
+duplicate_detector = DuplicateDetector()
@@ -0,0 +1,81 @@
+# database/quantization.py
+
+from typing import Optional
+import aiosqlite
+import numpy as np
+
+from config import VECTOR_STORAGE, EMBEDDING_DIM
+
+
+
+_quantization_cache: Optional[tuple[np.ndarray, np.ndarray]] = None
+
+
+
+def default_int8_calibration(dim: int = EMBEDDING_DIM) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric [-1, 1] range, always safe for unit-norm vectors but coarse"""
+    return np.full(dim, 1 / 127, dtype=np.float32), np.zeros(dim, dtype=np.float32)
+
+
+def calibrate_int8(matrix: np.ndarray, clip_percentile: float = 0.1) -> tuple[np.ndarray, np.ndarray]:
+    """Per-dimension scale and offset mapping the observed value range onto [-127, 127]"""
+    low = np.percentile(matrix, clip_percentile, axis=0)
+    high = np.percentile(matrix, 100 - clip_percentile, axis=0)
+    offset = (high + low) / 2
+    scale = (high - low) / 254
+    scale[scale == 0] = 1 / 127
+    return scale.astype(np.float32), offset.astype(np.float32)
+
+
+def quantize_int8(vectors, scale: np.ndarray, offset: np.ndarray) -> np.ndarray:
+    codes = np.rint((np.asarray(vectors, dtype=np.float32) - offset) / scale)
+    return np.clip(codes, -127, 127).astype(np.int8)
+
+
+def dequantize_int8(codes: np.ndarray, scale: np.ndarray, offset: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scale + offset
+
+
+
+async def db_get_quantization(conn: aiosqlite.Connection) -> tuple[np.ndarray, np.ndarray]:
+    """Read the int8 calibration, falling back to the default one if none was stored"""
+    global _quantization_cache
+    if _quantization_cache is not None:
+        return _quantization_cache
+
+    async with conn.execute("SELECT scale, offset FROM vector_quantization ORDER BY dimension") as cursor:
+        rows = await cursor.fetchall()
+
+    if rows:
+        _quantization_cache = (
+            np.array([row[0] for row in rows], dtype=np.float32),
+            np.array([row[1] for row in rows], dtype=np.float32)
+        )
+    else:
+        _quantization_cache = default_int8_calibration()
+    return _quantization_cache
+
+
+
+def float32_blob(vector) -> memoryview:
+    """SQLite blob parameter viewing a float32 vector's memory, copied only if it is not already contiguous float32"""
+    return memoryview(np.ascontiguousarray(vector, dtype=np.float32).reshape(-1))
+
+
+
+async def encode_vector_blob(conn: aiosqlite.Connection, vector) -> memoryview:
+    """Encode a vector for the vector_data column according to VECTOR_STORAGE"""
+    if VECTOR_STORAGE == "int8":
+        scale, offset = await db_get_quantization(conn)
+        return memoryview(quantize_int8(vector, scale, offset))
+    return float32_blob(vector)
+
+
+async def decode_vector_blobs(conn: aiosqlite.Connection, blobs: list[bytes]) -> np.ndarray:
+    """Decode vector_data blobs into one float32 matrix, one row per blob"""
+    if VECTOR_STORAGE == "int8":
+        scale, offset = await db_get_quantization(conn)
+        codes = np.frombuffer(b"".join(blobs), dtype=np.int8).reshape(len(blobs), -1)
+        return dequantize_int8(codes, scale, offset)
+    # Joined into a bytearray, so the matrix is writable without a second copy
+    return np.frombuffer(bytearray().join(blobs), dtype=np.float32).reshape(len(blobs), -1)
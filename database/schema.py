@@ -0,0 +1,363 @@
+# database/schema.py
+
+from config import EMBEDDING_DIM, VECTOR_STORAGE, VEC_CHUNK_SIZE
+
+
+
+def page_images_vectors_sql(storage: str = VECTOR_STORAGE) -> str:
+    """DDL of the vec0 table: document_id partitions the KNN search, upload_date is a filterable metadata column"""
+    vector_type = "INT8" if storage == "int8" else "FLOAT"
+    return f"""
+CREATE VIRTUAL TABLE page_images_vectors USING vec0(
+    page_id TEXT PRIMARY KEY,
+    document_id TEXT PARTITION KEY,
+    upload_date TEXT,
+    vector_data {vector_type}[{EMBEDDING_DIM}] distance_metric=cosine,
+    chunk_size={VEC_CHUNK_SIZE}
+)
+"""
+
+
+def insert_page_vector_sql(storage: str = VECTOR_STORAGE) -> str:
+    """Insert one vector, copying its partition and metadata columns from page_images and documents.
+    Parameters: (vector_blob, page_id)"""
+    # "vec_int8(?)" tells sqlite-vec that the blob holds int8 values instead of float32
+    placeholder = "vec_int8(?)" if storage == "int8" else "?"
+    return f"""
+        INSERT INTO page_images_vectors (page_id, document_id, upload_date, vector_data)
+        SELECT pi.page_id, pi.document_id, d.upload_date, {placeholder}
+        FROM page_images pi
+        JOIN documents d ON d.document_id = pi.document_id
+        WHERE pi.page_id = ?
+    """
+
+
+
+# One mean-pooled, normalized float32 vector per document, scanned first by the hierarchical search
+DOCUMENTS_VECTORS_SQL = [
+    f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_vectors USING vec0(
+    document_id TEXT PRIMARY KEY,
+    vector_data FLOAT[{EMBEDDING_DIM}] distance_metric=cosine
+)
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS delete_documents_vector
+AFTER DELETE ON documents
+BEGIN
+    DELETE FROM documents_vectors WHERE document_id = OLD.document_id;
+END;
+"""
+]
+
+
+
+# Single-row counter bumped by every write to the vectors, lets caches and indexes detect stale data
+INDEX_GENERATION_SQL = [
+    """
+CREATE TABLE IF NOT EXISTS index_generation (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    generation INTEGER NOT NULL
+)
+""",
+    "INSERT OR IGNORE INTO index_generation (id, generation) VALUES (1, 0)"
+]
+
+BUMP_GENERATION_SQL = "UPDATE index_generation SET generation = generation + 1 WHERE id = 1"
+
+
+
+# One row per page that has (or had) a vector, moved to a new, highest seq each time its vector is written
+# or deleted: the in-memory indexes fetch the rows past the last seq they saw to pick up both kinds of change.
+# vec0 tables cannot have triggers, so the code writing page_images_vectors logs its writes here itself.
+PAGE_VECTOR_LOG_SQL = [
+    """
+CREATE TABLE IF NOT EXISTS page_vector_log (
+    page_id TEXT PRIMARY KEY,
+    document_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+)
+""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_page_vector_log_seq ON page_vector_log (seq)"
+]
+
+# Log a page's vector as (re)written. Parameters: (page_id,)
+LOG_PAGE_VECTOR_SQL = """
+    INSERT INTO page_vector_log (page_id, document_id, seq)
+    SELECT page_id, document_id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM page_vector_log)
+    FROM page_images
+    WHERE page_id = ?
+    ON CONFLICT (page_id) DO UPDATE SET document_id = excluded.document_id, seq = excluded.seq, deleted = 0
+"""
+
+
+
+# Delete a page's vector together with the page, log the delete and bump the generation. A trigger cannot
+# recompute the mean vector of the document, so it is dropped: the hierarchical search goes through the
+# document's pages until admin/build_document_vectors.py stores it again.
+DELETE_PAGE_VECTOR_TRIGGER_SQL = f"""
+CREATE TRIGGER delete_page_images_vector
+AFTER DELETE ON page_images
+BEGIN
+    DELETE FROM page_images_vectors WHERE page_id = OLD.page_id;
+    DELETE FROM documents_vectors WHERE document_id = OLD.document_id;
+    UPDATE page_vector_log SET seq = (SELECT MAX(seq) FROM page_vector_log) + 1, deleted = 1
+    WHERE page_id = OLD.page_id AND deleted = 0;
+    {BUMP_GENERATION_SQL};
+END;
+"""
+
+
+def ensure_page_vector_log(conn) -> None:
+    """Create page_vector_log and the delete trigger logging to it where missing (sync sqlite3 connection or
+    cursor), and log every stored vector it does not know about yet, e.g. those of a database created before
+    it or filled by a bulk load"""
+    # The trigger also drops document vectors, older databases predate their table
+    for statement in INDEX_GENERATION_SQL + PAGE_VECTOR_LOG_SQL + DOCUMENTS_VECTORS_SQL:
+        conn.execute(statement)
+    conn.execute("DROP TRIGGER IF EXISTS delete_page_images_vector")
+    conn.execute(DELETE_PAGE_VECTOR_TRIGGER_SQL)
+    logged = {row[0] for row in conn.execute("SELECT page_id FROM page_vector_log WHERE deleted = 0").fetchall()}
+    stored = [row[0] for row in conn.execute("SELECT page_id FROM page_images_vectors").fetchall()]
+    conn.executemany(LOG_PAGE_VECTOR_SQL, ((page_id,) for page_id in stored if page_id not in logged))
+
+
+
+# Full-text index over page_images, kept in sync by triggers (external content, nothing is stored twice)
+PAGE_IMAGES_FTS_SQL = [
+    """
+CREATE VIRTUAL TABLE IF NOT EXISTS page_images_fts USING fts5(
+    page_text,
+    latex_code,
+    content='page_images',
+    content_rowid='rowid'
+)
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS page_images_fts_insert
+AFTER INSERT ON page_images
+BEGIN
+    INSERT INTO page_images_fts (rowid, page_text, latex_code) VALUES (NEW.rowid, NEW.page_text, NEW.latex_code);
+END;
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS page_images_fts_delete
+AFTER DELETE ON page_images
+BEGIN
+    INSERT INTO page_images_fts (page_images_fts, rowid, page_text, latex_code) VALUES ('delete', OLD.rowid, OLD.page_text, OLD.latex_code);
+END;
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS page_images_fts_update
+AFTER UPDATE OF page_text, latex_code ON page_images
+BEGIN
+    INSERT INTO page_images_fts (page_images_fts, rowid, page_text, latex_code) VALUES ('delete', OLD.rowid, OLD.page_text, OLD.latex_code);
+    INSERT INTO page_images_fts (rowid, page_text, latex_code) VALUES (NEW.rowid, NEW.page_text, NEW.latex_code);
+END;
+"""
+]
+
+# Re-read every row of page_images into the external-content index
+REBUILD_FTS_SQL = "INSERT INTO page_images_fts (page_images_fts) VALUES ('rebuild')"
+
+
+
+# Numeric table cells parsed from latex_code, looked up by value to find edit targets without re-reading LaTeX
+TABLE_CELLS_SQL = [
+    """
+CREATE TABLE IF NOT EXISTS table_cells (
+    page_id TEXT NOT NULL,
+    table_index INTEGER NOT NULL,
+    row INTEGER NOT NULL,
+    col INTEGER NOT NULL,
+    raw_value TEXT NOT NULL,
+    value REAL NOT NULL
+)
+""",
+    "CREATE INDEX IF NOT EXISTS idx_table_cells_value ON table_cells (value, page_id)",
+    "CREATE INDEX IF NOT EXISTS idx_table_cells_page ON table_cells (page_id)",
+    """
+CREATE TRIGGER IF NOT EXISTS delete_page_images_cells
+AFTER DELETE ON page_images
+BEGIN
+    DELETE FROM table_cells WHERE page_id = OLD.page_id;
+END;
+"""
+]
+
+
+
+# Image hash of every ingested page; duplicates point at their canonical page and have no vector of their own
+PAGE_FINGERPRINTS_SQL = [
+    """
+CREATE TABLE IF NOT EXISTS page_fingerprints (
+    page_id TEXT PRIMARY KEY,
+    image_hash INTEGER,
+    canonical_page_id TEXT,
+    similarity REAL
+)
+""",
+    "CREATE INDEX IF NOT EXISTS idx_page_fingerprints_canonical ON page_fingerprints (canonical_page_id)",
+    """
+CREATE TRIGGER IF NOT EXISTS delete_page_images_fingerprint
+AFTER DELETE ON page_images
+BEGIN
+    DELETE FROM page_fingerprints WHERE page_id = OLD.page_id;
+    UPDATE page_fingerprints SET canonical_page_id = NULL, similarity = NULL WHERE canonical_page_id = OLD.page_id;
+END;
+"""
+]
+
+
+
+# Per-document progress counters, so a status check is a primary-key lookup on documents:
+# processed_pages counts pages with a vector plus duplicates linked to a canonical page (as the status used to),
+# failed_pages the pages the embedding queue gave up on (page_images.embedding_failed) until a vector is stored for them
+DOCUMENT_PROGRESS_COLUMNS = [
+    ("documents", "processed_pages", "INTEGER NOT NULL DEFAULT 0"),
+    ("documents", "failed_pages", "INTEGER NOT NULL DEFAULT 0"),
+    ("page_images", "embedding_failed", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+# vec0 tables cannot have triggers, so the vector counts follow page_vector_log, which every vector write and
+# delete goes through (a rewrite only moves the page's row to a new seq and leaves the counts alone)
+DOCUMENT_PROGRESS_SQL = [
+    """
+CREATE TRIGGER IF NOT EXISTS count_page_vector_insert
+AFTER INSERT ON page_vector_log
+WHEN NEW.deleted = 0
+BEGIN
+    UPDATE documents SET processed_pages = processed_pages + 1 WHERE document_id = NEW.document_id;
+    UPDATE page_images SET embedding_failed = 0 WHERE page_id = NEW.page_id AND embedding_failed = 1;
+END;
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS count_page_vector_update
+AFTER UPDATE ON page_vector_log
+BEGIN
+    UPDATE documents SET processed_pages = processed_pages - 1 WHERE OLD.deleted = 0 AND document_id = OLD.document_id;
+    UPDATE documents SET processed_pages = processed_pages + 1 WHERE NEW.deleted = 0 AND document_id = NEW.document_id;
+    UPDATE page_images SET embedding_failed = 0 WHERE NEW.deleted = 0 AND page_id = NEW.page_id AND embedding_failed = 1;
+END;
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS count_duplicate_insert
+AFTER INSERT ON page_fingerprints
+WHEN NEW.canonical_page_id IS NOT NULL
+BEGIN
+    UPDATE documents SET processed_pages = processed_pages + 1
+    WHERE document_id = (SELECT document_id FROM page_images WHERE page_id = NEW.page_id);
+END;
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS count_duplicate_update
+AFTER UPDATE OF canonical_page_id ON page_fingerprints
+WHEN (OLD.canonical_page_id IS NULL) != (NEW.canonical_page_id IS NULL)
+BEGIN
+    UPDATE documents SET processed_pages = processed_pages + (CASE WHEN NEW.canonical_page_id IS NULL THEN -1 ELSE 1 END)
+    WHERE document_id = (SELECT document_id FROM page_images WHERE page_id = NEW.page_id);
+END;
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS count_duplicate_delete
+AFTER DELETE ON page_fingerprints
+WHEN OLD.canonical_page_id IS NOT NULL
+BEGIN
+    UPDATE documents SET processed_pages = processed_pages - 1
+    WHERE document_id = (SELECT document_id FROM page_images WHERE page_id = OLD.page_id);
+END;
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS count_failed_page
+AFTER UPDATE OF embedding_failed ON page_images
+WHEN NEW.embedding_failed != OLD.embedding_failed
+BEGIN
+    UPDATE documents SET failed_pages = failed_pages + NEW.embedding_failed - OLD.embedding_failed
+    WHERE document_id = NEW.document_id;
+END;
+""",
+    # BEFORE, so the fingerprint of the page is still there to be counted: the duplicate triggers above no
+    # longer find the page once it is deleted. Its vector is uncounted by the log update of the delete trigger.
+    """
+CREATE TRIGGER IF NOT EXISTS count_page_delete
+BEFORE DELETE ON page_images
+BEGIN
+    UPDATE documents SET
+        processed_pages = processed_pages
+            - EXISTS(SELECT 1 FROM page_fingerprints WHERE page_id = OLD.page_id AND canonical_page_id IS NOT NULL),
+        failed_pages = failed_pages - OLD.embedding_failed
+    WHERE document_id = OLD.document_id;
+END;
+"""
+]
+
+# Recreated by ensure_document_progress, with the names of earlier versions (on page_images_vectors_rowids)
+DOCUMENT_PROGRESS_TRIGGERS = [
+    "count_page_vector_insert", "count_page_vector_update", "count_page_vector_delete", "count_duplicate_insert",
+    "count_duplicate_update", "count_duplicate_delete", "count_failed_page", "count_page_delete"
+]
+
+# The counters recomputed from scratch, grouped in one pass over page_images (document_id is not indexed)
+DOCUMENT_PROGRESS_COUNTS_SQL = """
+    SELECT
+        pi.document_id,
+        SUM(EXISTS(SELECT 1 FROM page_vector_log l WHERE l.page_id = pi.page_id AND l.deleted = 0))
+            + SUM(EXISTS(SELECT 1 FROM page_fingerprints pf WHERE pf.page_id = pi.page_id AND pf.canonical_page_id IS NOT NULL)) AS processed,
+        SUM(pi.embedding_failed) AS failed
+    FROM page_images pi
+    GROUP BY pi.document_id
+"""
+
+RECOUNT_DOCUMENT_PROGRESS_SQL = [
+    "UPDATE documents SET processed_pages = 0, failed_pages = 0",
+    f"""
+UPDATE documents SET processed_pages = progress.processed, failed_pages = progress.failed
+FROM ({DOCUMENT_PROGRESS_COUNTS_SQL}) AS progress
+WHERE documents.document_id = progress.document_id
+"""
+]
+
+
+def ensure_document_progress(conn) -> None:
+    """Add the progress columns, recreate their triggers (sync sqlite3 connection or cursor) and recount them.
+    Also brings page_vector_log up to date, which the vector counts follow."""
+    for table, column, definition in DOCUMENT_PROGRESS_COLUMNS:
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    for name in DOCUMENT_PROGRESS_TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    # Logged with the triggers dropped, the recount below counts the newly logged vectors in one pass
+    ensure_page_vector_log(conn)
+    for statement in PAGE_FINGERPRINTS_SQL + DOCUMENT_PROGRESS_SQL + RECOUNT_DOCUMENT_PROGRESS_SQL:
+        conn.execute(statement)
+
+
+
+def vacuum_database(conn) -> None:
+    """VACUUM a database (sync sqlite3 connection, outside a transaction). VACUUM may renumber the implicit
+    rowids of page_images, which page_images_fts is keyed on, so the full-text index is rebuilt afterwards."""
+    conn.execute("VACUUM")
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'page_images_fts'").fetchone():
+        conn.execute(REBUILD_FTS_SQL)
+        conn.commit()
+
+
+
+def rebuild_vectors_table(conn, rows, storage: str = VECTOR_STORAGE) -> None:
+    """Recreate page_images_vectors (sync sqlite3 connection) and refill it from (page_id, vector_blob) rows.
+    Vectors whose page no longer exists in page_images are dropped. Also brings the generation counter,
+    the vector log, the delete trigger and the progress counters up to date, since older databases may lack them."""
+    conn.execute("DROP TABLE IF EXISTS page_images_vectors")
+    conn.execute(page_images_vectors_sql(storage))
+    conn.executemany(insert_page_vector_sql(storage), ((blob, page_id) for page_id, blob in rows))
+    for statement in INDEX_GENERATION_SQL:
+        conn.execute(statement)
+    # Every vector was rewritten (possibly in another storage format), so all of them are logged again
+    for statement in PAGE_VECTOR_LOG_SQL:
+        conn.execute(statement)
+    conn.executemany(LOG_PAGE_VECTOR_SQL, conn.execute("SELECT page_id FROM page_images_vectors").fetchall())
+    # Also recreates the delete trigger
+    ensure_document_progress(conn)
+    conn.execute(BUMP_GENERATION_SQL)
@@ -0,0 +1,71 @@
+# database/search_cache.py
+
+from collections import OrderedDict
+from typing import Optional
+import hashlib
+
+from config import SEARCH_CACHE_SIZE
+from database.quantization import float32_blob
+
+
+
+class SearchResultCache:
+    """LRU of top-k results, only valid for the index generation they were computed at"""
+
+    def __init__(self, capacity: int = SEARCH_CACHE_SIZE):
+        self.capacity = capacity
+        self.entries: OrderedDict[tuple, list[dict]] = OrderedDict()
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+
+
+    @staticmethod
+    def make_key(query_vector, amount: int, **options) -> tuple:
+        vector_hash = hashlib.sha1(float32_blob(query_vector)).hexdigest()
+        frozen_options = tuple(sorted(
+            (name, tuple(value) if isinstance(value, list) else value)
+            for name, value in options.items()
+        ))
+        return (vector_hash, amount, frozen_options)
+
+
+    def _check_generation(self, generation: int):
+        # Any write since the entries were computed makes all of them stale
+        if generation != self.generation:
+            self.entries.clear()
+            self.generation = generation
+
+
+    def get(self, key: tuple, generation: int) -> Optional[list[dict]]:
+        self._check_generation(generation)
+        results = self.entries.get(key)
+        if results is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return [dict(result) for result in results]
+
+
+    def put(self, key: tuple, generation: int, results: list[dict]):
+        self._check_generation(generation)
+        self.entries[key] = [dict(result) for result in results]
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "size": len(self.entries),
+            "generation": self.generation
+        }
+
+
+
+search_cache = SearchResultCache()
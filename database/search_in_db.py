@@ -1,20 +1,44 @@
 # utils/search_in_db.py
 
-from database.getters_search import db_get_vector_list
+from typing import Optional
+
+from config import RETRIEVAL_MODE, HYBRID_CANDIDATES, RRF_K
+from database.getters_search import db_get_vector_list, db_get_vector_list_batch
+from database.getters_text import db_get_text_matches
 from vectorization.vectorization_local import embed_text
 from vectorization.class_embedding_queue import embedding_queue
+from vectorization.query_embedding_cache import query_embedding_cache
+
 
 
+async def get_similar_vectors(
+    query: str,
+    amount: int,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    document_ids: Optional[list[str]] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None
+) -> list:
+    cached_vector = await query_embedding_cache.get(query)
 
-async def get_similar_vectors(query: str, amount: int) -> list:
-    # Pause current image embedding if any
-    await embedding_queue.pause_current_task()
+    # Pause current image embedding if any, a cache hit does not need the model
+    if cached_vector is None:
+        await embedding_queue.pause_current_task()
 
     try:
-        payload = {"texts": [query]}    
-        text_vector = await embed_text(payload)
+        if cached_vector is None:
+            payload = {"texts": [query]}    
+            text_vector = (await embed_text(payload))[0]
+            await query_embedding_cache.put(query, text_vector)
+        else:
+            text_vector = cached_vector
 
-        image_vectors = await db_get_vector_list(text_vector, amount)
+        image_vectors = await db_get_vector_list(
+            text_vector, amount,
+            nprobe=nprobe, ef_search=ef_search,
+            document_ids=document_ids, date_from=date_from, date_to=date_to
+        )
         return [img_vec['page_id'] for img_vec in image_vectors]
 
     except Exception as e:
@@ -22,20 +46,87 @@ async def get_similar_vectors(query: str, amount: int) -> list:
         raise
 
     finally:
-        await embedding_queue.resume_processing()
+        if cached_vector is None:
+            await embedding_queue.resume_processing()
+
+
+
+async def search_batch(queries: list[str], amount: int) -> list[list[str]]:
+    """Embed all queries in one batch and return the top `amount` page ids for each of them"""
+    if not queries:
+        return []
+
+    text_vectors = [await query_embedding_cache.get(query) for query in queries]
+    missing = [i for i, text_vector in enumerate(text_vectors) if text_vector is None]
+
+    # Pause current image embedding if any, only needed when some queries are not cached
+    if missing:
+        await embedding_queue.pause_current_task()
+
+    try:
+        if missing:
+            embedded = await embed_text({"texts": [queries[i] for i in missing]})
+            for i, text_vector in zip(missing, embedded):
+                text_vectors[i] = text_vector
+                await query_embedding_cache.put(queries[i], text_vector)
+
+        image_vectors = await db_get_vector_list_batch(text_vectors, amount)
+        return [[img_vec['page_id'] for img_vec in per_query] for per_query in image_vectors]
+
+    except Exception as e:
+        print(f"Error in batch vector processing: {str(e)}")
+        raise
+
+    finally:
+        if missing:
+            await embedding_queue.resume_processing()
+
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = RRF_K) -> list[str]:
+    """Fuse several rankings: each list adds 1 / (k + rank) to the score of the ids it contains"""
+    scores = {}
+    for ranking in rankings:
+        for rank, image_id in enumerate(ranking, start=1):
+            scores[image_id] = scores.get(image_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
 
 
+async def combine_search_results(
+    optimized_query: str,
+    max_results: int = 3,
+    document_ids: Optional[list[str]] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    mode: str = RETRIEVAL_MODE
+) -> list[str]:
+    if mode == "hybrid":
+        # Exact dataset and metric names are matched by BM25, the rest by the vectors
+        vector_image_ids = await get_similar_vectors(
+            optimized_query, amount=HYBRID_CANDIDATES,
+            document_ids=document_ids, date_from=date_from, date_to=date_to
+        )
+        text_matches = await db_get_text_matches(optimized_query, HYBRID_CANDIDATES, document_ids, date_from, date_to)
+        text_image_ids = [match['page_id'] for match in text_matches]
 
-async def combine_search_results(optimized_query: str, max_results: int = 3) -> list[str]:
-    vector_image_ids = await get_similar_vectors(optimized_query, amount=max_results)
+        print(f"Vector image IDs retrieved by the system: {vector_image_ids[:max_results]}")
+        print(f"Text image IDs retrieved by the system: {text_image_ids[:max_results]}\n")
+        candidate_image_ids = reciprocal_rank_fusion([vector_image_ids, text_image_ids])
+    else:
+        vector_image_ids = await get_similar_vectors(
+            optimized_query, amount=max_results,
+            document_ids=document_ids, date_from=date_from, date_to=date_to
+        )
 
-    print(f"Vector image IDs retrieved by the system: {vector_image_ids}\n")
+        print(f"Vector image IDs retrieved by the system: {vector_image_ids}\n")
+        candidate_image_ids = vector_image_ids
 
     # Process image IDs
     seen_ids = set()
     best_image_ids = []
 
-    for image_id in vector_image_ids:
+    for image_id in candidate_image_ids:
         image_id = str(image_id)
         if image_id not in seen_ids and len(best_image_ids) < max_results:
             best_image_ids.append(image_id)
@@ -0,0 +1,21 @@
+# database/setters_cells.py
+
+import aiosqlite
+from typing import Optional
+
+from database.table_cells import parse_table_cells
+
+
+
+async def db_store_table_cells(conn: aiosqlite.Connection, page_id: str, latex_code: Optional[str]) -> int:
+    """Replace the indexed numeric cells of one page with those parsed from its LaTeX, returns how many were stored"""
+    await conn.execute("DELETE FROM table_cells WHERE page_id = ?", (page_id,))
+    cells = parse_table_cells(latex_code)
+    await conn.executemany(
+        """
+        INSERT INTO table_cells (page_id, table_index, row, col, raw_value, value)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        [(page_id, cell['table_index'], cell['row'], cell['col'], cell['raw_value'], cell['value']) for cell in cells]
+    )
+    return len(cells)
@@ -3,8 +3,16 @@
 from typing import Optional, List
 from uuid import uuid4
 import aiosqlite
+import numpy as np
 
-from config import LOCAL_DB_PATH
+from database.vector_index import invalidate_indexes
+from database.quantization import encode_vector_blob
+from database.schema import insert_page_vector_sql, LOG_PAGE_VECTOR_SQL
+from database.index_generation import db_bump_generation
+from database.setters_cells import db_store_table_cells
+from database.setters_vectors import db_store_document_vector
+from database.shards import document_db_path
+from database.connection_pool import connection_pool
 
 
 
@@ -27,35 +35,45 @@ async def _db_store_pdf_data(
 
 
 
-async def _db_store_image_with_vector(
+async def _db_store_pages(
     conn: aiosqlite.Connection,
     document_id: str,
-    page_number: int,
-    page_text: str,
-    vector_data: Optional[List[float]] = None,
-    page_id: Optional[str] = None,
+    page_texts: List[str],
+    vectors: Optional[List[np.ndarray]] = None,
+    page_ids: Optional[List[str]] = None,
     latex_code: Optional[str] = None
-) -> str:
-    print(f"Vector data: {vector_data}")
-
-    if page_id is None:
-        page_id = str(uuid4())
+) -> List[str]:
+    page_ids = [
+        page_ids[i] if page_ids and i < len(page_ids) and page_ids[i] else str(uuid4())
+        for i in range(len(page_texts))
+    ]
 
     query = """
         INSERT INTO page_images (
             page_id, document_id, page_number, page_text, latex_code
         ) VALUES (?, ?, ?, ?, ?)
     """
-    await conn.execute(query, (page_id, document_id, page_number, page_text, latex_code))
+    await conn.executemany(query, [
+        (page_id, document_id, i, page_text, latex_code)
+        for i, (page_id, page_text) in enumerate(zip(page_ids, page_texts))
+    ])
+
+    if latex_code:
+        for page_id in page_ids:
+            await db_store_table_cells(conn, page_id, latex_code)
 
-    if vector_data:
-        vector_query = """
-            INSERT INTO page_images_vectors (page_id, vector_data)
-            VALUES (?, ?)
-        """
-        await conn.execute(vector_query, (page_id, vector_data))
+    if vectors is not None:
+        vector_rows = [
+            (await encode_vector_blob(conn, vector), page_id)
+            for page_id, vector in zip(page_ids, vectors) if vector is not None and len(vector)
+        ]
+        await conn.executemany(insert_page_vector_sql(), vector_rows)
+        await conn.executemany(LOG_PAGE_VECTOR_SQL, [(page_id,) for _, page_id in vector_rows])
+        # All the vectors of the document arrive at once: its vector for the hierarchical search is ready too
+        if vector_rows:
+            await db_store_document_vector(conn, document_id)
 
-    return page_id
+    return page_ids
 
 
 
@@ -63,25 +81,23 @@ async def db_store_pdf_file(
     document_id: str,
     title: str,
     page_texts: List[str],
-    vectors: Optional[List[List[float]]] = None,
+    vectors: Optional[List[np.ndarray]] = None,
     page_ids: Optional[List[str]] = None,
     latex_code: Optional[List[str]] = None,
 ) -> None:
-    async with aiosqlite.connect(LOCAL_DB_PATH) as conn:
+    # Every row of a document lives in the shard that owns it
+    async with connection_pool.writer(document_db_path(document_id)) as conn:
         await conn.execute("BEGIN")
         try:
             await _db_store_pdf_data(
                 conn, document_id, title, len(page_texts)
             )
-            print(f"Storing {len(page_texts)} images and vectors")
-            print(f"Vectors: {vectors}")
-            for i, page_text in enumerate(page_texts):
-                page_vector = vectors[i] if vectors and i < len(vectors) else None
-                page_id = page_ids[i] if page_ids and i < len(page_ids) else None
-                await _db_store_image_with_vector(
-                    conn, document_id, i, page_text, page_vector, page_id, latex_code
-                )
+            print(f"Storing {len(page_texts)} pages ({len(vectors) if vectors is not None else 0} with vectors)")
+            await _db_store_pages(conn, document_id, page_texts, vectors, page_ids, latex_code)
+            await db_bump_generation(conn)
             await conn.commit()
+            if vectors is not None:
+                invalidate_indexes()
         except Exception as e:
             await conn.rollback()
             raise ValueError(f"Failed to store PDF file: {str(e)}")
\ No newline at end of file
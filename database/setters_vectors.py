@@ -1,66 +1,141 @@
 # database/setters_vectors.py
 
-import aiosqlite, struct, sqlite_vec
+import aiosqlite, asyncio
+import numpy as np
 from datetime import datetime
 from typing import Optional
 
-from config import LOCAL_DB_PATH
+from config import EMBEDDING_DIM
+from database.vector_index import invalidate_indexes, document_vector
+from database.quantization import encode_vector_blob, decode_vector_blobs, float32_blob
+from database.schema import insert_page_vector_sql, LOG_PAGE_VECTOR_SQL
+from database.index_generation import db_bump_generation
+from database.shards import document_db_path
+from database.connection_pool import connection_pool
+from database.group_commit import group_writer
 
 
 
-async def store_page_vector(document_id: str, page_number: int, vector: list, page_id: Optional[str] = None) -> None:
-    """Store page vector in database with page_id if provided"""
+async def _db_replace_page_vector(conn: aiosqlite.Connection, page_id: str, vector_blob: memoryview) -> None:
+    # vec0 tables reject INSERT OR REPLACE on an existing key, so drop the old vector first
+    await conn.execute("DELETE FROM page_images_vectors WHERE page_id = ?", (page_id,))
+    cursor = await conn.execute(insert_page_vector_sql(), (vector_blob, page_id))
+    if cursor.rowcount == 0:
+        raise ValueError(f"Page not found: {page_id}")
+    await conn.execute(LOG_PAGE_VECTOR_SQL, (page_id,))
+    await db_bump_generation(conn)
+
+
+
+async def db_store_document_vector(conn: aiosqlite.Connection, document_id: str) -> bool:
+    """Store the normalized mean of a document's page vectors, a duplicate page contributing its canonical
+    page's vector. Returns False if none of its pages has a vector yet. The caller commits."""
+    query = """
+        SELECT piv.vector_data
+        FROM page_images_vectors piv
+        WHERE piv.page_id IN (
+            SELECT page_id FROM page_images WHERE document_id = ?
+            UNION ALL
+            SELECT pf.canonical_page_id
+            FROM page_fingerprints pf
+            JOIN page_images pi ON pi.page_id = pf.page_id
+            WHERE pi.document_id = ? AND pf.canonical_page_id IS NOT NULL
+        )
+    """
+    async with conn.execute(query, (document_id, document_id)) as cursor:
+        rows = await cursor.fetchall()
+    if not rows:
+        return False
+
+    mean_vector = document_vector(await decode_vector_blobs(conn, [row[0] for row in rows]))
+
+    # Same delete-then-insert as the page vectors, vec0 has no INSERT OR REPLACE
+    await conn.execute("DELETE FROM documents_vectors WHERE document_id = ?", (document_id,))
+    await conn.execute(
+        "INSERT INTO documents_vectors (document_id, vector_data) VALUES (?, ?)",
+        (document_id, float32_blob(mean_vector))
+    )
+    await db_bump_generation(conn)
+    return True
+
+
+
+async def db_refresh_document_vector(conn: aiosqlite.Connection, document_id: str) -> None:
+    """Recompute the vector of a document after one of its page vectors changed, if it has one. A document
+    being ingested gets its vector once complete (admin/fill_db.py) rather than at each of its pages, and
+    the hierarchical search reaches the documents without one page by page meanwhile."""
+    async with conn.execute("SELECT 1 FROM documents_vectors WHERE document_id = ?", (document_id,)) as cursor:
+        if await cursor.fetchone():
+            await db_store_document_vector(conn, document_id)
+
+
+
+async def _db_write_page_vector(conn: aiosqlite.Connection, document_id: str, page_number: int, vector: np.ndarray, page_id: Optional[str] = None) -> str:
+    """Replace a page's vector inside the caller's transaction, looking the page up by number if no page_id is given"""
+    # Convert vector to binary blob (float32, or int8 codes depending on VECTOR_STORAGE)
+    vector_blob = await encode_vector_blob(conn, vector)
+
+    if not page_id:
+        # Fall back to document_id and page_number
+        select_query = """
+            SELECT page_id FROM page_images 
+            WHERE document_id = ? AND page_number = ?
+        """
+        async with conn.execute(select_query, (document_id, page_number)) as cursor:
+            row = await cursor.fetchone()
+        if not row:
+            print(f"[{datetime.now()}] ERROR: Page not found for Document: {document_id}, Page: {page_number}")
+            raise ValueError("Page not found")
+        page_id = row[0]
+
+    await _db_replace_page_vector(conn, page_id, vector_blob)
+    await db_refresh_document_vector(conn, document_id)
+    return page_id
+
+
+
+def _check_dimension(vector: np.ndarray) -> None:
+    # Ensure vector length matches the configured dimension
+    if len(vector) != EMBEDDING_DIM:
+        raise ValueError(f"Vector length {len(vector)} does not match expected dimension {EMBEDDING_DIM}")
+
+
+
+async def store_page_vector(document_id: str, page_number: int, vector: np.ndarray, page_id: Optional[str] = None) -> str:
+    """Store page vector in database with page_id if provided, returns the page_id used"""
     print(f"[{datetime.now()}] Storing page vector in database - Document: {document_id}, Page: {page_number}")
     print(f"SAMPLE VECTOR: {vector[:1]}")  # Log first element for verification
+    _check_dimension(vector)
+
+    async with connection_pool.writer(document_db_path(document_id)) as conn:
+        try:
+            page_id = await _db_write_page_vector(conn, document_id, page_number, vector, page_id)
+        except Exception as e:
+            print(f"[{datetime.now()}] Database error while storing page vector: {str(e)}")
+            raise
+    invalidate_indexes()
+    print(f"[{datetime.now()}] Successfully stored page vector - Document: {document_id}, Page: {page_number}, Page ID: {page_id}")
+    return page_id
+
+
 
-    # Ensure vector length matches the expected dimension (1536)
-    if len(vector) != 1536:
-        raise ValueError(f"Vector length {len(vector)} does not match expected dimension 1536")
+def queue_page_vector(document_id: str, page_number: int, vector: np.ndarray, page_id: Optional[str] = None) -> asyncio.Future:
+    """Hand the vector to the group-commit writer; the future resolves to the page_id once its batch is committed"""
+    _check_dimension(vector)
+    return group_writer.submit(
+        document_db_path(document_id),
+        lambda conn: _db_write_page_vector(conn, document_id, page_number, vector, page_id)
+    )
 
-    # Convert vector to binary blob
-    vector_blob = struct.pack(f'<{len(vector)}f', *vector)
 
-    async with aiosqlite.connect(LOCAL_DB_PATH) as conn:
-        await conn._execute(conn._conn.enable_load_extension, True)
-        await conn._execute(sqlite_vec.load, conn._conn)
 
+async def db_mark_page_failed(document_id: str, page_number: int, page_id: Optional[str] = None) -> None:
+    """Flag a page the embedding queue gave up on, counted in documents.failed_pages until a vector is stored for it"""
+    async with connection_pool.writer(document_db_path(document_id)) as conn:
         if page_id:
-            # Use page_id if provided
-            query = """
-                INSERT OR REPLACE INTO page_images_vectors (page_id, vector_data) VALUES (?, ?)
-            """
-            try:
-                await conn.execute(query, (page_id, vector_blob))
-                await conn.commit()
-                print(f"[{datetime.now()}] Successfully stored page vector - Document: {document_id}, Page: {page_number}, Page ID: {page_id}")
-            except Exception as e:
-                print(f"[{datetime.now()}] Database error while storing page vector: {str(e)}")
-                raise
-            finally:
-                await conn._execute(conn._conn.enable_load_extension, False)
+            await conn.execute("UPDATE page_images SET embedding_failed = 1 WHERE page_id = ?", (page_id,))
         else:
-            # Fall back to document_id and page_number
-            select_query = """
-                SELECT page_id FROM page_images 
-                WHERE document_id = ? AND page_number = ?
-            """
-            async with conn.execute(select_query, (document_id, page_number)) as cursor:
-                row = await cursor.fetchone()
-                if row:
-                    page_id = row[0]
-                    query = """
-                        INSERT OR REPLACE INTO page_images_vectors (page_id, vector_data) VALUES (?, ?)
-                    """
-                    try:
-                        await conn.execute(query, (page_id, vector_blob))
-                        await conn.commit()
-                        print(f"[{datetime.now()}] Successfully stored page vector - Document: {document_id}, Page: {page_number}")
-                    except Exception as e:
-                        print(f"[{datetime.now()}] Database error while storing page vector: {str(e)}")
-                        raise
-                    finally:
-                        await conn._execute(conn._conn.enable_load_extension, False)
-                else:
-                    print(f"[{datetime.now()}] ERROR: Page not found for Document: {document_id}, Page: {page_number}")
-                    await conn._execute(conn._conn.enable_load_extension, False)
-                    raise ValueError("Page not found")
\ No newline at end of file
+            await conn.execute(
+                "UPDATE page_images SET embedding_failed = 1 WHERE document_id = ? AND page_number = ?",
+                (document_id, page_number)
+            )
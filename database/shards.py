@@ -0,0 +1,44 @@
+# database/shards.py
+
+import asyncio, os, zlib
+
+from config import LOCAL_DB_PATH, SHARD_COUNT
+
+
+
+def shard_index(document_id: str) -> int:
+    """Stable shard number of a document (crc32, so it does not change between runs like hash() does)"""
+    return zlib.crc32(str(document_id).encode("utf-8")) % SHARD_COUNT
+
+
+def shard_path(index: int) -> str:
+    """Database file of one shard, e.g. database/mydatabase.shard3.db"""
+    if SHARD_COUNT == 1:
+        return LOCAL_DB_PATH
+    base, extension = os.path.splitext(LOCAL_DB_PATH)
+    return f"{base}.shard{index}{extension}"
+
+
+def document_db_path(document_id: str) -> str:
+    """Database file that owns a document and all of its pages, vectors and index rows"""
+    return shard_path(shard_index(document_id))
+
+
+def all_db_paths() -> list[str]:
+    return [shard_path(index) for index in range(SHARD_COUNT)]
+
+
+def group_by_shard(document_ids: list[str]) -> dict[str, list[str]]:
+    """Map each owning database file to the documents it holds"""
+    groups = {}
+    for document_id in document_ids:
+        groups.setdefault(document_db_path(document_id), []).append(document_id)
+    return groups
+
+
+
+async def gather_shards(function, *args, db_paths: list[str] = None) -> list:
+    """Run `function(db_path, *args)` on every shard at once and return the per-shard results in shard order.
+    Each aiosqlite connection runs in its own thread and SQLite releases the GIL while it scans,
+    so the shard queries use one core each."""
+    return await asyncio.gather(*(function(db_path, *args) for db_path in (db_paths or all_db_paths())))
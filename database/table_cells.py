@@ -0,0 +1,134 @@
+# database/table_cells.py
+
+import re
+from typing import Optional
+
+
+
+TABULAR_ARGUMENTS = {"tabular": 1, "tabular*": 2, "tabularx": 2, "longtable": 1}
+TABULAR_BEGIN = re.compile(r"\\begin\{(tabular\*?|tabularx|longtable)\}")
+
+# Commands whose arguments hold digits that are not table values; blanked to the same length so offsets stay valid
+NON_VALUE_PATTERN = re.compile(
+    r"\\(?:cline|cmidrule(?:\([^)]*\))?|cite|ref|label|footnote|vspace|hspace|rule|addlinespace|arraybackslash)"
+    r"(?:\[[^\]]*\])?(?:\{[^}]*\})*"
+    r"|\\(?:multicolumn|multirow)\{\d+\}\{[^}]*\}"
+    r"|\^\{[^}]*\}|\^\d"
+    r"|\\[a-zA-Z]+\*?"
+)
+MULTICOLUMN_PATTERN = re.compile(r"\\multicolumn\{(\d+)\}")
+# Standalone numbers only: the 50 of "ResNet-50" or "x50" and the 16 of "ViT-B/16" are part of a name
+NUMBER_PATTERN = re.compile(r"(?<![\w.\-−–/])[-+−–]?(?:\d{1,3}(?:,\d{3})+(?!\d)|\d+)(?:\.\d+)?%?(?![\w./])|(?<![\w.\-−–/])[-+−–]?\.\d+%?(?![\w./])")
+
+
+
+def normalize_numeric(text: str) -> Optional[float]:
+    """Parse a cell value such as '76.3', '1,024', '−0.5' or '12%' to a float, None if it is not a number"""
+    cleaned = str(text).strip().strip("$").replace("−", "-").replace("–", "-").replace(",", "").rstrip("%").strip()
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def _skip_group(latex: str, i: int) -> int:
+    """Index just past the balanced {...} group starting at latex[i] (after whitespace)"""
+    while i < len(latex) and latex[i].isspace():
+        i += 1
+    if i >= len(latex) or latex[i] != "{":
+        return i
+    depth = 0
+    for j in range(i, len(latex)):
+        if latex[j] == "{" and latex[j - 1] != "\\":
+            depth += 1
+        elif latex[j] == "}" and latex[j - 1] != "\\":
+            depth -= 1
+            if depth == 0:
+                return j + 1
+    return len(latex)
+
+
+def _tabular_bodies(latex: str):
+    """Yield (start, end) offsets of the body of every tabular-like environment"""
+    for match in TABULAR_BEGIN.finditer(latex):
+        environment = match.group(1)
+        i = match.end()
+        if latex.startswith("[", i):
+            i = latex.find("]", i) + 1
+        for _ in range(TABULAR_ARGUMENTS[environment]):
+            i = _skip_group(latex, i)
+        end = latex.find(f"\\end{{{environment}}}", i)
+        yield i, end if end != -1 else len(latex)
+
+
+def _split_cells(latex: str, start: int, end: int):
+    """Yield (row, cell_start, cell_end) spans, splitting on unescaped & and \\\\ outside of braces"""
+    row, depth, cell_start, i = 0, 0, start, start
+    while i < end:
+        char = latex[i]
+        if char == "\\" and latex.startswith("\\\\", i) and depth == 0:
+            yield row, cell_start, i
+            row += 1
+            i += 2
+            # Skip the optional spacing argument of a row break, e.g. \\[2pt]
+            if latex.startswith("[", i):
+                i = latex.find("]", i) + 1
+            cell_start = i
+            continue
+        if char == "\\":
+            i += 2
+            continue
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+        elif char == "&" and depth == 0:
+            yield row, cell_start, i
+            cell_start = i + 1
+        i += 1
+    yield row, cell_start, end
+
+
+def parse_table_cells(latex: str) -> list[dict]:
+    """Every numeric value of every table in a LaTeX snippet, with its position.
+    Rows and columns count from 0 in source order, header rows included and rule-only lines skipped;
+    start/end are offsets of the number in `latex`."""
+    if not latex:
+        return []
+
+    masked = NON_VALUE_PATTERN.sub(lambda match: " " * len(match.group()), latex)
+    cells = []
+    for table_index, (body_start, body_end) in enumerate(_tabular_bodies(latex)):
+        row_offset, current_row, col, row_has_content = 0, None, 0, False
+        for row, cell_start, cell_end in _split_cells(latex, body_start, body_end):
+            if row != current_row:
+                if current_row is not None and not row_has_content:
+                    row_offset += 1
+                current_row, col, row_has_content = row, 0, False
+
+            text = masked[cell_start:cell_end]
+            row_has_content = row_has_content or bool(text.strip(" \t\n{}$"))
+            for number in NUMBER_PATTERN.finditer(text):
+                value = normalize_numeric(number.group())
+                if value is not None:
+                    cells.append({
+                        'table_index': table_index,
+                        'row': row - row_offset,
+                        'col': col,
+                        'raw_value': number.group(),
+                        'value': value,
+                        'start': cell_start + number.start(),
+                        'end': cell_start + number.end()
+                    })
+
+            span = MULTICOLUMN_PATTERN.search(latex, cell_start, cell_end)
+            col += int(span.group(1)) if span else 1
+    return cells
+
+
+def replace_cell_value(latex: str, cell: dict, new_value: str) -> Optional[str]:
+    """Replace the number stored at one (table_index, row, col) position, None if it is no longer there"""
+    for candidate in parse_table_cells(latex):
+        if all(candidate[key] == cell[key] for key in ('table_index', 'row', 'col', 'value')):
+            return latex[:candidate['start']] + str(new_value) + latex[candidate['end']:]
+    return None
@@ -0,0 +1,496 @@
+# database/vector_index.py
+
+from typing import Optional
+from datetime import datetime
+import asyncio
+import json
+import numpy as np
+
+from config import CASCADE_PREFIX_DIM, CASCADE_CANDIDATES, USE_VECTOR_SNAPSHOT, DELTA_COMPACTION_ROWS
+from database.quantization import decode_vector_blobs
+from database.vector_snapshot import read_snapshot
+from database.shards import gather_shards, all_db_paths
+from database.connection_pool import connection_pool
+
+
+
+def as_query_vector(query_vector, dim: int = None) -> np.ndarray:
+    """Flatten a query vector (list, nested list or array) to a normalized float32 array,
+    keeping only its first `dim` values (Matryoshka prefix) if given"""
+    query = np.asarray(query_vector, dtype=np.float32).reshape(-1)[:dim]
+    norm = np.linalg.norm(query)
+    return query / norm if norm > 0 else query
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize every row of the matrix in place, leaving all-zero rows untouched"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def document_vector(matrix: np.ndarray) -> np.ndarray:
+    """Normalized mean of a document's page vectors (each normalized first), as stored in documents_vectors"""
+    mean_vector = normalize_rows(np.array(matrix, dtype=np.float32)).mean(axis=0)
+    norm = np.linalg.norm(mean_vector)
+    return mean_vector / norm if norm > 0 else mean_vector
+
+
+def top_k_indices(scores: np.ndarray, amount: int) -> np.ndarray:
+    """Return the indices of the `amount` highest scores, best first"""
+    if amount <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+
+    if amount < scores.size:
+        # argpartition is O(N), only the k winners get fully sorted
+        candidates = np.argpartition(-scores, amount - 1)[:amount]
+    else:
+        candidates = np.arange(scores.size)
+
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+
+_registered_indexes = []
+
+
+def register_index(index):
+    """Track an index so that vector writes can mark it stale"""
+    _registered_indexes.append(index)
+    return index
+
+
+def invalidate_indexes():
+    """Mark every in-memory index stale after page vectors were written or deleted"""
+    for index in _registered_indexes:
+        index.invalidate()
+
+
+
+async def _db_load_shard_vectors(db_path: str, page_ids: list[str] = None) -> tuple[list[str], np.ndarray]:
+    """Read the stored vectors of one shard (only those of `page_ids` if given) as decoded float32 rows"""
+    async with connection_pool.reader(db_path) as conn:
+        query = "SELECT page_id, vector_data FROM page_images_vectors"
+        parameters = ()
+        if page_ids:
+            # vec0 answers `page_id = ?` with a primary key lookup but scans the whole table for `page_id IN (...)`,
+            # so the ids are joined in one by one
+            query = """
+                SELECT v.page_id, v.vector_data
+                FROM json_each(?) ids
+                JOIN page_images_vectors v ON v.page_id = ids.value
+            """
+            parameters = (json.dumps(list(page_ids)),)
+        async with conn.execute(query, parameters) as cursor:
+            rows = await cursor.fetchall()
+        if not rows:
+            return [], np.empty((0, 0), dtype=np.float32)
+        matrix = await decode_vector_blobs(conn, [row[1] for row in rows])
+
+    return [row[0] for row in rows], matrix
+
+
+def _merge_shard_vectors(shard_results: list[tuple[list[str], np.ndarray]]) -> tuple[list[str], np.ndarray]:
+    """Concatenate per-shard (page_ids, matrix) results into one row-normalized matrix"""
+    shard_results = [(page_ids, matrix) for page_ids, matrix in shard_results if page_ids]
+    if not shard_results:
+        return [], np.empty((0, 0), dtype=np.float32)
+    page_ids = [page_id for shard_page_ids, _ in shard_results for page_id in shard_page_ids]
+    matrix = shard_results[0][1] if len(shard_results) == 1 else np.concatenate([matrix for _, matrix in shard_results])
+    return page_ids, normalize_rows(matrix)
+
+
+
+async def db_load_vectors() -> tuple[list[str], np.ndarray]:
+    """Read every stored page vector, from all shards in parallel, into one contiguous, row-normalized float32 matrix"""
+    return _merge_shard_vectors(await gather_shards(_db_load_shard_vectors))
+
+
+
+async def _db_get_shard_vector_page_ids(db_path: str) -> list[str]:
+    async with connection_pool.reader(db_path) as conn:
+        async with conn.execute("SELECT page_id FROM page_images_vectors") as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+
+async def db_get_vector_page_ids() -> list[str]:
+    """List the page_id of every stored vector"""
+    return [page_id for shard_page_ids in await gather_shards(_db_get_shard_vector_page_ids) for page_id in shard_page_ids]
+
+
+
+async def db_load_vectors_by_ids(page_ids: list[str]) -> tuple[list[str], np.ndarray]:
+    """Read the stored float vectors of a few pages, e.g. to rerank a shortlist exactly"""
+    if not page_ids:
+        return [], np.empty((0, 0), dtype=np.float32)
+    # A page_id does not tell its shard, so every shard is asked for the whole list
+    return _merge_shard_vectors(await gather_shards(_db_load_shard_vectors, list(page_ids)))
+
+
+
+async def db_read_shard_delta(db_path: str, since_seq: int) -> tuple[list[str], np.ndarray, list[str], int]:
+    """Changes to the vectors of one shard logged in page_vector_log after `since_seq`: the pages written since
+    with their vectors, the pages whose vector was deleted since, and the shard's last seq. Everything is read
+    in one transaction so the vectors match the log."""
+    async with connection_pool.reader(db_path) as conn:
+        await conn.execute("BEGIN")
+        try:
+            async with conn.execute("SELECT COALESCE(MAX(seq), 0) FROM page_vector_log") as cursor:
+                high_water, = await cursor.fetchone()
+            # A logged page without a vector is a delete
+            query = """
+                SELECT l.page_id, v.vector_data
+                FROM page_vector_log l
+                LEFT JOIN page_images_vectors v ON v.page_id = l.page_id
+                WHERE l.seq > ? AND l.seq <= ?
+                ORDER BY l.seq
+            """
+            async with conn.execute(query, (since_seq, high_water)) as cursor:
+                rows = await cursor.fetchall()
+        finally:
+            await conn.rollback()
+        written = [row for row in rows if row[1] is not None]
+        matrix = await decode_vector_blobs(conn, [row[1] for row in written]) if written else np.empty((0, 0), dtype=np.float32)
+
+    return [row[0] for row in written], matrix, [row[0] for row in rows if row[1] is None], high_water
+
+
+
+async def db_get_vector_log_marks() -> list[int]:
+    """Last page_vector_log seq of every shard, in all_db_paths() order"""
+    return [high_water for _, _, _, high_water in await gather_shards(db_read_shard_delta, 2 ** 62)]
+
+
+async def _db_load_snapshot_delta() -> Optional[tuple[list[str], np.ndarray, list[tuple[list[str], np.ndarray, list[str], int]]]]:
+    """The memory-mapped snapshot and, per shard, the changes logged since it was taken; None if snapshots
+    are off or there is no usable one"""
+    if not USE_VECTOR_SNAPSHOT:
+        return None
+    snapshot = read_snapshot()
+    if snapshot is None:
+        return None
+
+    page_ids, matrix, log_marks = snapshot
+    db_paths = all_db_paths()
+    if log_marks is None or len(log_marks) != len(db_paths):
+        print(f"[{datetime.now()}] Vector snapshot has no log marks for these {len(db_paths)} shards: not using it")
+        return None
+    shard_deltas = await asyncio.gather(*(db_read_shard_delta(db_path, mark) for db_path, mark in zip(db_paths, log_marks)))
+    if any(mark > high_water for mark, (_, _, _, high_water) in zip(log_marks, shard_deltas)):
+        print(f"[{datetime.now()}] Vector snapshot is ahead of the database, it was taken from another one: not using it")
+        return None
+    return page_ids, matrix, shard_deltas
+
+
+async def db_load_search_vectors() -> tuple[list[str], np.ndarray]:
+    """Every current vector, for the indexes that rebuild in full: the memory-mapped snapshot with the changes
+    logged since it was taken applied (a copy, unless nothing changed), else every vector read through SQLite"""
+    snapshot = await _db_load_snapshot_delta()
+    if snapshot is None:
+        return await db_load_vectors()
+
+    page_ids, matrix, shard_deltas = snapshot
+    changed = {page_id for written, _, deleted, _ in shard_deltas for page_id in written + deleted}
+    if not changed:
+        return page_ids, matrix
+    kept = [i for i, page_id in enumerate(page_ids) if page_id not in changed]
+    delta_ids, delta_matrix = _merge_shard_vectors([(written, delta_matrix) for written, delta_matrix, _, _ in shard_deltas])
+    if not kept:
+        return delta_ids, delta_matrix
+    if not delta_ids:
+        return [page_ids[i] for i in kept], matrix[kept]
+    return [page_ids[i] for i in kept] + delta_ids, np.concatenate([matrix[kept], delta_matrix])
+
+
+
+class BuildDelta:
+    """Pages whose vector was written or deleted since an offline index file was built, read from
+    page_vector_log past the marks saved in the file. The file's rows of these pages are stale and skipped,
+    their current vectors are scored exactly until the next build."""
+
+    def __init__(self):
+        self.high_water: dict[str, int] = {}
+        self.changed: set[str] = set()
+        self.vectors: dict[str, np.ndarray] = {}
+        self.page_ids: list[str] = []
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+
+
+    def _apply(self, db_paths: list[str], shard_deltas: list[tuple[list[str], np.ndarray, list[str], int]]):
+        for db_path, (written, matrix, deleted, high_water) in zip(db_paths, shard_deltas):
+            self.changed.update(written)
+            self.changed.update(deleted)
+            for page_id in deleted:
+                self.vectors.pop(page_id, None)
+            if written:
+                self.vectors.update(zip(written, normalize_rows(matrix)))
+            self.high_water[db_path] = high_water
+        self.page_ids = list(self.vectors)
+        self.matrix = np.stack(list(self.vectors.values())) if self.vectors else np.empty((0, 0), dtype=np.float32)
+
+
+    async def reset(self, log_marks: Optional[list[int]]) -> bool:
+        """Start over from the marks of a newly loaded file; False if they do not belong to these shards"""
+        db_paths = all_db_paths()
+        if log_marks is None or len(log_marks) != len(db_paths):
+            return False
+        shard_deltas = await asyncio.gather(*(db_read_shard_delta(db_path, mark) for db_path, mark in zip(db_paths, log_marks)))
+        if any(mark > high_water for mark, (_, _, _, high_water) in zip(log_marks, shard_deltas)):
+            return False
+        self.changed, self.vectors = set(), {}
+        self._apply(db_paths, shard_deltas)
+        return True
+
+
+    async def refresh(self):
+        """Fetch the changes logged since the last reset or refresh"""
+        db_paths = all_db_paths()
+        self._apply(db_paths, await asyncio.gather(*(db_read_shard_delta(db_path, self.high_water.get(db_path, 0)) for db_path in db_paths)))
+
+
+    def merge(self, results: list[tuple[str, float]], query: np.ndarray, amount: int) -> list[dict]:
+        """Drop the stale pages from the index results (best first, fetched `amount + len(changed)` deep) and
+        merge in the exact scores of their current vectors"""
+        results = [(page_id, score) for page_id, score in results if page_id not in self.changed][:amount]
+        if self.page_ids:
+            scores = self.matrix @ query
+            results += [(self.page_ids[i], float(scores[i])) for i in top_k_indices(scores, amount)]
+            results.sort(key=lambda result: -result[1])
+        return [{'page_id': page_id, 'similarity': score} for page_id, score in results[:amount]]
+
+
+
+class MemoryIndex:
+    """Exact cosine search over all page vectors held in RAM, laid out like an LSM tree: an immutable main
+    segment (the memory-mapped snapshot or one full read) plus a small delta segment holding the vectors
+    written since. A write only makes the next search fetch the changes logged in page_vector_log: new rows
+    go to the delta, superseded and deleted rows are masked out, and a background compaction folds the delta
+    into a new main segment once it holds DELTA_COMPACTION_ROWS rows."""
+
+    def __init__(self):
+        self.page_ids: list[str] = []
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.live = np.ones(0, dtype=bool)
+        self.rows: dict[str, int] = {}
+        self.delta_ids: list[str] = []
+        self.delta_matrix = np.empty((0, 0), dtype=np.float32)
+        self.delta_live = np.ones(0, dtype=bool)
+        self.delta_rows: dict[str, int] = {}
+        self.dead = 0
+        self.deletes = 0
+        self.high_water: dict[str, int] = {}
+        self.prefix_matrix = None
+        self.compaction = None
+        self.lock = asyncio.Lock()
+        self.loaded = False
+        self.stale = True
+
+
+    def invalidate(self):
+        """Fetch the newly written vectors on the next search"""
+        self.stale = True
+
+
+    def _set_main(self, page_ids: list[str], matrix: np.ndarray):
+        self.page_ids, self.matrix = page_ids, matrix
+        self.live = np.ones(len(page_ids), dtype=bool)
+        self.rows = {page_id: i for i, page_id in enumerate(page_ids)}
+        self.delta_ids, self.delta_rows = [], {}
+        self.delta_matrix = np.empty((0, matrix.shape[1] if len(page_ids) else 0), dtype=np.float32)
+        self.delta_live = np.ones(0, dtype=bool)
+        self.dead = 0
+        self.prefix_matrix = None
+
+
+    def _upsert(self, page_ids: list[str], matrix: np.ndarray):
+        """Append rows to the delta, masking the older row of every page they replace"""
+        if not page_ids:
+            return
+        for i, page_id in enumerate(page_ids):
+            if page_id in self.delta_rows:
+                self.delta_live[self.delta_rows[page_id]] = False
+                self.dead += 1
+            elif page_id in self.rows and self.live[self.rows[page_id]]:
+                self.live[self.rows[page_id]] = False
+                self.dead += 1
+            self.delta_rows[page_id] = len(self.delta_ids) + i
+        self.delta_ids = self.delta_ids + page_ids
+        self.delta_matrix = np.concatenate([self.delta_matrix.reshape(-1, matrix.shape[1]), normalize_rows(matrix)])
+        self.delta_live = np.concatenate([self.delta_live, np.ones(len(page_ids), dtype=bool)])
+
+
+    def _delete(self, page_ids: list[str]):
+        """Mask the rows of pages whose vector was deleted"""
+        for page_id in page_ids:
+            if page_id in self.delta_rows:
+                row = self.delta_rows.pop(page_id)
+                self.delta_live[row] = False
+            elif page_id in self.rows and self.live[self.rows[page_id]]:
+                self.live[self.rows[page_id]] = False
+            else:
+                continue
+            self.dead += 1
+            self.deletes += 1
+
+
+    def _apply_deltas(self, shard_deltas: list[tuple[list[str], np.ndarray, list[str], int]]):
+        for db_path, (page_ids, matrix, deleted_ids, high_water) in zip(all_db_paths(), shard_deltas):
+            # A page is logged once, so it is either among the deletes or among the writes of one delta
+            self._delete(deleted_ids)
+            self._upsert(page_ids, matrix)
+            self.high_water[db_path] = high_water
+
+
+    async def _full_load(self):
+        start = datetime.now()
+        snapshot = await _db_load_snapshot_delta()
+        if snapshot is not None:
+            # The snapshot is the main segment even if it is behind: what changed since it was taken goes to the delta
+            page_ids, matrix, shard_deltas = snapshot
+            self._set_main(page_ids, matrix)
+            self._apply_deltas(shard_deltas)
+        else:
+            # Marks first: rows written during the load come back through the delta and replace their copy
+            marks = await db_get_vector_log_marks()
+            page_ids, matrix = await db_load_vectors()
+            self._set_main(page_ids, matrix)
+            self.high_water = dict(zip(all_db_paths(), marks))
+        self.loaded = True
+        print(f"[{datetime.now()}] Loaded {len(self.page_ids)} page vectors ({len(self.delta_ids)} in the delta) into memory in {(datetime.now() - start).total_seconds():.2f}s")
+
+
+    async def _refresh_delta(self):
+        """Fetch the vectors written and deleted since the last refresh"""
+        self._apply_deltas(await asyncio.gather(*(db_read_shard_delta(db_path, self.high_water.get(db_path, 0)) for db_path in all_db_paths())))
+
+
+    async def ensure_loaded(self):
+        """Load the vectors on first use, then only fetch the new ones after each write"""
+        if not self.stale:
+            return
+
+        async with self.lock:
+            if not self.stale:
+                return
+            # Cleared first, so a write landing during the refresh is fetched by the next one
+            self.stale = False
+            try:
+                if self.loaded:
+                    await self._refresh_delta()
+                else:
+                    await self._full_load()
+            except BaseException:
+                self.stale = True
+                raise
+
+        if len(self.delta_ids) >= DELTA_COMPACTION_ROWS and self.compaction is None:
+            self.compaction = asyncio.create_task(self._compact())
+
+
+    async def _compact(self):
+        """Fold the delta into a new main segment in a worker thread; searches keep using the old one meanwhile"""
+        try:
+            start = datetime.now()
+            page_ids, matrix, live, deletes = self.page_ids, self.matrix, self.live.copy(), self.deletes
+            folded_delta, delta_live = len(self.delta_ids), self.delta_live[:len(self.delta_ids)].copy()
+            delta_ids, delta_matrix = self.delta_ids, self.delta_matrix
+
+            def fold():
+                return np.concatenate([matrix[live], delta_matrix[:folded_delta][delta_live]])
+            new_matrix = await asyncio.to_thread(fold)
+            new_page_ids = [page_id for page_id, alive in zip(page_ids, live) if alive] + \
+                           [page_id for page_id, alive in zip(delta_ids[:folded_delta], delta_live) if alive]
+
+            async with self.lock:
+                if self.page_ids is not page_ids:
+                    return  # A full reload replaced the main segment meanwhile
+                if self.deletes != deletes:
+                    return  # Deletes are not replayed, the next refresh starts the compaction over
+                # Rows fetched during the fold are replayed on top of the new main segment
+                newer_ids, newer_matrix = self.delta_ids[folded_delta:], self.delta_matrix[folded_delta:]
+                self._set_main(new_page_ids, new_matrix)
+                self._upsert(newer_ids, newer_matrix)
+            print(f"[{datetime.now()}] Compacted {folded_delta} delta rows into {len(new_page_ids)} page vectors in {(datetime.now() - start).total_seconds():.2f}s")
+        finally:
+            self.compaction = None
+
+
+    def _top_results(self, scores: np.ndarray, delta_scores: np.ndarray, amount: int) -> list[dict]:
+        """Best `amount` of both segments, masked rows excluded"""
+        if self.dead:
+            scores[~self.live] = -np.inf
+            delta_scores[~self.delta_live] = -np.inf
+        results = [(self.page_ids[i], scores[i]) for i in top_k_indices(scores, amount)] + \
+                  [(self.delta_ids[i], delta_scores[i]) for i in top_k_indices(delta_scores, amount)]
+        results.sort(key=lambda result: -result[1])
+        return [{'page_id': page_id, 'similarity': float(score)} for page_id, score in results[:amount] if score > -np.inf]
+
+
+    def _dim(self) -> int:
+        return self.matrix.shape[1] if len(self.page_ids) else self.delta_matrix.shape[1]
+
+
+    async def search(self, query_vector, amount: int) -> list[dict]:
+        await self.ensure_loaded()
+        if not self.page_ids and not self.delta_ids:
+            return []
+
+        # Rows and query are normalized, so the dot product is the cosine similarity
+        query = as_query_vector(query_vector, self._dim())
+        scores = self.matrix @ query if self.page_ids else np.empty(0, dtype=np.float32)
+        return self._top_results(scores, self.delta_matrix @ query, amount)
+
+
+    async def search_batch(self, query_vectors, amount: int, max_scores: int = 2 ** 26) -> list[list[dict]]:
+        """Exact top-k for many queries with matrix-matrix products, in blocks of at most `max_scores` scores"""
+        await self.ensure_loaded()
+        if not self.page_ids and not self.delta_ids:
+            return [[] for _ in query_vectors]
+
+        dim = self._dim()
+        queries = np.stack([as_query_vector(query_vector, dim) for query_vector in query_vectors])
+        block_size = max(1, max_scores // max(1, len(self.page_ids)))
+
+        results = []
+        for block_start in range(0, len(queries), block_size):
+            block = queries[block_start:block_start + block_size]
+            scores = self.matrix @ block.T if self.page_ids else np.empty((0, len(block)), dtype=np.float32)
+            delta_scores = self.delta_matrix @ block.T
+            for column, delta_column in zip(scores.T, delta_scores.T):
+                results.append(self._top_results(column.copy(), delta_column.copy(), amount))
+        return results
+
+
+    async def cascade_search(self, query_vector, amount: int, prefix_dim: int = CASCADE_PREFIX_DIM, candidates: int = CASCADE_CANDIDATES) -> list[dict]:
+        """Two-stage search: pick candidates on a short Matryoshka prefix, then re-score them in full.
+        The delta segment is small and always scored in full."""
+        await self.ensure_loaded()
+        if not self.page_ids and not self.delta_ids:
+            return []
+
+        query = as_query_vector(query_vector, self._dim())
+        delta_scores = self.delta_matrix @ query
+        if not self.page_ids:
+            return self._top_results(np.empty(0, dtype=np.float32), delta_scores, amount)
+
+        full_dim = self.matrix.shape[1]
+        prefix_dim = min(prefix_dim, full_dim)
+        if self.prefix_matrix is None or self.prefix_matrix.shape[1] != prefix_dim:
+            # Contiguous copy so stage one only streams prefix_dim floats per page
+            self.prefix_matrix = normalize_rows(np.ascontiguousarray(self.matrix[:, :prefix_dim]))
+
+        # Stage one: coarse scores over every page using the prefix only
+        coarse_scores = self.prefix_matrix @ as_query_vector(query, prefix_dim)
+        if self.dead:
+            coarse_scores[~self.live] = -np.inf
+        shortlist = top_k_indices(coarse_scores, max(candidates, amount))
+
+        # Stage two: exact scores for the shortlist only
+        scores = np.full(len(self.page_ids), -np.inf, dtype=np.float32)
+        scores[shortlist] = self.matrix[shortlist] @ query
+        return self._top_results(scores, delta_scores, amount)
+
+
+
+memory_index = register_index(MemoryIndex())
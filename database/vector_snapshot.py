@@ -0,0 +1,76 @@
+# database/vector_snapshot.py
+
+from typing import Optional
+from datetime import datetime
+import json, glob, os
+import numpy as np
+
+from config import VECTOR_SNAPSHOT_PATH
+
+
+
+def _data_path(path: str, generation: int, name: str) -> str:
+    """e.g. database/mydatabase.snapshot.42.vectors.npy next to database/mydatabase.snapshot.json"""
+    return f"{os.path.splitext(path)[0]}.{generation}.{name}.npy"
+
+
+def _save_array(array: np.ndarray, path: str) -> None:
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(temp_path, path)
+
+
+
+def write_snapshot(page_ids: list[str], matrix: np.ndarray, generation: int, log_marks: list[int], path: str = VECTOR_SNAPSHOT_PATH) -> None:
+    """Save the normalized float32 matrix and its page_ids as .npy files, then point the manifest at them.
+    `log_marks` is the last page_vector_log seq of every shard when the vectors were read, so readers can
+    catch up on the changes made since. The manifest is replaced last, so readers only ever see a complete
+    snapshot; processes that still map the previous files keep reading them after they are unlinked."""
+    vectors_path = _data_path(path, generation, "vectors")
+    page_ids_path = _data_path(path, generation, "page_ids")
+    _save_array(np.ascontiguousarray(matrix, dtype=np.float32), vectors_path)
+    _save_array(np.array(page_ids, dtype=str), page_ids_path)
+
+    manifest = {
+        "generation": generation,
+        "log_marks": list(log_marks),
+        "rows": len(page_ids),
+        "dim": int(matrix.shape[1]) if len(page_ids) else 0,
+        "vectors": os.path.basename(vectors_path),
+        "page_ids": os.path.basename(page_ids_path),
+        "created": datetime.now().isoformat()
+    }
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, path)
+
+    # Drop the files of older snapshots
+    for old_path in glob.glob(f"{os.path.splitext(path)[0]}.*.npy"):
+        if old_path not in (vectors_path, page_ids_path):
+            os.remove(old_path)
+    print(f"[{datetime.now()}] Saved vector snapshot of {len(page_ids)} pages at generation {generation} to {path}")
+
+
+
+def read_snapshot(path: str = VECTOR_SNAPSHOT_PATH) -> Optional[tuple[list[str], np.ndarray, Optional[list[int]]]]:
+    """Memory-map the snapshot, returning its page_ids, matrix and per-shard log marks (None for a snapshot
+    written before they were recorded), or None if there is no usable snapshot. The matrix is read-only and
+    its pages are shared through the OS page cache by every process that maps it."""
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        manifest = json.load(f)
+    log_marks = manifest.get("log_marks")
+    if not manifest["rows"]:
+        return [], np.empty((0, 0), dtype=np.float32), log_marks
+
+    directory = os.path.dirname(path)
+    matrix = np.load(os.path.join(directory, manifest["vectors"]), mmap_mode="r")
+    page_ids = np.load(os.path.join(directory, manifest["page_ids"])).tolist()
+    if matrix.shape != (manifest["rows"], manifest["dim"]) or len(page_ids) != manifest["rows"]:
+        print(f"[{datetime.now()}] Vector snapshot files do not match their manifest: not using them")
+        return None
+    return page_ids, matrix, log_marks
@@ -17,7 +17,9 @@ from database.search_in_db import combine_search_results
 from get_ai_response.call_chat_model import generate_answer
 from database.image_processing import resize_base64_image
 from database.getters_latex import db_get_image_latex
-from get_ai_response.latex_to_image import modify_numeric_values, latex_to_base64
+from database.getters_cells import find_edit_target
+from database.table_cells import replace_cell_value
+from get_ai_response.latex_to_image import latex_to_base64
 
 # Global counter for unique window names
 _window_counter = 0
@@ -128,13 +130,21 @@ async def rag(messages: list, old_image_ids: list = None):
     # print("Original value:", original_value)
     # print("New value:", new_value)
     
-    if image_number:
+    if image_number and old_image_ids:
         # print("Image number found")
-        target_id = old_image_ids[int(image_number) % 3]
+        # Validate the edit against the cells index before spending a render on it
+        target_cell = await find_edit_target(old_image_ids, int(image_number), original_value)
+        if target_cell is None:
+            print(f"No table cell with value {original_value} in images {old_image_ids}, edit skipped")
+            return messages, image_ids
+        target_id = target_cell['page_id']
         # print("Target image id:", target_id)
         latex_code = await db_get_image_latex(target_id)
         # print("Latex code generated")
-        new_latex = modify_numeric_values(latex_code, str(original_value), str(new_value))
+        new_latex = replace_cell_value(latex_code, target_cell, str(new_value))
+        if new_latex is None:
+            print(f"Table cell {target_cell} no longer matches the LaTeX of image {target_id}, edit skipped")
+            return messages, image_ids
         # print("Latex code modified")
         image_base64 = latex_to_base64(new_latex)
         # print("Image base64 generated")
@@ -0,0 +1,75 @@
+# tests/conftest.py
+
+import asyncio, os, shutil, sys, tempfile
+import numpy as np
+import pytest
+
+# Add the parent directory to sys.path to enable imports from adjacent modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+# The database modules read these settings at import time, so they point at a scratch directory before any is imported
+TEST_DIR = tempfile.mkdtemp(prefix="pdf_rag_tests_")
+config.LOCAL_DB_PATH = os.path.join(TEST_DIR, "test.db")
+config.IVF_INDEX_PATH = os.path.join(TEST_DIR, "test.ivf.npz")
+config.HNSW_INDEX_PATH = os.path.join(TEST_DIR, "test.hnsw.npz")
+config.PQ_INDEX_PATH = os.path.join(TEST_DIR, "test.pq.npz")
+config.VECTOR_SNAPSHOT_PATH = os.path.join(TEST_DIR, "test.snapshot.json")
+config.QUERY_CACHE_PATH = os.path.join(TEST_DIR, "query_cache.db")
+config.PROCESSED_FOLDER = TEST_DIR
+config.USE_VECTOR_SNAPSHOT = False
+config.SEARCH_BACKEND = "memory"
+
+from admin.create_db import create_database
+from database.shards import all_db_paths
+from database.connection_pool import connection_pool
+from database.search_cache import search_cache
+from database.page_dedup import duplicate_detector
+import database.index_generation as index_generation
+import database.vector_index as vector_index
+
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+
+
+@pytest.fixture
+def database():
+    """Empty databases in the scratch directory, with the process-wide indexes and caches reset"""
+    for name in os.listdir(TEST_DIR):
+        os.remove(os.path.join(TEST_DIR, name))
+    for db_path in all_db_paths():
+        create_database(db_path)
+
+    # The singletons hold state (and asyncio locks) from the previous test's event loop
+    for index in vector_index._registered_indexes:
+        index.__init__()
+    search_cache.__init__()
+    duplicate_detector.__init__()
+    index_generation._last_seen_generation = None
+    return config.LOCAL_DB_PATH
+
+
+@pytest.fixture
+def run(database):
+    """Run a coroutine in a fresh event loop, closing the pooled connections before the loop goes away"""
+    def run_coroutine(coroutine):
+        async def main():
+            try:
+                return await coroutine
+            finally:
+                await connection_pool.close()
+        return asyncio.run(main())
+    return run_coroutine
+
+
+@pytest.fixture
+def unit_vectors():
+    """`count` random normalized vectors of the configured embedding size"""
+    def make(count: int, seed: int = 0) -> np.ndarray:
+        vectors = np.random.default_rng(seed).standard_normal((count, config.EMBEDDING_DIM)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return make
@@ -0,0 +1,69 @@
+# tests/test_bulk_load.py
+
+import sqlite3, sqlite_vec
+import pytest
+
+from database.bulk_load import BulkLoader, DEFERRED_OBJECTS, check_consistency, missing_deferred_objects, recover_interrupted_load
+
+
+
+def open_database(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.enable_load_extension(True)
+    sqlite_vec.load(conn)
+    conn.enable_load_extension(False)
+    return conn
+
+
+def add_documents(loader: BulkLoader, vectors, first: int = 0):
+    for i, vector in enumerate(vectors, start=first):
+        loader.add_document(f"Report {i}", [f"revenue table {i}"], vectors=[vector], page_ids=[f"page{i}"], document_id=f"doc{i}")
+
+
+def assert_restored(db_path: str, documents: int):
+    conn = open_database(db_path)
+    try:
+        assert missing_deferred_objects(conn) == []
+        assert check_consistency(conn) == []
+        assert conn.execute("SELECT COUNT(*) FROM page_images_fts WHERE page_images_fts MATCH 'revenue'").fetchone()[0] == documents
+        assert conn.execute("SELECT SUM(processed_pages) FROM documents").fetchone()[0] == documents
+        assert conn.execute("SELECT COUNT(*) FROM documents_vectors").fetchone()[0] == documents
+    finally:
+        conn.close()
+
+
+
+def test_finish_restores_the_deferred_objects(database, unit_vectors):
+    with BulkLoader(batch_pages=4) as loader:
+        add_documents(loader, unit_vectors(10))
+        assert set(missing_deferred_objects(loader.connections[database])) == {name for _, name in DEFERRED_OBJECTS}
+        assert loader.finish() == {database: []}
+    assert_restored(database, 10)
+
+
+def test_failed_load_restores_the_deferred_objects(database, unit_vectors):
+    vectors = unit_vectors(10)
+    with pytest.raises(ValueError):
+        with BulkLoader(batch_pages=4) as loader:
+            add_documents(loader, vectors)
+            # A vector of the wrong size stops the load after two committed batches
+            add_documents(loader, [vectors[0][:10]], first=10)
+
+    # The committed batches stay, indexed and counted; the buffered rows are dropped
+    assert_restored(database, 8)
+
+
+def test_killed_load_is_recovered_on_the_next_start(database, unit_vectors):
+    loader = BulkLoader(batch_pages=4)
+    add_documents(loader, unit_vectors(10))
+    # Killed: the connections go away without finish() or abort()
+    for conn in loader.connections.values():
+        conn.close()
+
+    conn = open_database(database)
+    assert missing_deferred_objects(conn)
+    conn.close()
+
+    assert sorted(recover_interrupted_load(database)) == sorted(name for _, name in DEFERRED_OBJECTS)
+    assert_restored(database, 8)
+    assert recover_interrupted_load(database) == []
@@ -0,0 +1,133 @@
+# tests/test_getters_search.py
+
+import sqlite3, sqlite_vec
+import numpy as np
+
+import database.getters_search as getters_search
+import database.quantization as quantization
+from admin.quantize_db import read_float_vectors, store_int8_vectors
+from database.quantization import calibrate_int8, quantize_int8
+from database.getters_search import db_get_vector_list, db_get_vector_list_batch, db_hierarchical_vector_list, db_knn_vector_list
+from database.setters_documents import db_store_pdf_file
+from database.setters_vectors import store_page_vector
+from database.search_cache import search_cache
+from database.connection_pool import connection_pool
+
+
+
+async def store_document(document_id: str, vectors: np.ndarray):
+    await db_store_pdf_file(document_id, document_id, ["page"] * len(vectors), vectors=vectors,
+                            page_ids=[f"{document_id}-p{i}" for i in range(len(vectors))])
+
+
+def page_ids_of(results: list[dict]) -> list[str]:
+    return [result["page_id"] for result in results]
+
+
+
+def test_batch_matches_single_queries_and_shares_their_cache(run, database, unit_vectors):
+    vectors = unit_vectors(30)
+
+    async def scenario():
+        await store_document("doc0", vectors[:20])
+        queries = [vectors[2], vectors[7], vectors[11]]
+
+        batch_results = await db_get_vector_list_batch(queries, 5)
+        assert [page_ids_of(results)[0] for results in batch_results] == ["doc0-p2", "doc0-p7", "doc0-p11"]
+
+        hits = search_cache.hits
+        single_results = [await db_get_vector_list(query, 5) for query in queries]
+        assert single_results == batch_results
+        assert search_cache.hits == hits + len(queries)
+
+    run(scenario())
+
+
+def test_batch_sees_writes_from_another_connection(run, database, unit_vectors):
+    vectors = unit_vectors(30)
+
+    async def scenario():
+        await store_document("doc0", vectors[:10])
+        await store_document("doc1", vectors[10:20])
+        query = vectors[12]
+        assert page_ids_of((await db_get_vector_list_batch([query], 1))[0]) == ["doc1-p2"]
+
+        # A delete through a plain connection, like another process would do: only the generation bump tells
+        async with connection_pool.writer(database) as conn:
+            await conn.execute("DELETE FROM page_images WHERE document_id = 'doc1'")
+        results = page_ids_of((await db_get_vector_list_batch([query], 10))[0])
+        assert results and not [page_id for page_id in results if page_id.startswith("doc1-")]
+
+        # A new document holding the exact query vector is found on the next batch
+        await store_document("doc2", vectors[12:13])
+        assert page_ids_of((await db_get_vector_list_batch([query], 1))[0]) == ["doc2-p0"]
+
+    run(scenario())
+
+
+def test_scoped_query_on_int8_storage(run, database, unit_vectors, monkeypatch):
+    vectors = unit_vectors(40)
+    run(store_document("doc0", vectors[:20]))
+    run(store_document("doc1", vectors[20:]))
+
+    # Convert the stored vectors like admin/quantize_db.py does, then search with VECTOR_STORAGE = "int8"
+    conn = sqlite3.connect(database)
+    conn.enable_load_extension(True)
+    sqlite_vec.load(conn)
+    page_ids, matrix = read_float_vectors(conn)
+    scale, offset = calibrate_int8(matrix)
+    store_int8_vectors(conn, page_ids, quantize_int8(matrix, scale, offset), scale, offset)
+    conn.close()
+    for module in (getters_search, quantization):
+        monkeypatch.setattr(module, "VECTOR_STORAGE", "int8")
+    monkeypatch.setattr(quantization, "_quantization_cache", None)
+
+    async def scenario():
+        query = vectors[25]
+        results = await db_get_vector_list(query, 5, document_ids=["doc1"])
+        assert page_ids_of(results)[0] == "doc1-p5"
+        assert all(page_id.startswith("doc1-") for page_id in page_ids_of(results))
+        # Rescored on the decoded vectors, so the similarities are close to the float32 ones
+        expected = vectors[20:] @ query
+        for result in results:
+            assert abs(result["similarity"] - expected[int(result["page_id"].split("-p")[1])]) < 0.02
+
+        dated = await db_get_vector_list(query, 3, date_from="2000-01-01")
+        assert page_ids_of(dated)[0] == "doc1-p5"
+
+    run(scenario())
+
+
+async def read_document_vectors(db_path: str) -> dict[str, bytes]:
+    async with connection_pool.reader(db_path) as conn:
+        async with conn.execute("SELECT document_id, vector_data FROM documents_vectors") as cursor:
+            return {row[0]: bytes(row[1]) for row in await cursor.fetchall()}
+
+
+def test_hierarchical_search_covers_documents_without_a_vector(run, database, unit_vectors):
+    vectors = unit_vectors(40)
+
+    async def scenario():
+        for i in range(4):
+            await store_document(f"doc{i}", vectors[10 * i:10 * i + 10])
+        document_vectors = await read_document_vectors(database)
+        assert sorted(document_vectors) == ["doc0", "doc1", "doc2", "doc3"]
+
+        # Re-storing a page vector updates its document's vector
+        await store_page_vector("doc1", 0, vectors[5], page_id="doc1-p0")
+        updated = await read_document_vectors(database)
+        assert updated["doc1"] != document_vectors["doc1"] and updated["doc0"] == document_vectors["doc0"]
+
+        # Deleting a page drops the vector of its document, whose other pages are still found
+        async with connection_pool.writer(database) as conn:
+            await conn.execute("DELETE FROM page_images WHERE page_id = ?", ("doc2-p0",))
+        assert "doc2" not in await read_document_vectors(database)
+        assert page_ids_of(await db_hierarchical_vector_list(vectors[23], 1, documents=1)) == ["doc2-p3"]
+
+        # No document vector at all, e.g. a database filled before they existed: every page is searched
+        async with connection_pool.writer(database) as conn:
+            await conn.execute("DELETE FROM documents_vectors")
+        for query in (vectors[3], vectors[37]):
+            assert await db_hierarchical_vector_list(query, 5, documents=1) == await db_knn_vector_list(query, 5)
+
+    run(scenario())
@@ -0,0 +1,60 @@
+# tests/test_getters_text.py
+
+import sqlite3, sqlite_vec
+
+from database.getters_text import db_get_text_matches, build_fts_query
+from database.setters_documents import db_store_pdf_file
+from database.schema import vacuum_database
+
+
+
+PAGES = {
+    "revenue-table": "Revenue by segment, revenue growth and operating revenue per region",
+    "cost-table": "Operating cost by segment",
+    "revenue-note": "A note that mentions revenue once",
+    "unrelated": "Employee headcount by country",
+}
+
+
+async def store_pages():
+    await db_store_pdf_file("doc0", "Annual report", list(PAGES.values()), page_ids=list(PAGES))
+
+
+def page_ids_of(results: list[dict]) -> list[str]:
+    return [result["page_id"] for result in results]
+
+
+def open_database(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.enable_load_extension(True)
+    sqlite_vec.load(conn)
+    conn.enable_load_extension(False)
+    return conn
+
+
+
+def test_build_fts_query_quotes_every_word():
+    assert build_fts_query('revenue "growth" AND-OR') == '"revenue" OR "growth" OR "AND" OR "OR"'
+    assert build_fts_query("  ,;  ") is None
+
+
+def test_bm25_ranks_the_densest_match_first(run, database):
+    async def scenario():
+        await store_pages()
+        return page_ids_of(await db_get_text_matches("revenue segment", 10))
+
+    assert run(scenario()) == ["revenue-table", "cost-table", "revenue-note"]
+
+
+def test_vacuum_rebuilds_the_index_over_renumbered_rowids(run, database):
+    run(store_pages())
+
+    conn = open_database(database)
+    # What a VACUUM is allowed to do to a table without an INTEGER PRIMARY KEY
+    conn.execute("UPDATE page_images SET rowid = rowid + 1000")
+    conn.commit()
+    assert not run(db_get_text_matches("revenue", 10))
+
+    vacuum_database(conn)
+    conn.close()
+    assert page_ids_of(run(db_get_text_matches("revenue", 10))) == ["revenue-table", "revenue-note"]
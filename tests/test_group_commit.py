@@ -0,0 +1,42 @@
+# tests/test_group_commit.py
+
+import pytest
+
+from database.group_commit import GroupCommitWriter
+from database.connection_pool import connection_pool
+
+
+
+def insert_document(document_id: str, fail_after_insert: bool = False):
+    async def operation(conn):
+        await conn.execute("INSERT INTO documents (document_id, title, total_pages) VALUES (?, ?, 1)", (document_id, document_id))
+        if fail_after_insert:
+            # Fails after writing, so the savepoint has a row to roll back
+            await conn.execute("INSERT INTO documents (document_id, title, total_pages) VALUES (?, ?, 1)", (document_id, document_id))
+        return document_id
+    return operation
+
+
+
+def test_failing_write_is_rolled_back_alone(run, database):
+    async def scenario():
+        # A long delay so the three writes land in one batch
+        writer = GroupCommitWriter(batch_size=3, batch_delay_ms=5000)
+        futures = [
+            writer.submit(database, insert_document("doc0")),
+            writer.submit(database, insert_document("doc1", fail_after_insert=True)),
+            writer.submit(database, insert_document("doc2"))
+        ]
+        try:
+            assert await futures[0] == "doc0"
+            with pytest.raises(Exception, match="UNIQUE"):
+                await futures[1]
+            assert await futures[2] == "doc2"
+        finally:
+            writer.task.cancel()
+
+        async with connection_pool.reader(database) as conn:
+            async with conn.execute("SELECT document_id FROM documents ORDER BY document_id") as cursor:
+                assert [row[0] for row in await cursor.fetchall()] == ["doc0", "doc2"]
+
+    run(scenario())
@@ -0,0 +1,119 @@
+# tests/test_index_hnsw.py
+
+import os
+import numpy as np
+import pytest
+
+import database.index_hnsw as index_hnsw
+from database.index_hnsw import HNSWIndex, hnsw_index
+from database.index_generation import sync_generation
+from database.setters_documents import db_store_pdf_file
+from database.connection_pool import connection_pool
+
+
+
+async def store_documents(vectors: np.ndarray, first_document: int = 0, pages_per_document: int = 10):
+    for start in range(0, len(vectors), pages_per_document):
+        document_id = f"doc{first_document + start // pages_per_document}"
+        document_vectors = vectors[start:start + pages_per_document]
+        await db_store_pdf_file(document_id, document_id, ["page"] * len(document_vectors), vectors=document_vectors,
+                                page_ids=[f"{document_id}-p{i}" for i in range(len(document_vectors))])
+
+
+async def delete_document(db_path: str, document_id: str):
+    async with connection_pool.writer(db_path) as conn:
+        await conn.execute("DELETE FROM page_images WHERE document_id = ?", (document_id,))
+        await conn.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+
+
+def page_ids_of(results: list[dict]) -> list[str]:
+    return [result["page_id"] for result in results]
+
+
+
+def test_deleted_pages_are_tombstoned(run, database, unit_vectors):
+    vectors = unit_vectors(60)
+
+    async def scenario():
+        await store_documents(vectors)
+        await sync_generation()
+        assert page_ids_of(await hnsw_index.search(vectors[3], 1)) == ["doc0-p3"]
+
+        # Another writer deletes a document: the generation bump must reach the graph through invalidate_indexes()
+        await delete_document(database, "doc0")
+        await sync_generation()
+        results = page_ids_of(await hnsw_index.search(vectors[3], 10))
+        assert len(results) == 10
+        assert not [page_id for page_id in results if page_id.startswith("doc0-")]
+        assert len(hnsw_index.deleted) == 10
+
+        # Tombstones survive a save and reload
+        await hnsw_index.save()
+        reloaded = HNSWIndex(hnsw_index.path)
+        await reloaded.ensure_loaded()
+        assert reloaded.deleted == hnsw_index.deleted
+        assert not [page_id for page_id in page_ids_of(await reloaded.search(vectors[3], 10)) if page_id.startswith("doc0-")]
+
+    run(scenario())
+
+
+def test_restored_page_is_searchable_again(run, database, unit_vectors):
+    vectors = unit_vectors(20)
+
+    async def scenario():
+        await store_documents(vectors)
+        await sync_generation()
+        await hnsw_index.ensure_loaded()
+        await delete_document(database, "doc1")
+        await sync_generation()
+        assert page_ids_of(await hnsw_index.search(vectors[15], 1)) != ["doc1-p5"]
+        assert len(hnsw_index.deleted) == 10
+
+        await store_documents(vectors[10:], first_document=1)
+        await sync_generation()
+        assert page_ids_of(await hnsw_index.search(vectors[15], 1)) == ["doc1-p5"]
+        assert not hnsw_index.deleted
+
+    run(scenario())
+
+
+def test_sync_catches_up_from_the_log(run, database, unit_vectors, monkeypatch):
+    vectors = unit_vectors(40)
+
+    async def scenario():
+        await store_documents(vectors[:20])
+        await sync_generation()
+        await hnsw_index.ensure_loaded()
+        await hnsw_index.save()
+
+        # After the first sync, neither this index nor one reloaded from its file lists every stored page again
+        async def listed_every_page():
+            raise AssertionError("db_get_vector_page_ids called after the first sync")
+        monkeypatch.setattr(index_hnsw, "db_get_vector_page_ids", listed_every_page)
+        reloaded = HNSWIndex(hnsw_index.path)
+        await reloaded.ensure_loaded()
+
+        await delete_document(database, "doc0")
+        await store_documents(vectors[20:30], first_document=2)
+        await sync_generation()
+        for index in (hnsw_index, reloaded):
+            index.invalidate()
+            results = page_ids_of(await index.search(vectors[3], 20))
+            assert len(results) == 20
+            assert not [page_id for page_id in results if page_id.startswith("doc0-")]
+            assert page_ids_of(await index.search(vectors[25], 1)) == ["doc2-p5"]
+            assert len(index.deleted) == 10
+
+    run(scenario())
+
+
+def test_dimension_mismatch_raises(run, database, unit_vectors, tmp_path):
+    index = HNSWIndex(os.path.join(tmp_path, "index.npz"))
+    vectors = unit_vectors(5)
+    for i, vector in enumerate(vectors):
+        index._insert(f"p{i}", vector)
+
+    with pytest.raises(ValueError):
+        index._insert("other", np.ones(16, dtype=np.float32))
+    assert index.count == 5
+    assert index.vectors.shape[1] == vectors.shape[1]
@@ -0,0 +1,55 @@
+# tests/test_index_ivf.py
+
+from database.index_ivf import build_ivf_index, ivf_index
+from database.index_generation import sync_generation
+from database.vector_index import db_load_vectors, db_get_vector_log_marks
+from database.setters_documents import db_store_pdf_file
+from database.setters_vectors import store_page_vector
+from database.connection_pool import connection_pool
+
+
+
+async def store_document(document_id: str, vectors):
+    await db_store_pdf_file(document_id, document_id, ["page"] * len(vectors), vectors=vectors,
+                            page_ids=[f"{document_id}-p{i}" for i in range(len(vectors))])
+
+
+async def build_index():
+    # The steps of admin/build_ivf_index.py
+    log_marks = await db_get_vector_log_marks()
+    page_ids, matrix = await db_load_vectors()
+    build_ivf_index(page_ids, matrix, log_marks, n_lists=4, iterations=10)
+
+
+def page_ids_of(results: list[dict]) -> list[str]:
+    return [result["page_id"] for result in results]
+
+
+
+def test_pages_changed_since_the_build_are_not_stale(run, database, unit_vectors):
+    vectors = unit_vectors(40)
+
+    async def scenario():
+        await store_document("doc0", vectors[:10])
+        await store_document("doc1", vectors[10:20])
+        await build_index()
+        await sync_generation()
+        assert page_ids_of(await ivf_index.search(vectors[3], 1, nprobe=4)) == ["doc0-p3"]
+
+        # Deleted by another writer: the generation bump must reach the index through invalidate_indexes()
+        async with connection_pool.writer(database) as conn:
+            await conn.execute("DELETE FROM page_images WHERE document_id = ?", ("doc0",))
+        await sync_generation()
+        results = page_ids_of(await ivf_index.search(vectors[3], 10, nprobe=4))
+        assert len(results) == 10
+        assert not [page_id for page_id in results if page_id.startswith("doc0-")]
+
+        # Re-embedded and newly stored pages are scored with their current vector
+        await store_page_vector("doc1", 0, vectors[30], page_id="doc1-p0")
+        await store_document("doc2", vectors[35:40])
+        await sync_generation()
+        assert page_ids_of(await ivf_index.search(vectors[30], 1, nprobe=4)) == ["doc1-p0"]
+        assert page_ids_of(await ivf_index.search(vectors[37], 1, nprobe=4)) == ["doc2-p2"]
+        assert "doc1-p0" not in page_ids_of(await ivf_index.search(vectors[10], 5, nprobe=4))
+
+    run(scenario())
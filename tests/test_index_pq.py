@@ -0,0 +1,69 @@
+# tests/test_index_pq.py
+
+import os
+import numpy as np
+import pytest
+
+from database.index_pq import build_pq_index, pq_index, pq_subvector_count, PQIndex
+from database.index_generation import sync_generation
+from database.vector_index import db_load_vectors, db_get_vector_log_marks
+from database.setters_documents import db_store_pdf_file
+from database.connection_pool import connection_pool
+
+
+
+async def store_document(document_id: str, vectors):
+    await db_store_pdf_file(document_id, document_id, ["page"] * len(vectors), vectors=vectors,
+                            page_ids=[f"{document_id}-p{i}" for i in range(len(vectors))])
+
+
+def page_ids_of(results: list[dict]) -> list[str]:
+    return [result["page_id"] for result in results]
+
+
+
+def test_subvectors_divide_every_matryoshka_size():
+    assert pq_subvector_count(1536, 96) == 96
+    assert pq_subvector_count(768, 96) == 96
+    assert pq_subvector_count(512, 96) == 64
+    assert pq_subvector_count(256, 96) == 64
+
+
+def test_build_lowers_the_subvectors_to_a_divisor(run, database, unit_vectors, tmp_path):
+    path = os.path.join(tmp_path, "index.pq.npz")
+    matrix = unit_vectors(50)[:, :256]
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    build_pq_index([f"p{i}" for i in range(50)], matrix, [0], n_subvectors=96, iterations=2, path=path)
+
+    with np.load(path) as data:
+        assert data["codes"].shape == (50, 64)
+
+
+def test_deleted_pages_are_not_returned(run, database, unit_vectors):
+    vectors = unit_vectors(20)
+
+    async def scenario():
+        await store_document("doc0", vectors[:10])
+        await store_document("doc1", vectors[10:20])
+        log_marks = await db_get_vector_log_marks()
+        page_ids, matrix = await db_load_vectors()
+        build_pq_index(page_ids, matrix, log_marks, iterations=2)
+        await sync_generation()
+
+        async with connection_pool.writer(database) as conn:
+            await conn.execute("DELETE FROM page_images WHERE document_id = ?", ("doc0",))
+        await sync_generation()
+
+        # Without the rerank nothing else would drop the deleted pages
+        for rerank_candidates in (0, 100):
+            results = page_ids_of(await pq_index.search(vectors[3], 10, rerank_candidates))
+            assert len(results) == 10
+            assert not [page_id for page_id in results if page_id.startswith("doc0-")]
+
+        # A file built without marks is refused rather than served stale
+        with np.load(pq_index.path) as data:
+            np.savez(pq_index.path, **{name: data[name] for name in data.files if name != "log_marks"})
+        with pytest.raises(ValueError):
+            await PQIndex().search(vectors[3], 10)
+
+    run(scenario())
@@ -0,0 +1,94 @@
+# tests/test_page_dedup.py
+
+from PIL import Image, ImageDraw
+import io, os
+import numpy as np
+
+import config
+from database.page_dedup import image_hash, page_thumbnail, duplicate_detector, db_find_vector_duplicate
+from database.setters_documents import db_store_pdf_file
+
+
+
+def table_image(values: list[list[str]], image_format: str = "PNG") -> bytes:
+    """A rendered table page: same grid and header whatever the values"""
+    image = Image.new("RGB", (600, 400), "white")
+    draw = ImageDraw.Draw(image)
+    draw.text((20, 15), "Revenue by segment (EUR million)", fill="black")
+    for row in range(len(values) + 1):
+        draw.line((20, 50 + 40 * row, 580, 50 + 40 * row), fill="black", width=2)
+    for col in range(len(values[0]) + 1):
+        draw.line((20 + 140 * col, 50, 20 + 140 * col, 50 + 40 * len(values)), fill="black", width=2)
+    for row, row_values in enumerate(values):
+        for col, value in enumerate(row_values):
+            draw.text((30 + 140 * col, 62 + 40 * row), value, fill="black")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **({"compress_level": 1} if image_format == "PNG" else {}))
+    return buffer.getvalue()
+
+
+def save_page_image(page_id: str, image_bytes: bytes):
+    # Where admin/fill_db.py saves every page image
+    with open(os.path.join(config.PROCESSED_FOLDER, f"{page_id}_full.jpg"), "wb") as f:
+        f.write(image_bytes)
+
+
+TABLE_2023 = [["Segment", "2023", "2022", "Change"], ["Retail", "1,204", "1,150", "4.7%"], ["Wholesale", "873", "910", "-4.1%"]]
+TABLE_2024 = [["Segment", "2024", "2023", "Change"], ["Retail", "1,311", "1,204", "8.9%"], ["Wholesale", "802", "873", "-8.1%"]]
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+
+def test_same_layout_tables_with_different_values_are_both_kept(run, database):
+    first, second = table_image(TABLE_2023), table_image(TABLE_2024)
+    # The difference hash cannot tell them apart, which is why it only shortlists
+    assert hamming(image_hash(first), image_hash(second)) <= 4
+
+    async def scenario():
+        save_page_image("page-2023", first)
+        await duplicate_detector.add("doc0", "page-2023", image_hash(first))
+        return await duplicate_detector.find(image_hash(second), page_thumbnail(second))
+
+    assert run(scenario()) is None
+
+
+def test_recompressed_identical_page_is_linked(run, database):
+    original = table_image(TABLE_2023)
+    # Same render, lossy file: the pixels differ slightly
+    recompressed = table_image(TABLE_2023, "JPEG")
+    assert not np.array_equal(np.asarray(Image.open(io.BytesIO(original))), np.asarray(Image.open(io.BytesIO(recompressed))))
+
+    async def scenario():
+        save_page_image("page-2023", original)
+        await duplicate_detector.add("doc0", "page-2023", image_hash(original))
+        linked = await duplicate_detector.find(image_hash(recompressed), page_thumbnail(recompressed))
+        # A candidate whose image is not saved cannot be confirmed
+        os.remove(os.path.join(config.PROCESSED_FOLDER, "page-2023_full.jpg"))
+        return linked, await duplicate_detector.find(image_hash(recompressed), page_thumbnail(recompressed))
+
+    assert run(scenario()) == ("page-2023", None)
+
+
+def test_vector_match_needs_the_same_page_text(run, database, unit_vectors):
+    vector = unit_vectors(1)[0]
+    noise = unit_vectors(1, seed=1)[0]
+    # Cosine similarity above 0.99: as close as the embeddings of two tables sharing a layout
+    close_vector = (vector + 0.1 * noise) / np.linalg.norm(vector + 0.1 * noise)
+    texts = ["Retail 1,204 1,150 Wholesale 873 910", "Retail 1,311 1,204 Wholesale 802 873", "Retail 1,204 1,150 Wholesale 873 910"]
+
+    async def scenario():
+        await db_store_pdf_file("doc0", "Annual report", texts[1:], vectors=[None, None], page_ids=["p1", "p2"])
+        await db_store_pdf_file("doc1", "Other report", texts[:1], vectors=[vector], page_ids=["q0"])
+        return (
+            await db_find_vector_duplicate(close_vector, "p1"),
+            await db_find_vector_duplicate(close_vector, "p2")
+        )
+
+    different_values, same_values = run(scenario())
+    assert different_values is None
+    # The match is in another document
+    assert same_values["page_id"] == "q0"
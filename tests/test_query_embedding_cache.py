@@ -0,0 +1,45 @@
+# tests/test_query_embedding_cache.py
+
+import config
+import numpy as np
+
+from vectorization.query_embedding_cache import QueryEmbeddingCache
+from database.connection_pool import connection_pool
+
+
+
+def test_puts_are_written_together_on_pooled_connections(run, unit_vectors):
+    vectors = unit_vectors(3)
+
+    async def scenario():
+        cache = QueryEmbeddingCache(config.QUERY_CACHE_PATH, write_delay_ms=60000)
+        for i, vector in enumerate(vectors):
+            await cache.put(f"query {i}", vector)
+        assert len(cache.pending) == 3
+        await cache.flush()
+        assert not cache.pending
+
+        # A second process starts with an empty LRU and reads the embeddings back from disk
+        restarted = QueryEmbeddingCache(config.QUERY_CACHE_PATH)
+        assert np.array_equal(await restarted.get("  QUERY 0 "), vectors[0])
+        opened_connections = len(connection_pool.all_connections)
+        for i, vector in enumerate(vectors[1:], start=1):
+            assert np.array_equal(await restarted.get(f"Query {i}"), vector)
+        assert restarted.disk_hits == 3
+        assert len(connection_pool.all_connections) == opened_connections
+        assert await restarted.get("never asked") is None
+
+    run(scenario())
+
+
+def test_entry_evicted_before_its_write_is_still_found(run, unit_vectors):
+    vectors = unit_vectors(2)
+
+    async def scenario():
+        cache = QueryEmbeddingCache(config.QUERY_CACHE_PATH, capacity=1, write_delay_ms=60000)
+        await cache.put("first", vectors[0])
+        await cache.put("second", vectors[1])
+        assert np.array_equal(await cache.get("first"), vectors[0])
+        assert cache.misses == 0
+
+    run(scenario())
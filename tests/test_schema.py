@@ -0,0 +1,82 @@
+# tests/test_schema.py
+
+import sqlite3, sqlite_vec
+
+from database.schema import ensure_document_progress, DOCUMENT_PROGRESS_COUNTS_SQL
+from database.setters_documents import db_store_pdf_file
+from database.setters_vectors import store_page_vector, db_mark_page_failed
+from database.connection_pool import connection_pool
+
+
+
+async def progress(db_path: str, document_id: str = "doc0") -> tuple[int, int]:
+    async with connection_pool.reader(db_path) as conn:
+        async with conn.execute("SELECT processed_pages, failed_pages FROM documents WHERE document_id = ?", (document_id,)) as cursor:
+            return tuple(await cursor.fetchone())
+
+
+async def recounted(db_path: str, document_id: str = "doc0") -> tuple[int, int]:
+    async with connection_pool.reader(db_path) as conn:
+        async with conn.execute(f"SELECT processed, failed FROM ({DOCUMENT_PROGRESS_COUNTS_SQL}) WHERE document_id = ?", (document_id,)) as cursor:
+            return tuple(await cursor.fetchone())
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.enable_load_extension(True)
+    sqlite_vec.load(conn)
+    conn.enable_load_extension(False)
+    return conn
+
+
+
+def test_counters_follow_vector_inserts_and_deletes(run, database, unit_vectors):
+    vectors = unit_vectors(6)
+
+    async def scenario():
+        page_ids = [f"doc0-p{i}" for i in range(4)]
+        await db_store_pdf_file("doc0", "doc0", ["page"] * 4, vectors=[vectors[0], vectors[1], None, None], page_ids=page_ids)
+        assert await progress(database) == (2, 0)
+
+        # A new vector counts, a rewritten one does not count twice
+        await store_page_vector("doc0", 2, vectors[2], page_id="doc0-p2")
+        await store_page_vector("doc0", 0, vectors[3], page_id="doc0-p0")
+        assert await progress(database) == (3, 0)
+
+        # A failed page stops counting as failed once its vector is stored
+        await db_mark_page_failed("doc0", 3, page_id="doc0-p3")
+        assert await progress(database) == (3, 1)
+        await store_page_vector("doc0", 3, vectors[4], page_id="doc0-p3")
+        assert await progress(database) == (4, 0)
+
+        async with connection_pool.writer(database) as conn:
+            await conn.execute("DELETE FROM page_images WHERE page_id IN ('doc0-p1', 'doc0-p3')")
+        assert await progress(database) == (2, 0)
+        assert await progress(database) == await recounted(database)
+
+        # A page recreated under a deleted page's id counts again with its new vector
+        async with connection_pool.writer(database) as conn:
+            await conn.execute("INSERT INTO page_images (page_id, document_id, page_number, page_text) VALUES ('doc0-p1', 'doc0', 1, 'page')")
+        await store_page_vector("doc0", 1, vectors[5], page_id="doc0-p1")
+        assert await progress(database) == (3, 0)
+        assert await progress(database) == await recounted(database)
+
+    run(scenario())
+
+
+def test_no_trigger_depends_on_sqlite_vec_shadow_tables(database):
+    conn = connect(database)
+    try:
+        # A database migrated from the counters on page_images_vectors_rowids drops them
+        conn.execute("""
+            CREATE TRIGGER count_page_vector_delete AFTER DELETE ON page_images_vectors_rowids
+            BEGIN SELECT 1; END;
+        """)
+        with conn:
+            ensure_document_progress(conn)
+        shadow_triggers = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND (tbl_name LIKE 'page_images_vectors_%' OR sql LIKE '%_rowids%')"
+        ).fetchall()
+        assert shadow_triggers == []
+    finally:
+        conn.close()
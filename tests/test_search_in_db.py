@@ -0,0 +1,20 @@
+# tests/test_search_in_db.py
+
+import pytest
+
+# search_in_db loads the embedding model on import
+pytest.importorskip("sentence_transformers")
+
+from database.search_in_db import reciprocal_rank_fusion
+
+
+
+def test_pages_found_by_both_rankings_come_first():
+    vector_ranking = ["a", "b", "c", "d"]
+    text_ranking = ["c", "e", "a"]
+    assert reciprocal_rank_fusion([vector_ranking, text_ranking], k=60) == ["a", "c", "b", "e", "d"]
+
+
+def test_ties_keep_the_first_ranking_order():
+    assert reciprocal_rank_fusion([["a", "b"], ["b", "a"]], k=60) == ["a", "b"]
+    assert reciprocal_rank_fusion([["x"], ["y"]], k=60) == ["x", "y"]
@@ -0,0 +1,76 @@
+# tests/test_table_cells.py
+
+from database.table_cells import parse_table_cells, replace_cell_value
+from database.getters_cells import find_edit_target
+from database.setters_documents import db_store_pdf_file
+
+
+
+RESULTS_TABLE = r"""
+\begin{table}
+\caption{Accuracy on ImageNet \cite{deng2009}}
+\begin{tabular}{lcc}
+\toprule
+Model & Params & Top-1 \\
+\midrule
+ResNet-50 & 25.6 & 76.3 \\
+ViT-B/16 & 86 & 81.8\% \\
+Ours$^{1}$ & 1,024 & −0.5 \\
+\multicolumn{2}{c}{Mean} & 76.3 \\
+\bottomrule
+\end{tabular}
+\end{table}
+"""
+
+
+def cell_values(latex: str) -> list[tuple[int, int, str]]:
+    return [(cell['row'], cell['col'], cell['raw_value']) for cell in parse_table_cells(latex)]
+
+
+
+def test_parse_table_cells_keeps_only_table_values():
+    # The digits of model names, citations, the column spec, exponents and "Top-1" are not values;
+    # rule-only lines do not count as rows and \multicolumn spans its columns
+    assert cell_values(RESULTS_TABLE) == [
+        (1, 1, "25.6"), (1, 2, "76.3"),
+        (2, 1, "86"), (2, 2, "81.8"),
+        (3, 1, "1,024"), (3, 2, "−0.5"),
+        (4, 2, "76.3"),
+    ]
+    assert [cell['value'] for cell in parse_table_cells(RESULTS_TABLE)][4:6] == [1024.0, -0.5]
+    for cell in parse_table_cells(RESULTS_TABLE):
+        assert RESULTS_TABLE[cell['start']:cell['end']] == cell['raw_value']
+
+
+def test_parse_table_cells_numbers_inside_tokens():
+    latex = r"\begin{tabular}{ll} ViT-B/16 & 1/2 \\ x50 & v2.1 \\ 3 & 16/ \end{tabular}"
+    assert cell_values(latex) == [(2, 0, "3")]
+    assert parse_table_cells("No table, only 76.3") == []
+
+
+def test_replace_cell_value_touches_one_cell():
+    second = [cell for cell in parse_table_cells(RESULTS_TABLE) if cell['row'] == 4][0]
+    edited = replace_cell_value(RESULTS_TABLE, second, "77.0")
+    assert edited.count("76.3") == 1
+    assert "{Mean} & 77.0 \\\\" in edited
+
+    # The cell no longer holds the value it was looked up with
+    assert replace_cell_value(edited, second, "78.0") is None
+
+
+def test_find_edit_target_prefers_the_named_image(run, database):
+    async def scenario():
+        await db_store_pdf_file("doc0", "Paper", ["page"] * 2, latex_code=RESULTS_TABLE, page_ids=["p0", "p1"])
+        await db_store_pdf_file("doc1", "Slides", ["page"], page_ids=["p2"])
+        image_ids = ["p2", "p1", "p0"]
+
+        # The model named p1, which holds the value
+        target = await find_edit_target(image_ids, 1, "76.3")
+        assert (target['page_id'], target['row'], target['col']) == ("p1", 1, 2)
+        # It named p2, which does not: two other images hold the value, the edit cannot be placed
+        assert await find_edit_target(image_ids, 0, "76.3") is None
+        # Only one retrieved image holds it
+        assert (await find_edit_target(["p2", "p0"], 0, "1,024"))['page_id'] == "p0"
+        assert await find_edit_target(image_ids, 1, "99.9") is None
+
+    run(scenario())
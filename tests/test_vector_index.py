@@ -0,0 +1,137 @@
+# tests/test_vector_index.py
+
+import numpy as np
+
+import config
+import database.vector_index as vector_index
+from database.vector_index import MemoryIndex, memory_index, db_load_vectors, db_load_search_vectors, db_get_vector_log_marks
+from database.vector_snapshot import write_snapshot
+from database.index_generation import db_get_generation, sync_generation
+from database.setters_documents import db_store_pdf_file
+from database.setters_vectors import store_page_vector
+from database.connection_pool import connection_pool
+
+
+
+async def store_document(document_id: str, vectors: np.ndarray):
+    await db_store_pdf_file(document_id, document_id, ["page"] * len(vectors), vectors=vectors,
+                            page_ids=[f"{document_id}-p{i}" for i in range(len(vectors))])
+
+
+async def delete_pages(db_path: str, condition: str, parameters: tuple):
+    # Through a plain connection, like another process would do: only the log and the generation bump tell
+    async with connection_pool.writer(db_path) as conn:
+        await conn.execute(f"DELETE FROM page_images WHERE {condition}", parameters)
+
+
+async def export_snapshot():
+    # The steps of admin/export_snapshot.py
+    generation = await db_get_generation()
+    log_marks = await db_get_vector_log_marks()
+    page_ids, matrix = await db_load_vectors()
+    write_snapshot(page_ids, matrix, generation, log_marks, config.VECTOR_SNAPSHOT_PATH)
+
+
+def page_ids_of(results: list[dict]) -> list[str]:
+    return [result["page_id"] for result in results]
+
+
+
+def test_deletes_and_writes_between_refreshes_reach_the_delta(run, database, unit_vectors):
+    vectors = unit_vectors(40)
+
+    async def scenario():
+        await store_document("doc0", vectors[:10])
+        await store_document("doc1", vectors[10:20])
+        assert page_ids_of(await memory_index.search(vectors[3], 1)) == ["doc0-p3"]
+        main_segment = memory_index.page_ids
+
+        # The same number of vectors deleted and written: a count check could not tell anything changed
+        await delete_pages(database, "document_id = ?", ("doc0",))
+        await store_document("doc2", vectors[20:30])
+        await sync_generation()
+
+        results = page_ids_of(await memory_index.search(vectors[3], 20))
+        assert len(results) == 20
+        assert not [page_id for page_id in results if page_id.startswith("doc0-")]
+        assert page_ids_of(await memory_index.search(vectors[25], 1)) == ["doc2-p5"]
+        assert memory_index.page_ids is main_segment
+        assert memory_index.dead == 10
+
+    run(scenario())
+
+
+def test_rewritten_then_deleted_page_disappears(run, database, unit_vectors):
+    vectors = unit_vectors(20)
+
+    async def scenario():
+        await store_document("doc0", vectors[:10])
+        await memory_index.ensure_loaded()
+
+        # Rewritten in one refresh (the new row lands in the delta), deleted in the next
+        await store_page_vector("doc0", 4, vectors[15], page_id="doc0-p4")
+        await sync_generation()
+        assert page_ids_of(await memory_index.search(vectors[15], 1)) == ["doc0-p4"]
+
+        await delete_pages(database, "page_id = ?", ("doc0-p4",))
+        await sync_generation()
+        results = page_ids_of(await memory_index.search(vectors[15], 10))
+        assert len(results) == 9
+        assert "doc0-p4" not in results
+
+        # Written again after the delete, the page comes back
+        await store_document("doc1", vectors[15:16])
+        await sync_generation()
+        assert page_ids_of(await memory_index.search(vectors[15], 1)) == ["doc1-p0"]
+
+    run(scenario())
+
+
+def test_stale_snapshot_is_caught_up_from_the_log(run, database, unit_vectors, monkeypatch):
+    monkeypatch.setattr(vector_index, "USE_VECTOR_SNAPSHOT", True)
+    vectors = unit_vectors(30)
+
+    async def scenario():
+        await store_document("doc0", vectors[:10])
+        await store_document("doc1", vectors[10:20])
+        await export_snapshot()
+        await delete_pages(database, "document_id = ?", ("doc0",))
+        await store_document("doc2", vectors[20:30])
+        await store_page_vector("doc1", 0, vectors[5], page_id="doc1-p0")
+
+        # The snapshot stays the memory-mapped main segment, the changes since go to the delta
+        index = MemoryIndex()
+        await index.ensure_loaded()
+        assert isinstance(index.matrix, np.memmap)
+        assert len(index.page_ids) == 20
+        assert len(index.delta_ids) == 11
+        results = page_ids_of(await index.search(vectors[5], 20))
+        assert results[0] == "doc1-p0"
+        assert len(results) == 20
+        assert not [page_id for page_id in results if page_id.startswith("doc0-")]
+        assert page_ids_of(await index.search(vectors[25], 1)) == ["doc2-p5"]
+
+        # The backends that rebuild in full get the same vectors as one matrix
+        page_ids, matrix = await db_load_search_vectors()
+        assert sorted(page_ids) == sorted(await vector_index.db_get_vector_page_ids())
+        assert np.allclose(matrix[page_ids.index("doc1-p0")], vectors[5], atol=1e-6)
+
+    run(scenario())
+
+
+def test_snapshot_ahead_of_the_database_is_not_used(run, database, unit_vectors, monkeypatch):
+    monkeypatch.setattr(vector_index, "USE_VECTOR_SNAPSHOT", True)
+    vectors = unit_vectors(10)
+
+    async def scenario():
+        await store_document("doc0", vectors)
+        page_ids, matrix = await db_load_vectors()
+        # Taken from another database, further along its log than this one
+        write_snapshot(page_ids, matrix, 0, [mark + 100 for mark in await db_get_vector_log_marks()], config.VECTOR_SNAPSHOT_PATH)
+
+        index = MemoryIndex()
+        await index.ensure_loaded()
+        assert not isinstance(index.matrix, np.memmap)
+        assert len(index.page_ids) == 10
+
+    run(scenario())
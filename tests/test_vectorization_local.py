@@ -0,0 +1,27 @@
+# tests/test_vectorization_local.py
+
+import asyncio, os
+import numpy as np
+import pytest
+
+import config
+
+# vectorization_local loads the embedding model on import
+pytest.importorskip("sentence_transformers")
+if not os.path.isdir(config.VECT_MODEL_LOCAL_PATH):
+    pytest.skip(f"no local model weights in {config.VECT_MODEL_LOCAL_PATH}", allow_module_level=True)
+
+from vectorization.vectorization_local import model, embed_text, truncate_embedding
+
+
+
+def test_query_embedding_uses_no_prompt():
+    texts = ["revenue by region in 2023", "ViT-B/16 top-1 accuracy"]
+    assert model.prompts["query"] == ""
+
+    # What llama_index's HuggingFaceEmbedding returned with its empty query instruction
+    baseline = [truncate_embedding(embedding) for embedding in model.encode(texts, normalize_embeddings=True)]
+    embeddings = asyncio.run(embed_text({"texts": texts}))
+    assert len(embeddings) == len(baseline)
+    for embedding, expected in zip(embeddings, baseline):
+        assert np.allclose(embedding, expected, atol=1e-5)
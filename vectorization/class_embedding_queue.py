@@ -5,7 +5,10 @@ from collections import deque
 from datetime import datetime
 import asyncio, json, time
 
-from database.setters_vectors import store_page_vector
+from config import SEARCH_BACKEND, DEDUP_ENABLED
+from database.setters_vectors import queue_page_vector, db_mark_page_failed
+from database.index_hnsw import hnsw_index
+from database.page_dedup import db_find_vector_duplicate, db_link_duplicate
 from vectorization.vectorization_local import embed_images
 
 
@@ -20,6 +23,7 @@ class EmbeddingQueue:
         self.document_total_pages: Dict[str, int] = {}
         self.failed_pages: Dict[str, List[int]] = {}
         self.document_start_times: Dict[str, float] = {}
+        self.pages_in_flight: Dict[str, int] = {}  # Embedded pages whose vectors are not committed yet
 
         print(f"[{datetime.now()}] Initialized EmbeddingQueue instance")
 
@@ -101,10 +105,8 @@ class EmbeddingQueue:
                 print(f"[{datetime.now()}] Error processing stalled document {doc_id}: {str(e)}")
 
 
-    async def add_image_task(self, document_id: str, document_title: str, image_bytes: bytes, page_number: int, total_pages: int, page_id: Optional[str] = None):
-        """Add a new image embedding task to the queue"""
-        print(f"[{datetime.now()}] Adding new task - Document ID: {document_id}, Page: {page_number+1}/{total_pages}")
-
+    def _track_document(self, document_id: str, total_pages: int):
+        """Start tracking the progress of a document on its first page"""
         if document_id not in self.processed_pages_count:
             self.processed_pages_count[document_id] = 0
             self.document_total_pages[document_id] = total_pages
@@ -112,6 +114,21 @@ class EmbeddingQueue:
             self.document_start_times[document_id] = time.time()
             print(f"[{datetime.now()}] Initialized new document tracking - ID: {document_id}, Total Pages: {total_pages}")
 
+
+    async def skip_page(self, document_id: str, page_number: int, total_pages: int):
+        """Count a page that needs no embedding (a duplicate linked to its canonical page) as processed"""
+        print(f"[{datetime.now()}] Skipping duplicate page - Document ID: {document_id}, Page: {page_number+1}/{total_pages}")
+        self._track_document(document_id, total_pages)
+        self.processed_pages_count[document_id] += 1
+        await self._check_document_completion(document_id)
+
+
+    async def add_image_task(self, document_id: str, document_title: str, image_bytes: bytes, page_number: int, total_pages: int, page_id: Optional[str] = None):
+        """Add a new image embedding task to the queue"""
+        print(f"[{datetime.now()}] Adding new task - Document ID: {document_id}, Page: {page_number+1}/{total_pages}")
+
+        self._track_document(document_id, total_pages)
+
         task = {
             'document_id': document_id,
             'document_title': document_title,
@@ -146,6 +163,7 @@ class EmbeddingQueue:
         print(f"[{datetime.now()}] Starting queue processor")
 
         failed_tasks = []  # Track failed tasks for retry
+        pending_writes = []  # Pages waiting for their batch to be committed
 
         while self.image_queue:
             async with self.lock:
@@ -172,49 +190,29 @@ class EmbeddingQueue:
                 try:
                     print(f"[{datetime.now()}] Calling embed_image API for document {document_id}, page {page_number}")
                     vector = await embed_images(files)  # This has built-in retry logic
-                    
-                    # Store vector in database
-                    await store_page_vector(document_id, page_number, vector, page_id)
-                    
-                    # Update processed page count
-                    self.processed_pages_count[document_id] = self.processed_pages_count.get(document_id, 0) + 1
-                    
-                    # Check if document is complete
-                    await self._check_document_completion(document_id)
-                    
-                    processing_time = time.time() - processing_start
 
-                    print(f"""[{datetime.now()}] Task completed successfully:
-                        - Document ID: {document_id}
-                        - Page: {page_number}
-                        - Processing time: {processing_time:.2f} seconds
-                        - Vector size: {len(vector)}""")
+                    # An identical page already has a vector: link to it instead of storing another one
+                    duplicate = await db_find_vector_duplicate(vector, page_id) if DEDUP_ENABLED and page_id else None
+                    if duplicate:
+                        await db_link_duplicate(document_id, page_id, duplicate['page_id'], duplicate['similarity'])
+                        await self._page_stored(task, vector, processing_start)
+                    else:
+                        # The group-commit writer batches the vector with other pages; keep embedding meanwhile
+                        write = queue_page_vector(document_id, page_number, vector, page_id)
+                        self.pages_in_flight[document_id] = self.pages_in_flight.get(document_id, 0) + 1
+                        pending_writes.append(asyncio.create_task(self._await_page_write(task, write, vector, processing_start, failed_tasks)))
 
                 except Exception as e:
-                    print(f"[{datetime.now()}] Error embedding image for document {document_id}, page {page_number}: {str(e)}")
-                    
-                    # Track this failed page
-                    if document_id in self.failed_pages:
-                        self.failed_pages[document_id].append(page_number)
-                    
-                    # Add to failed tasks queue for later retry if under retry limit
-                    retry_count = task.get('retry_count', 0) + 1
-                    if retry_count <= 3:  # Limit retries to 3 attempts
-                        task['retry_count'] = retry_count
-                        task['last_error'] = str(e)
-                        task['last_attempt'] = time.time()
-                        failed_tasks.append(task)
-                        print(f"[{datetime.now()}] Added to retry queue (attempt {retry_count}/3)")
-                    else:
-                        print(f"[{datetime.now()}] Max retries exceeded for document {document_id}, page {page_number}")
-                        # Check if we should compute document vector despite this failure
-                        await self._check_document_completion(document_id)
+                    await self._page_failed(task, e, failed_tasks)
 
             except Exception as e:
                 print(f"[{datetime.now()}] Error processing task for document {document_id}, page {page_number}: {str(e)}")
             finally:
                 self.current_task = None
 
+        # Pages only count as processed once their vectors are committed
+        await asyncio.gather(*pending_writes)
+
         # Process failed tasks if any
         if failed_tasks:
             print(f"[{datetime.now()}] Processing {len(failed_tasks)} failed tasks after a delay")
@@ -227,10 +225,77 @@ class EmbeddingQueue:
             # Process the queue again
             return await self.process_queue()
             
+        if SEARCH_BACKEND == "hnsw":
+            await hnsw_index.flush()
+
         self.processing = False
         print(f"[{datetime.now()}] Queue processor finished - no more tasks in queue")
 
 
+    async def _page_stored(self, task: Dict[str, Any], vector, processing_start: float):
+        """Count a page whose vector (or duplicate link) is in the database"""
+        document_id = task['document_id']
+
+        # Update processed page count
+        self.processed_pages_count[document_id] = self.processed_pages_count.get(document_id, 0) + 1
+
+        # Check if document is complete
+        await self._check_document_completion(document_id)
+
+        processing_time = time.time() - processing_start
+
+        print(f"""[{datetime.now()}] Task completed successfully:
+            - Document ID: {document_id}
+            - Page: {task['page_number']}
+            - Processing time: {processing_time:.2f} seconds
+            - Vector size: {len(vector)}""")
+
+
+    async def _await_page_write(self, task: Dict[str, Any], write: asyncio.Future, vector, processing_start: float, failed_tasks: List[Dict[str, Any]]):
+        try:
+            try:
+                await write
+            finally:
+                self.pages_in_flight[task['document_id']] -= 1
+                if not self.pages_in_flight[task['document_id']]:
+                    del self.pages_in_flight[task['document_id']]
+
+            # Keep the graph index up to date without a rebuild
+            if SEARCH_BACKEND == "hnsw":
+                await hnsw_index.catch_up()
+
+            await self._page_stored(task, vector, processing_start)
+        except Exception as e:
+            await self._page_failed(task, e, failed_tasks)
+
+
+    async def _page_failed(self, task: Dict[str, Any], e: Exception, failed_tasks: List[Dict[str, Any]]):
+        document_id = task['document_id']
+        page_number = task['page_number']
+        print(f"[{datetime.now()}] Error embedding image for document {document_id}, page {page_number}: {str(e)}")
+
+        # Track this failed page
+        if document_id in self.failed_pages:
+            self.failed_pages[document_id].append(page_number)
+
+        # Add to failed tasks queue for later retry if under retry limit
+        retry_count = task.get('retry_count', 0) + 1
+        if retry_count <= 3:  # Limit retries to 3 attempts
+            task['retry_count'] = retry_count
+            task['last_error'] = str(e)
+            task['last_attempt'] = time.time()
+            failed_tasks.append(task)
+            print(f"[{datetime.now()}] Added to retry queue (attempt {retry_count}/3)")
+        else:
+            print(f"[{datetime.now()}] Max retries exceeded for document {document_id}, page {page_number}")
+            try:
+                await db_mark_page_failed(document_id, page_number, task.get('page_id'))
+            except Exception as mark_error:
+                print(f"[{datetime.now()}] Could not record the failed page: {str(mark_error)}")
+            # Check if we should compute document vector despite this failure
+            await self._check_document_completion(document_id)
+
+
     async def _check_document_completion(self, document_id: str):
         """Check if a document's page processing is complete"""
         if document_id not in self.processed_pages_count or document_id not in self.document_total_pages:
@@ -242,8 +307,8 @@ class EmbeddingQueue:
         # Calculate what percentage of pages are done
         percent_complete = (processed_pages / total_pages) * 100
         
-        # Count pages still in queue for this document
-        pages_in_queue = 0
+        # Count pages still in queue for this document, or waiting for their batch to commit
+        pages_in_queue = self.pages_in_flight.get(document_id, 0)
         for task in self.image_queue:
             if task['document_id'] == document_id:
                 pages_in_queue += 1
@@ -0,0 +1,139 @@
+# vectorization/query_embedding_cache.py
+
+from collections import OrderedDict
+from typing import Optional
+from datetime import datetime
+import unicodedata, hashlib, asyncio
+import numpy as np
+
+from config import QUERY_CACHE_PATH, QUERY_CACHE_SIZE, QUERY_CACHE_WRITE_DELAY_MS, VECT_MODEL_NAME, EMBEDDING_DIM
+from database.quantization import float32_blob
+from database.connection_pool import connection_pool
+
+
+
+def normalize_query(text: str) -> str:
+    """Fold the variations that do not change the meaning of a query: unicode form, case, whitespace"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+
+class QueryEmbeddingCache:
+    """In-memory LRU of query embeddings in front of a SQLite table, keyed by query text and model identity.
+    The table is read through the pooled connections, and new embeddings are written in one transaction
+    `write_delay_ms` after the first of them."""
+
+    def __init__(self, path: str = QUERY_CACHE_PATH, capacity: int = QUERY_CACHE_SIZE, model_id: str = f"{VECT_MODEL_NAME}:{EMBEDDING_DIM}",
+                 write_delay_ms: int = QUERY_CACHE_WRITE_DELAY_MS):
+        self.path = path
+        self.capacity = capacity
+        self.model_id = model_id
+        self.write_delay = write_delay_ms / 1000
+        self.memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.pending: dict[str, memoryview] = {}  # cache_key -> vector blob not written yet
+        self.flush_task: asyncio.Task = None
+        self.table_ready = False
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_id}\n{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+
+
+    async def _ensure_table(self):
+        if self.table_ready:
+            return
+        async with connection_pool.writer(self.path) as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_embeddings (
+                    cache_key TEXT PRIMARY KEY,
+                    model_id TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+        self.table_ready = True
+
+
+    async def get(self, text: str) -> Optional[np.ndarray]:
+        key = self._key(text)
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            return self.memory[key]
+
+        if key in self.pending:
+            # Fell out of the LRU before its write
+            self.memory_hits += 1
+            return np.frombuffer(self.pending[key], dtype=np.float32)
+
+        await self._ensure_table()
+        async with connection_pool.reader(self.path) as conn:
+            async with conn.execute("SELECT vector FROM query_embeddings WHERE cache_key = ?", (key,)) as cursor:
+                row = await cursor.fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.disk_hits += 1
+        # A read-only view over the row's bytes, nothing downstream writes to query vectors
+        vector = np.frombuffer(row[0], dtype=np.float32)
+        self._remember(key, vector)
+        return vector
+
+
+    async def put(self, text: str, vector: np.ndarray):
+        key = self._key(text)
+        self._remember(key, vector)
+        self.pending[key] = float32_blob(vector)
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._flush_later())
+
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.write_delay)
+        try:
+            await self.flush()
+        except Exception as e:
+            # Only the disk copy is lost, the embeddings stay in the LRU
+            print(f"[{datetime.now()}] Failed to write query embeddings to {self.path}: {str(e)}")
+
+
+    async def flush(self):
+        """Write the pending embeddings in one transaction, e.g. before shutting down"""
+        if not self.pending:
+            return
+        rows = [(key, self.model_id, blob) for key, blob in self.pending.items()]
+        self.pending = {}
+
+        await self._ensure_table()
+        async with connection_pool.writer(self.path) as conn:
+            await conn.executemany(
+                "INSERT OR REPLACE INTO query_embeddings (cache_key, model_id, vector) VALUES (?, ?, ?)",
+                rows
+            )
+
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "memory_size": len(self.memory)
+        }
+
+
+
+query_embedding_cache = QueryEmbeddingCache()
@@ -1,11 +1,11 @@
 # vectorization\vectorization_local.py
 
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from sentence_transformers import SentenceTransformer
 from PIL import Image
 import numpy as np
 import torch, io
 
-from config import VECT_MODEL_LOCAL_PATH
+from config import VECT_MODEL_LOCAL_PATH, EMBEDDING_DIM
 
 
 
@@ -25,30 +25,37 @@ else:
     print("MPS and CUDA not available. Using CPU.")
 
 print(f"Loading model: {VECT_MODEL_LOCAL_PATH}")
-model = HuggingFaceEmbedding(
-    model_name=VECT_MODEL_LOCAL_PATH,
+# The SentenceTransformer that llama_index's HuggingFaceEmbedding wraps, used directly for its public batched encode.
+# Empty prompts as HuggingFaceEmbedding passed them: they replace any the model config defines, so query vectors
+# stay comparable with the stored page vectors
+model = SentenceTransformer(
+    VECT_MODEL_LOCAL_PATH,
     device=DEVICE,
+    prompts={"query": "", "text": ""},
     trust_remote_code=True,
     local_files_only=True
 )
 
 
 
+def truncate_embedding(embedding, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Keep the first `dim` values of a Matryoshka embedding and re-normalize them"""
+    prefix = np.asarray(embedding, dtype=np.float32)[:dim]
+    norm = np.linalg.norm(prefix)
+    return prefix / norm if norm > 0 else prefix
+
+
+
 async def embed_text(request: dict):
     try:
-        embeddings = []
-        
-        for text in request["texts"]:
+        texts = request["texts"]
+        for text in texts:
             print(f"Processing user query: {text}\n")
-            
-            query_embedding = model.get_query_embedding(text)
-            
-            if isinstance(query_embedding, np.ndarray):
-                query_embedding = query_embedding.tolist()
-            
-            embeddings.append(query_embedding)
 
-        return embeddings
+        # One batched forward pass with the (empty) query prompt
+        query_embeddings = model.encode(texts, prompt_name="query", normalize_embeddings=True)
+
+        return [truncate_embedding(query_embedding) for query_embedding in query_embeddings]
 
     except Exception as e:
         import traceback
@@ -67,10 +74,8 @@ async def embed_images(files: dict):
         image = Image.open(io.BytesIO(image_bytes))
         print(f"Processing image of size: {image.size}")
         
-        image_embedding = model.get_image_embedding(image)
-        
-        if isinstance(image_embedding, np.ndarray):
-            image_embedding = image_embedding.tolist()
+        image_embedding = model.encode([image], normalize_embeddings=True)[0]
+        image_embedding = truncate_embedding(image_embedding)
         
         return image_embedding
 